@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-from flask import Flask, render_template, redirect, url_for, flash, request, send_from_directory
+from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, abort
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
@@ -9,23 +9,38 @@ from datetime import datetime, timedelta
 import pytz
 from tzlocal import get_localzone
 from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
-from apscheduler.triggers.date import DateTrigger
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 import subprocess
 import shutil
 import time
 import json
 import uuid
 from feedgen.feed import FeedGenerator
+from feedgen.ext.base import BaseEntryExtension
 import requests
+import click
+from sqlalchemy import func
 
 # Initialize timezone from environment variable
 time.tzset()
 
-from models import db, User, RadioStation, Recording, RecurringRecording, Podcast, PodcastEpisode, AppSettings
-from forms import LoginForm, UserProfileForm, RadioStationForm, RecordingForm, RecurringRecordingForm, PodcastForm, SettingsForm
+from models import db, User, RadioStation, Recording, RecurringRecording, Podcast, PodcastEpisode, AppSettings, Clip, PostProcessStep, MediaMetadata, recurring_recording_instance
+from forms import LoginForm, UserProfileForm, RadioStationForm, RecordingForm, RecurringRecordingForm, PodcastForm, SettingsForm, TimeshiftForm, ClipForm
 from config import Config
-from utils.recorder import start_recording, resume_recording, check_active_recordings
+from utils.recorder import start_recording, resume_recording, check_active_recordings, admission_controller, format_recording_name, cancel_preroll, hand_over_recordings
+from utils.postprocess import post_processor, submit_post_processing, TIMESHIFT_STEPS
+from utils.scheduling import build_recording_trigger, build_recurring_trigger, get_next_start
+from utils.prober import probe_all_stations, get_latest_probes
+from utils.timeshift import timeshift_manager, read_ring_contents, sync_timeshift
+from utils.clips import parse_offset, format_offset, request_clip, submit_clip, resume_clips, delete_clip_files, prune_clips
+from utils.db import get_pool_stats, get_request_statement_count, reset_request_statement_count
+from utils.schema import run_migrations, check_query_plans
+from utils.pagination import KeysetPage
+from utils.feeds import feed_cache, make_feed, get_archive_page_count, ArchiveExtension
+from utils.downloads import send_media_file
+from utils.files import reconcile_files
+from utils.leader import scheduler_leader, run_on_leader
+from utils.metadata import metadata_join
 from utils.notifications import send_notification
 from utils.storage import save_to_additional_locations
 
@@ -61,9 +76,13 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
-# Initialize scheduler
-scheduler = BackgroundScheduler()
-scheduler.start()
+# Initialize scheduler. Jobs are kept in the database, so every worker sees
+# the same schedule; it starts paused, and only the scheduler leader runs them
+scheduler = BackgroundScheduler(
+    jobstores={'default': SQLAlchemyJobStore(engine=db.get_engine(app))},
+    job_defaults={'coalesce': True, 'misfire_grace_time': app.config['SCHEDULER_MISFIRE_GRACE_TIME']}
+)
+scheduler.start(paused=True)
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -73,6 +92,8 @@ def load_user(user_id):
 def inject_now():
     return {'now': datetime.now()}
 
+app.add_template_filter(format_offset, 'offset')
+
 @app.route('/')
 def index():
     server_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -126,7 +147,10 @@ def profile():
 @login_required
 def stations():
     stations = RadioStation.query.all()
-    return render_template('stations.html', stations=stations)
+    
+    # Health comes from the background prober, not from probing now
+    health = get_latest_probes(db.session)
+    return render_template('stations.html', stations=stations, health=health)
 
 @app.route('/stations/add', methods=['GET', 'POST'])
 @login_required
@@ -136,10 +160,13 @@ def add_station():
         station = RadioStation(
             name=form.name.data,
             url=form.url.data,
-            description=form.description.data
+            description=form.description.data,
+            continuous_capture=form.continuous_capture.data,
+            timeshift_hours=form.timeshift_hours.data or app.config['TIMESHIFT_DEFAULT_HOURS']
         )
         db.session.add(station)
         db.session.commit()
+        run_on_leader(sync_timeshift, job_id='sync_timeshift')
         flash(f'Radio station {form.name.data} has been added.')
         return redirect(url_for('stations'))
     return render_template('station_form.html', form=form, title='Add Radio Station')
@@ -153,7 +180,10 @@ def edit_station(id):
         station.name = form.name.data
         station.url = form.url.data
         station.description = form.description.data
+        station.continuous_capture = form.continuous_capture.data
+        station.timeshift_hours = form.timeshift_hours.data or app.config['TIMESHIFT_DEFAULT_HOURS']
         db.session.commit()
+        run_on_leader(sync_timeshift, job_id='sync_timeshift')
         flash(f'Radio station {station.name} has been updated.')
         return redirect(url_for('stations'))
     return render_template('station_form.html', form=form, title='Edit Radio Station')
@@ -164,9 +194,56 @@ def delete_station(id):
     station = RadioStation.query.get_or_404(id)
     db.session.delete(station)
     db.session.commit()
+    run_on_leader(sync_timeshift, job_id='sync_timeshift')
     flash(f'Radio station {station.name} has been deleted.')
     return redirect(url_for('stations'))
 
+@app.route('/stations/<int:id>/timeshift', methods=['GET', 'POST'])
+@login_required
+def timeshift(id):
+    station = RadioStation.query.get_or_404(id)
+    if not station.continuous_capture:
+        flash(f'Continuous capture is not running for {station.name}.', 'warning')
+        return redirect(url_for('stations'))
+    
+    # The ring runs in the scheduler leader; its files show what it holds
+    contents = read_ring_contents(station.id)
+    available = contents[:2] if contents else None
+    form = TimeshiftForm()
+    if request.method == 'GET' and available:
+        form.start_time.data = max(available[0], datetime.now() - timedelta(hours=1))
+        form.duration.data = 60
+    
+    if form.validate_on_submit():
+        start_time = form.start_time.data
+        end_time = start_time + timedelta(minutes=form.duration.data)
+        if not available or start_time < available[0] or end_time > available[1]:
+            flash('That time is not in the timeshift buffer.', 'danger')
+            return render_template('timeshift.html', form=form, station=station, available=available)
+        
+        # Saved as the ring stores it, so nothing is re-encoded
+        audio_format = contents[2]
+        file_name = format_recording_name(form.name.data, audio_format)
+        recording = Recording(
+            name=form.name.data,
+            station_id=station.id,
+            start_time=start_time,
+            duration=form.duration.data,
+            file_name=file_name,
+            local_path=os.path.join(app.config['RECORDINGS_DIR'], file_name),
+            format=audio_format,
+            status='processing'
+        )
+        db.session.add(recording)
+        post_processor.enqueue(db.session, recording, TIMESHIFT_STEPS)
+        db.session.commit()
+        run_on_leader(submit_post_processing, recording.id, job_id=f'postprocess_{recording.id}')
+        
+        flash(f'Recording {recording.name} is being saved from the timeshift buffer.')
+        return redirect(url_for('recordings'))
+    
+    return render_template('timeshift.html', form=form, station=station, available=available)
+
 @app.route('/recordings')
 @login_required
 def recordings():
@@ -174,29 +251,86 @@ def recordings():
     sort_by = request.args.get('sort', 'start_time')  # Default sort by start_time
     sort_dir = request.args.get('dir', 'desc')  # Default direction is descending
     
-    # Define allowed sort fields to prevent SQL injection
+    # Define allowed sort fields to prevent SQL injection, with the result
+    # column each one is read back from
     allowed_sort_fields = {
-        'name': Recording.name,
-        'station': RadioStation.name,
-        'start_time': Recording.start_time,
-        'duration': Recording.duration,
-        'status': Recording.status
+        'name': (Recording.name, 'name'),
+        'station': (RadioStation.name, 'station_name'),
+        'start_time': (Recording.start_time, 'start_time'),
+        'duration': (Recording.duration, 'duration'),
+        'status': (Recording.status, 'status')
     }
     
     # Use the requested sort field if valid, otherwise default to start_time
-    sort_field = allowed_sort_fields.get(sort_by, Recording.start_time)
+    if sort_by not in allowed_sort_fields:
+        sort_by = 'start_time'
+    sort_field, sort_key = allowed_sort_fields[sort_by]
     
-    # Apply sort direction
-    if sort_dir == 'asc':
-        sort_field = sort_field.asc()
-    else:
-        sort_field = sort_field.desc()
+    # Select only the columns the list shows
+    query = db.session.query(
+        Recording.id,
+        Recording.name,
+        Recording.start_time,
+        Recording.duration,
+        Recording.status,
+        Recording.file_size,
+        Recording.file_missing,
+        MediaMetadata.duration.label('measured_duration'),
+        RadioStation.name.label('station_name')
+    ).join(RadioStation, Recording.station_id == RadioStation.id).outerjoin(
+        MediaMetadata, metadata_join(Recording.local_path, Recording.file_size, Recording.file_mtime)
+    )
+    
+    # Filters
+    filters = {
+        'status': request.args.get('status', ''),
+        'station_id': request.args.get('station_id', type=int),
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', '')
+    }
+    if filters['status']:
+        query = query.filter(Recording.status == filters['status'])
+    if filters['station_id']:
+        query = query.filter(Recording.station_id == filters['station_id'])
+    try:
+        if filters['date_from']:
+            query = query.filter(Recording.start_time >= datetime.strptime(filters['date_from'], '%Y-%m-%d'))
+        if filters['date_to']:
+            query = query.filter(Recording.start_time < datetime.strptime(filters['date_to'], '%Y-%m-%d') + timedelta(days=1))
+    except ValueError:
+        flash('Dates must be given as YYYY-MM-DD.', 'warning')
+    
+    page = KeysetPage(
+        query,
+        sort_field,
+        Recording.id,
+        sort_key,
+        descending=sort_dir != 'asc',
+        per_page=app.config['RECORDINGS_PER_PAGE'],
+        after=request.args.get('after'),
+        before=request.args.get('before')
+    )
     
-    # Query with sorting and join station for station name sorting
-    recordings = Recording.query.join(RadioStation).order_by(sort_field).all()
+    # Post-processing steps and clip counts for the rows on this page only
+    recording_ids = [recording.id for recording in page.items]
+    steps = {}
+    clip_counts = {}
+    if recording_ids:
+        for step in PostProcessStep.query.filter(PostProcessStep.recording_id.in_(recording_ids)).order_by(PostProcessStep.id):
+            steps.setdefault(step.recording_id, []).append(step)
+        clip_counts = dict(db.session.query(Clip.recording_id, func.count(Clip.id))
+                           .filter(Clip.recording_id.in_(recording_ids))
+                           .group_by(Clip.recording_id))
     
     return render_template('recordings.html', 
-                          recordings=recordings, 
+                          recordings=page.items, 
+                          page=page,
+                          steps=steps,
+                          clip_counts=clip_counts,
+                          filters={key: value for key, value in filters.items() if value},
+                          stations=db.session.query(RadioStation.id, RadioStation.name).order_by(RadioStation.name).all(),
+                          statuses=['scheduled', 'queued', 'recording', 'interrupted', 'processing',
+                                    'completed', 'partial', 'stopped', 'failed', 'rejected'],
                           current_sort=sort_by, 
                           current_dir=sort_dir)
 
@@ -263,7 +397,7 @@ def add_recording():
         db.session.commit()
         
         # Schedule the recording
-        trigger = DateTrigger(run_date=form.start_time.data)
+        trigger = build_recording_trigger(form.start_time.data)
         scheduler.add_job(
             start_recording,
             trigger=trigger,
@@ -273,6 +407,11 @@ def add_recording():
         )
         
         flash(f'Recording {form.name.data} has been scheduled.')
+        
+        # Warn if the time slot is already fully booked
+        warning = admission_controller.check_schedule(db.session, f'recording_{recording.id}')
+        if warning:
+            flash(f'Warning: {warning}', 'warning')
         return redirect(url_for('recordings'))
     else:
         # Log validation errors
@@ -295,28 +434,122 @@ def delete_recording(id):
     except:
         pass
     
-    # Delete the file if it exists
+    # Don't launch a capture that is warming up; one in another worker
+    # finds the recording gone when its pre-roll ends
+    cancel_preroll(recording.id)
+    
+    # Delete the file if it exists; the reconciler keeps the path current
     if recording.local_path:
-        # Check for file with any supported extension
-        base_path = os.path.splitext(recording.local_path)[0]
-        supported_formats = ['mp3', 'ogg', 'aac', 'flac', 'wav']
-        
-        for fmt in supported_formats:
-            file_path = f"{base_path}.{fmt}"
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                break
+        try:
+            os.remove(recording.local_path)
+        except FileNotFoundError:
+            pass
+    
+    # Delete partial files left by interrupted captures
+    for part in recording.parts:
+        if os.path.exists(part.file_path):
+            os.remove(part.file_path)
+    delete_clip_files(recording)
     
     db.session.delete(recording)
     db.session.commit()
     flash(f'Recording {recording.name} has been deleted.')
     return redirect(url_for('recordings'))
 
+@app.route('/recordings/<int:id>/clips', methods=['GET', 'POST'])
+@login_required
+def recording_clips(id):
+    recording = Recording.query.get_or_404(id)
+    form = ClipForm()
+    length = recording.recorded_duration or recording.duration * 60
+    
+    if form.validate_on_submit():
+        start = parse_offset(form.start.data)
+        end = min(parse_offset(form.end.data), length)
+        if start >= length:
+            flash(f'The recording is only {format_offset(length)} long.', 'danger')
+            return render_template('clips.html', form=form, recording=recording, length=length)
+        
+        clip = request_clip(db.session, recording, start, end)
+        db.session.commit()
+        if clip.status == 'pending':
+            submit_clip(clip.id)
+            flash(f'Clip {format_offset(start)} - {format_offset(end)} is being cut.')
+        else:
+            flash(f'Clip {format_offset(start)} - {format_offset(end)} already exists.')
+        return redirect(url_for('recording_clips', id=recording.id))
+    
+    return render_template('clips.html', form=form, recording=recording, length=length)
+
+@app.route('/download/clip/<int:id>')
+def download_clip(id):
+    clip = Clip.query.get_or_404(id)
+    if clip.status != 'ready' or not os.path.exists(clip.file_path):
+        flash('This clip is not available.', 'warning')
+        return redirect(url_for('recording_clips', id=clip.recording_id))
+    
+    clip.last_accessed = datetime.utcnow()
+    db.session.commit()
+    
+    # Name the download after the recording and the clip's offsets
+    base_name = os.path.splitext(os.path.basename(clip.recording.local_path))[0]
+    ext = os.path.splitext(clip.file_path)[1]
+    download_name = f"{base_name}-{format_offset(clip.start_offset).replace(':', '')}-{format_offset(clip.end_offset).replace(':', '')}{ext}"
+    
+    mime_types = {
+        '.mp3': 'audio/mpeg',
+        '.ogg': 'audio/ogg',
+        '.aac': 'audio/aac',
+        '.flac': 'audio/flac',
+        '.wav': 'audio/wav'
+    }
+    return send_media_file(clip.file_path, mime_types.get(ext.lower(), 'audio/mpeg'), download_name)
+
 @app.route('/recurring')
 @login_required
 def recurring_recordings():
-    recordings = RecurringRecording.query.all()
-    return render_template('recurring_recordings.html', recordings=recordings)
+    # Runs and last run per recurring recording, and episodes per podcast,
+    # are aggregated in SQL so the page costs one query however many rows it has
+    instances = recurring_recording_instance
+    runs = db.session.query(
+        instances.c.recurring_id,
+        func.count().label('runs'),
+        func.max(Recording.start_time).label('last_start')
+    ).join(Recording, Recording.id == instances.c.recording_id).group_by(instances.c.recurring_id).subquery()
+    
+    last_status = db.session.query(Recording.status).join(
+        instances, instances.c.recording_id == Recording.id
+    ).filter(
+        instances.c.recurring_id == RecurringRecording.id
+    ).order_by(Recording.start_time.desc(), Recording.id.desc()).limit(1).correlate(RecurringRecording).scalar_subquery()
+    
+    episodes = db.session.query(
+        PodcastEpisode.podcast_id,
+        func.count().label('episodes')
+    ).group_by(PodcastEpisode.podcast_id).subquery()
+    
+    recordings = db.session.query(
+        RecurringRecording,
+        RadioStation.name.label('station_name'),
+        func.coalesce(runs.c.runs, 0).label('runs'),
+        runs.c.last_start,
+        last_status.label('last_status'),
+        Podcast.id.label('podcast_id'),
+        func.coalesce(episodes.c.episodes, 0).label('episodes')
+    ).join(
+        RadioStation, RadioStation.id == RecurringRecording.station_id
+    ).outerjoin(
+        runs, runs.c.recurring_id == RecurringRecording.id
+    ).outerjoin(
+        Podcast, Podcast.recurring_recording_id == RecurringRecording.id
+    ).outerjoin(
+        episodes, episodes.c.podcast_id == Podcast.id
+    ).order_by(RecurringRecording.id).all()
+    
+    # Next start times come from the scheduler, not the database
+    next_starts = {job.id: get_next_start(job) for job in scheduler.get_jobs()}
+    
+    return render_template('recurring_recordings.html', recordings=recordings, next_starts=next_starts)
 
 @app.route('/recurring/add', methods=['GET', 'POST'])
 @login_required
@@ -392,55 +625,19 @@ def add_recurring_recording():
         
         # Set the format for the recurring recording
         recurring.format = audio_format
+        
+        # Monthly recordings keep their day of the month in days_of_week
+        if recurring.schedule_type == 'monthly':
+            recurring.days_of_week = request.form.get('days_of_month', '1')
         db.session.commit()
         
         # Schedule the recurring recording
-        if recurring.schedule_type == 'daily':
-            trigger = CronTrigger(
-                hour=recurring.start_time.hour,
-                minute=recurring.start_time.minute
-            )
-        elif recurring.schedule_type == 'weekly':
-            days = recurring.days_of_week.split(',') if ',' in recurring.days_of_week else [recurring.days_of_week]
-            trigger = CronTrigger(
-                day_of_week=','.join(days),
-                hour=recurring.start_time.hour,
-                minute=recurring.start_time.minute
-            )
-        elif recurring.schedule_type == 'weekends':
-            trigger = CronTrigger(
-                day_of_week='sat,sun',
-                hour=recurring.start_time.hour,
-                minute=recurring.start_time.minute
-            )
-        elif recurring.schedule_type == 'weekdays':
-            trigger = CronTrigger(
-                day_of_week='mon,tue,wed,thu,fri',
-                hour=recurring.start_time.hour,
-                minute=recurring.start_time.minute
-            )
-        elif recurring.schedule_type == 'monthly':
-            # Handle monthly schedule with day of month
-            day_of_month = request.form.get('days_of_month', '1')
-            if day_of_month == 'last':
-                # For last day of month, use day='last'
-                trigger = CronTrigger(
-                    day='last',
-                    hour=recurring.start_time.hour,
-                    minute=recurring.start_time.minute
-                )
-            else:
-                trigger = CronTrigger(
-                    day=day_of_month,
-                    hour=recurring.start_time.hour,
-                    minute=recurring.start_time.minute
-                )
-        else:
-            # Default fallback to daily if something goes wrong
-            trigger = CronTrigger(
-                hour=recurring.start_time.hour,
-                minute=recurring.start_time.minute
-            )
+        try:
+            trigger = build_recurring_trigger(recurring)
+        except ValueError as e:
+            app.logger.error(str(e))
+            flash(f'Recurring recording {form.name.data} could not be scheduled: {str(e)}', 'danger')
+            return redirect(url_for('recurring_recordings'))
         
         scheduler.add_job(
             start_recording,
@@ -451,6 +648,11 @@ def add_recurring_recording():
         )
         
         flash(f'Recurring recording {form.name.data} has been scheduled.')
+        
+        # Warn if any of the next time slots are already fully booked
+        warning = admission_controller.check_schedule(db.session, f'recurring_{recurring.id}')
+        if warning:
+            flash(f'Warning: {warning}', 'warning')
         return redirect(url_for('recurring_recordings'))
     
     return render_template('recurring_form.html', form=form, title='Schedule Recurring Recording')
@@ -482,13 +684,27 @@ def delete_recurring_recording(id):
 
 @app.route('/podcasts')
 def podcasts():
-    podcasts = Podcast.query.all()
+    episodes = db.session.query(
+        PodcastEpisode.podcast_id,
+        func.count().label('episodes'),
+        func.max(PodcastEpisode.publication_date).label('latest')
+    ).group_by(PodcastEpisode.podcast_id).subquery()
+    
+    podcasts = db.session.query(
+        Podcast,
+        func.coalesce(episodes.c.episodes, 0).label('episodes'),
+        episodes.c.latest
+    ).outerjoin(episodes, episodes.c.podcast_id == Podcast.id).order_by(Podcast.id).all()
     return render_template('podcasts.html', podcasts=podcasts)
 
 @app.route('/podcasts/<int:id>')
 def podcast_details(id):
     podcast = Podcast.query.get_or_404(id)
-    episodes = PodcastEpisode.query.filter_by(podcast_id=podcast.id).order_by(PodcastEpisode.publication_date.desc()).all()
+    episodes = db.session.query(PodcastEpisode, MediaMetadata).filter(
+        PodcastEpisode.podcast_id == podcast.id
+    ).outerjoin(
+        MediaMetadata, metadata_join(PodcastEpisode.file_path, PodcastEpisode.file_size, PodcastEpisode.file_mtime)
+    ).order_by(PodcastEpisode.publication_date.desc()).all()
     return render_template('podcast_details.html', podcast=podcast, episodes=episodes)
 
 @app.route('/podcasts/edit/<int:id>', methods=['GET', 'POST'])
@@ -523,12 +739,100 @@ def edit_podcast(id):
 
 @app.route('/podcasts/feed/<int:id>')
 def podcast_feed(id):
+    feed = get_podcast_feed(id)
+    return feed_response(feed, app.config['FEED_MAX_AGE'])
+
+@app.route('/podcasts/feed/<int:id>/archive/<int:page>')
+def podcast_feed_archive(id, page):
+    feed = get_podcast_feed(id, page)
+    return feed_response(feed, app.config['FEED_ARCHIVE_MAX_AGE'])
+
+def get_feed_host_url():
+    """
+    The scheme and host podcast feeds link to, or None if only the request's
+    Host header gives one.
+    """
+    if app.config['FEED_BASE_URL']:
+        return app.config['FEED_BASE_URL'].rstrip('/')
+    if app.config.get('SERVER_NAME'):
+        return f"{app.config['PREFERRED_URL_SCHEME']}://{app.config['SERVER_NAME']}"
+    return None
+
+def get_podcast_feed(id, page=None):
+    """Get a podcast's feed, rendering it unless a cached copy is current."""
+    host_url = get_feed_host_url()
+    if host_url is None:
+        # Links built from a client's Host header must not be served to others
+        return make_feed(build_podcast_feed(id, request.host_url.rstrip('/'), page))
+    
+    # Cached feeds are served without touching the database
+    feed = feed_cache.get(id, page)
+    if feed is None:
+        generation = feed_cache.generation(id)
+        feed = feed_cache.store(id, build_podcast_feed(id, host_url, page), generation, page)
+    return feed
+
+def feed_response(feed, max_age):
+    """Serve a cached feed, compressed if the client accepts it, honouring conditional requests."""
+    gzipped = request.accept_encodings['gzip'] > 0
+    response = app.response_class(
+        response=feed.gzipped if gzipped else feed.body,
+        status=200,
+        mimetype='application/rss+xml'
+    )
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    
+    # Each encoding has its own strong ETag
+    response.set_etag(f'{feed.etag}-gz' if gzipped else feed.etag)
+    response.last_modified = feed.last_modified
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
+
+def build_podcast_feed(id, host_url, page=None):
+    """
+    Render a podcast's RSS feed.
+    
+    The main feed holds the newest episodes; older ones are split into
+    archive pages of FEED_PAGE_SIZE episodes (RFC 5005). Pages are filled
+    in the order episodes were added, so new episodes never change a
+    complete page; editing or deleting its own episodes does.
+    
+    Args:
+        id (int): The podcast's ID
+        host_url (str): Scheme and host the feed's links start with
+        page (int, optional): Archive page number, oldest first, or None
+            for the main feed
+    
+    Returns:
+        bytes: The feed document
+    """
     podcast = Podcast.query.get_or_404(id)
     
+    def external_url(endpoint, **values):
+        return host_url + url_for(endpoint, **values)
+    
+    page_size = app.config['FEED_PAGE_SIZE']
+    episode_query = PodcastEpisode.query.filter_by(podcast_id=podcast.id)
+    archive_pages = get_archive_page_count(episode_query.count(), page_size)
+    if page is not None and not 1 <= page <= archive_pages:
+        abort(404)
+    
     fg = FeedGenerator()
     fg.load_extension('podcast')
+    fg.register_extension('archive', ArchiveExtension, BaseEntryExtension, atom=False)
+    if page is None:
+        if archive_pages:
+            fg.archive.link('prev-archive', external_url('podcast_feed_archive', id=id, page=archive_pages))
+    else:
+        fg.archive.archive()
+        fg.archive.link('current', external_url('podcast_feed', id=id))
+        if page > 1:
+            fg.archive.link('prev-archive', external_url('podcast_feed_archive', id=id, page=page - 1))
     fg.title(podcast.title)
-    fg.link(href=request.url_root, rel='self')
+    fg.link(href=external_url('index'), rel='self')
     fg.description(podcast.description)
     fg.language(podcast.language)
     fg.author({'name': podcast.author})
@@ -542,19 +846,29 @@ def podcast_feed(id):
     if podcast.image_path and os.path.exists(podcast.image_path):
         # Extract just the filename from the path and use it directly
         image_filename = os.path.basename(podcast.image_path)
-        image_url = url_for('static', filename=f'images/{image_filename}', _external=True)
+        image_url = external_url('static', filename=f'images/{image_filename}')
         fg.image(url=image_url)
         fg.podcast.itunes_image(image_url)
     
     # Import tzlocal at the top of the file if not already imported
     from tzlocal import get_localzone
     
-    episodes = PodcastEpisode.query.filter_by(podcast_id=podcast.id).order_by(PodcastEpisode.publication_date.desc()).all()
+    # Page by ID, in the order episodes were added, so a late episode with an
+    # earlier date can't push others into a complete page
+    # Durations come from the stored probe of each episode's file
+    episode_query = episode_query.outerjoin(
+        MediaMetadata, metadata_join(PodcastEpisode.file_path, PodcastEpisode.file_size, PodcastEpisode.file_mtime)
+    ).add_columns(MediaMetadata.duration).order_by(PodcastEpisode.id)
+    if page is None:
+        episodes = episode_query.offset(archive_pages * page_size).all()
+    else:
+        episodes = episode_query.offset((page - 1) * page_size).limit(page_size).all()
+    episodes.sort(key=lambda row: row[0].publication_date, reverse=True)
     
     # Get local timezone
     local_timezone = get_localzone()
     
-    for episode in episodes:
+    for episode, measured_duration in episodes:
         fe = fg.add_entry()
         fe.id(str(episode.id))  # This is the GUID
         fe.title(episode.title)
@@ -564,7 +878,7 @@ def podcast_feed(id):
         aware_datetime = episode.publication_date.replace(tzinfo=local_timezone)
         fe.pubdate(aware_datetime)
         
-        file_url = url_for('download_episode', id=episode.id, _external=True)
+        file_url = external_url('download_episode', id=episode.id)
         
         # Determine the MIME type based on the file extension
         mime_types = {
@@ -583,37 +897,20 @@ def podcast_feed(id):
         fe.enclosure(file_url, str(episode.file_size), mimetype)
         
         # Add iTunes specific episode tags
-        if episode.duration:
-            fe.podcast.itunes_duration(str(episode.duration))
+        duration = int(measured_duration) if measured_duration else episode.duration
+        if duration:
+            fe.podcast.itunes_duration(str(duration))
     
-    # Set the correct XML declaration and namespaces
-    response = app.response_class(
-        response=fg.rss_str(),
-        status=200,
-        mimetype='application/rss+xml'
-    )
-    return response
+    return fg.rss_str()
 
 @app.route('/download/<int:id>')
 def download_recording(id):
     recording = Recording.query.get_or_404(id)
     
-    # Get the base path and file name
-    base_path = os.path.dirname(recording.local_path)
-    file_name = os.path.basename(recording.local_path)
-    
-    # Define supported formats to check
-    supported_formats = ['mp3', 'ogg', 'aac', 'flac', 'wav']
-    
-    # Check if the file exists
-    if not os.path.exists(recording.local_path):
-        # Try to find the file with any supported extension
-        base_name = os.path.splitext(file_name)[0]
-        for fmt in supported_formats:
-            test_file = f"{base_name}.{fmt}"
-            if os.path.exists(os.path.join(base_path, test_file)):
-                file_name = test_file
-                break
+    # The stored path is kept current by the file reconciler, so the
+    # download costs at most one stat
+    if not recording.local_path or recording.file_missing:
+        abort(404)
     
     # Get the MIME type based on the file extension
     mime_types = {
@@ -625,31 +922,19 @@ def download_recording(id):
     }
     
     # Get the file extension
-    ext = os.path.splitext(file_name)[1].lower().lstrip('.')
+    ext = os.path.splitext(recording.local_path)[1].lower().lstrip('.')
     mimetype = mime_types.get(ext, 'audio/mpeg')
     
-    return send_from_directory(base_path, file_name, as_attachment=True, mimetype=mimetype)
+    return send_media_file(recording.local_path, mimetype)
 
 @app.route('/download/episode/<int:id>')
 def download_episode(id):
     episode = PodcastEpisode.query.get_or_404(id)
     
-    # Get the base path and file name
-    base_path = os.path.dirname(episode.file_path)
-    file_name = os.path.basename(episode.file_path)
-    
-    # Define supported formats to check
-    supported_formats = ['mp3', 'ogg', 'aac', 'flac', 'wav']
-    
-    # Check if the file exists
-    if not os.path.exists(episode.file_path):
-        # Try to find the file with any supported extension
-        base_name = os.path.splitext(file_name)[0]
-        for fmt in supported_formats:
-            test_file = f"{base_name}.{fmt}"
-            if os.path.exists(os.path.join(base_path, test_file)):
-                file_name = test_file
-                break
+    # The stored path is kept current by the file reconciler, so the
+    # download costs at most one stat
+    if not episode.file_path or episode.file_missing:
+        abort(404)
     
     # Get the MIME type based on the file extension
     mime_types = {
@@ -661,15 +946,130 @@ def download_episode(id):
     }
     
     # Get the file extension
-    ext = os.path.splitext(file_name)[1].lower().lstrip('.')
+    ext = os.path.splitext(episode.file_path)[1].lower().lstrip('.')
     mimetype = mime_types.get(ext, 'audio/mpeg')
     
-    return send_from_directory(base_path, file_name, as_attachment=True, mimetype=mimetype)
+    return send_media_file(episode.file_path, mimetype)
+
+def take_over_scheduling():
+    """
+    Resume the work left by the previous scheduler leader and start running jobs.
+    
+    Called when this process becomes the leader, at startup or when the
+    leader stopped renewing its lease. Captures still running from the old
+    leader are adopted by their process IDs until it stops them.
+    """
+    with app.app_context():
+        # Resume any interrupted recordings
+        active_recordings = Recording.query.filter_by(status='recording').all()
+        for recording in active_recordings:
+            resume_recording(recording.id)
+        
+        # Queued recordings retry admission now rather than wait out their delay
+        for recording in Recording.query.filter_by(status='queued').all():
+            scheduler.add_job(
+                start_recording,
+                'date',
+                run_date=datetime.now(),
+                args=[recording.id],
+                id=f'admission_{recording.id}',
+                replace_existing=True
+            )
+        
+        # Resume post-processing left unfinished
+        post_processor.resume_pending(db.session)
+        
+        # Start continuous capture for stations that keep a timeshift
+        timeshift_manager.sync(db.session)
+        
+        # Finish clips left unfinished, and prune unused ones daily
+        resume_clips(db.session)
+        scheduler.add_job(
+            prune_clips,
+            'interval',
+            days=1,
+            id='prune_clips',
+            replace_existing=True
+        )
+        
+        # Schedule recurring recordings
+        recurring_recordings = RecurringRecording.query.all()
+        for recurring in recurring_recordings:
+            try:
+                trigger = build_recurring_trigger(recurring)
+            except ValueError as e:
+                # Leave the others scheduled
+                app.logger.error(str(e))
+                continue
+            
+            scheduler.add_job(
+                start_recording,
+                trigger=trigger,
+                args=[recurring.id, True],
+                id=f'recurring_{recurring.id}',
+                replace_existing=True
+            )
+        
+        # Schedule job to notice recorded files moved or deleted outside the app
+        scheduler.add_job(
+            reconcile_files,
+            'interval',
+            minutes=app.config['FILE_RECONCILE_INTERVAL'],
+            next_run_time=datetime.now(),
+            id='reconcile_files',
+            replace_existing=True
+        )
+        
+        # Schedule job to check the health of every station
+        scheduler.add_job(
+            probe_all_stations,
+            'interval',
+            minutes=app.config['STATION_HEALTH_INTERVAL'],
+            next_run_time=datetime.now() + timedelta(minutes=1),
+            id='probe_stations',
+            replace_existing=True
+        )
+        
+        # Schedule job to check active recordings
+        scheduler.add_job(
+            check_active_recordings,
+            'interval',
+            minutes=1,
+            id='check_active_recordings',
+            replace_existing=True
+        )
+        
+        scheduler.resume()
+
+def step_down_from_scheduling():
+    """Stop running jobs and captures after another worker took over the scheduler lease."""
+    scheduler.pause()
+    # The new leader starts the rings again on the same segments
+    timeshift_manager.stop_all()
+    # and resumes the recordings, so each is captured by one process
+    hand_over_recordings()
+
+def start_scheduling():
+    """
+    Run the scheduler's jobs in this process if no other worker does.
+    
+    Called from the server's entry points only, gunicorn's post_worker_init
+    hook and `python app.py`, so scripts and CLI commands that import the
+    application never start captures.
+    """
+    scheduler_leader.start(
+        on_elected=take_over_scheduling,
+        on_deposed=step_down_from_scheduling,
+        on_renewed=scheduler.wakeup
+    )
 
 # Initialize database and create admin user if not exists
 with app.app_context():
     db.create_all()
     
+    # Apply schema changes create_all() can't make to existing tables
+    run_migrations(db.engine)
+    
     # Create admin user if not exists
     if not User.query.filter_by(username='admin').first():
         admin = User(
@@ -684,81 +1084,40 @@ with app.app_context():
     # Create recordings directory if not exists
     os.makedirs(app.config['RECORDINGS_DIR'], exist_ok=True)
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+@app.before_request
+def start_statement_count():
+    reset_request_statement_count()
+
+@app.after_request
+def add_statement_count_header(response):
+    # Lets tests assert that a page's query count doesn't grow with its rows
+    if app.config['SQL_STATEMENT_HEADER'] or app.testing:
+        response.headers['X-SQL-Statements'] = str(get_request_statement_count())
+    return response
+
+@app.route('/debug/db')
+@login_required
+def debug_db():
+    # Engine and connection counts; more than one engine means something
+    # bypasses the shared pool
+    return jsonify(get_pool_stats())
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if a hot query runs as a full table scan."""
+    if db.engine.dialect.name != 'sqlite':
+        click.echo('Query plans can only be checked on SQLite.')
+        return
     
-    # Load settings from database into app config
-    settings = AppSettings.query.all()
-    for setting in settings:
-        if setting.key in ['NEXTCLOUD_URL', 'NEXTCLOUD_USERNAME', 'NEXTCLOUD_PASSWORD', 
-                          'PUSHOVER_USER_KEY', 'PUSHOVER_API_TOKEN', 'FFMPEG_PATH']:
-            app.config[setting.key] = setting.value
-    
-    # Resume any interrupted recordings
-    active_recordings = Recording.query.filter_by(status='recording').all()
-    for recording in active_recordings:
-        resume_recording(recording.id)
-    
-    # Schedule recurring recordings
-    recurring_recordings = RecurringRecording.query.all()
-    for recurring in recurring_recordings:
-        # Default trigger in case schedule_type doesn't match any condition
-        trigger = None
-        
-        if recurring.schedule_type == 'daily':
-            trigger = CronTrigger(
-                hour=recurring.start_time.hour,
-                minute=recurring.start_time.minute
-            )
-        elif recurring.schedule_type == 'weekly':
-            days = recurring.days_of_week.split(',')
-            trigger = CronTrigger(
-                day_of_week=','.join(days),
-                hour=recurring.start_time.hour,
-                minute=recurring.start_time.minute
-            )
-        elif recurring.schedule_type == 'weekends':
-            trigger = CronTrigger(
-                day_of_week='sat,sun',
-                hour=recurring.start_time.hour,
-                minute=recurring.start_time.minute
-            )
-        elif recurring.schedule_type == 'weekdays':
-            trigger = CronTrigger(
-                day_of_week='mon,tue,wed,thu,fri',
-                hour=recurring.start_time.hour,
-                minute=recurring.start_time.minute
-            )
-        elif recurring.schedule_type == 'monthly':
-            # For monthly recordings, use the day_of_week from the days_of_week field
-            # or default to the 1st day of the month if not specified
-            day = recurring.days_of_week if recurring.days_of_week else '1'
-            trigger = CronTrigger(
-                day=day,
-                hour=recurring.start_time.hour,
-                minute=recurring.start_time.minute
-            )
-        else:
-            # Log unknown schedule type and skip this recording
-            app.logger.error(f"Unknown schedule type '{recurring.schedule_type}' for recurring recording ID {recurring.id}")
-            continue
-        
-        # Only add job if we have a valid trigger
-        if trigger:
-            scheduler.add_job(
-                start_recording,
-                trigger=trigger,
-                args=[recurring.id, True],
-                id=f'recurring_{recurring.id}',
-                replace_existing=True
-            )
-    
-    # Schedule job to check active recordings
-    scheduler.add_job(
-        check_active_recordings,
-        'interval',
-        minutes=1,
-        id='check_active_recordings',
-        replace_existing=True
-    )
+    failed = False
+    for name, plan, problems in check_query_plans(db.session):
+        click.echo(f"{'FAIL' if problems else 'ok'}   {name}")
+        for line in plan:
+            click.echo(f'       {line}')
+        failed = failed or bool(problems)
+    if failed:
+        raise SystemExit(1)
 
 @app.route('/settings', methods=['GET', 'POST'])
 @login_required
@@ -783,17 +1142,6 @@ def settings():
         # Update default audio format
         AppSettings.set('default_audio_format', form.default_audio_format.data)
         
-        # Update application config
-        app.config['NEXTCLOUD_URL'] = form.nextcloud_url.data
-        app.config['NEXTCLOUD_USERNAME'] = form.nextcloud_username.data
-        if form.nextcloud_password.data:
-            app.config['NEXTCLOUD_PASSWORD'] = form.nextcloud_password.data
-        app.config['PUSHOVER_USER_KEY'] = form.pushover_user_key.data
-        app.config['PUSHOVER_API_TOKEN'] = form.pushover_api_token.data
-        if form.ffmpeg_path.data:
-            app.config['FFMPEG_PATH'] = form.ffmpeg_path.data
-        app.config['DEFAULT_AUDIO_FORMAT'] = form.default_audio_format.data
-        
         flash('Settings have been updated.')
         return redirect(url_for('settings'))
     
@@ -828,17 +1176,18 @@ def delete_selected_recordings():
                 except:
                     pass
                 
-                # Delete the file if it exists
+                # Delete the file if it exists; the reconciler keeps the path current
                 if recording.local_path:
-                    # Check for file with any supported extension
-                    base_path = os.path.splitext(recording.local_path)[0]
-                    supported_formats = ['mp3', 'ogg', 'aac', 'flac', 'wav']
-                    
-                    for fmt in supported_formats:
-                        file_path = f"{base_path}.{fmt}"
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                            break
+                    try:
+                        os.remove(recording.local_path)
+                    except FileNotFoundError:
+                        pass
+                
+                # Delete partial files left by interrupted captures
+                for part in recording.parts:
+                    if os.path.exists(part.file_path):
+                        os.remove(part.file_path)
+                delete_clip_files(recording)
                 
                 db.session.delete(recording)
                 deleted_count += 1
@@ -852,4 +1201,8 @@ def delete_selected_recordings():
 if __name__ == '__main__':
     # Use production mode in Docker environment
     debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
+    
+    # With the reloader, only the child process serving requests runs jobs
+    if not debug_mode or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_scheduling()
     app.run(host='0.0.0.0', debug=debug_mode)
@@ -1,5 +1,6 @@
 import os
 import secrets
+from sqlalchemy.pool import QueuePool
 
 class Config:
     # Flask configuration
@@ -9,11 +10,79 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///webradio.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Connection pool shared by web requests and background tasks
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '5'))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '3600'))
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True
+    }
+    if SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        # Flask-SQLAlchemy gives SQLite files no pool unless asked, and pooled
+        # connections are used by whichever thread checks them out
+        SQLALCHEMY_ENGINE_OPTIONS['poolclass'] = QueuePool
+        SQLALCHEMY_ENGINE_OPTIONS['connect_args'] = {'check_same_thread': False}
+    
+    # SQLite tuning: write-ahead logging so reads don't wait for writes, the
+    # fsync level, and milliseconds a writer waits for the lock
+    SQLITE_WAL = os.environ.get('SQLITE_WAL', 'true').lower() == 'true'
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', '15000'))
+    
+    # Seconds between batched writes of recording status and size
+    STATUS_WRITE_INTERVAL = float(os.environ.get('STATUS_WRITE_INTERVAL', '2'))
+    
+    # Report the SQL statements each request ran in an X-SQL-Statements header
+    SQL_STATEMENT_HEADER = os.environ.get('SQL_STATEMENT_HEADER', 'false').lower() == 'true'
+    
+    # Scheme and host podcast feeds link to, such as https://radio.example.com.
+    # Feeds are only cached when this or SERVER_NAME is set; otherwise their
+    # links follow each request's Host header, which the client chooses
+    FEED_BASE_URL = os.environ.get('FEED_BASE_URL', '')
+    
+    # Seconds podcast clients and proxies may reuse a feed without asking again
+    FEED_MAX_AGE = int(os.environ.get('FEED_MAX_AGE', '300'))
+    
+    # The same for archive pages, which only change when an episode on them
+    # is edited, deleted or re-measured; clients then revalidate by ETag
+    FEED_ARCHIVE_MAX_AGE = int(os.environ.get('FEED_ARCHIVE_MAX_AGE', '86400'))
+    
+    # Episodes on each archive page of a podcast feed; the main feed holds
+    # between one and two pages' worth of the newest episodes
+    FEED_PAGE_SIZE = int(os.environ.get('FEED_PAGE_SIZE', '100'))
+    
+    # Rows on each page of the recordings list
+    RECORDINGS_PER_PAGE = int(os.environ.get('RECORDINGS_PER_PAGE', '50'))
+    
+    # Seconds between checks whether another process changed the settings
+    SETTINGS_CHECK_INTERVAL = float(os.environ.get('SETTINGS_CHECK_INTERVAL', '5'))
+    
     # File storage paths
     BASE_DIR = os.path.abspath(os.path.dirname(__file__))
     RECORDINGS_DIR = os.environ.get('RECORDINGS_DIR') or os.path.join(BASE_DIR, 'recordings')
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or os.path.join(BASE_DIR, 'static', 'images')
     
+    # How downloads are sent: 'direct' from the application, 'x-accel-redirect'
+    # by nginx from an internal location mapped to RECORDINGS_DIR, or
+    # 'x-sendfile' by Apache or lighttpd
+    DOWNLOAD_MODE = os.environ.get('DOWNLOAD_MODE', 'direct').lower()
+    DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/internal-recordings/')
+    
+    # Minutes between checks of recorded files against the database
+    FILE_RECONCILE_INTERVAL = int(os.environ.get('FILE_RECONCILE_INTERVAL', '60'))
+    
+    # Under several workers only one runs the scheduler's jobs. It renews its
+    # lease every SCHEDULER_LEASE_RENEW seconds, and another worker takes over
+    # once it hasn't for SCHEDULER_LEASE_SECONDS
+    SCHEDULER_LEASE_SECONDS = int(os.environ.get('SCHEDULER_LEASE_SECONDS', '30'))
+    SCHEDULER_LEASE_RENEW = int(os.environ.get('SCHEDULER_LEASE_RENEW', '10'))
+    
+    # Seconds late a job may still run, e.g. when the leader changed just before it was due
+    SCHEDULER_MISFIRE_GRACE_TIME = int(os.environ.get('SCHEDULER_MISFIRE_GRACE_TIME', '300'))
+    
     # NextCloud configuration
     NEXTCLOUD_URL = os.environ.get('NEXTCLOUD_URL')
     NEXTCLOUD_USERNAME = os.environ.get('NEXTCLOUD_USERNAME')
@@ -25,3 +94,64 @@ class Config:
     
     # FFmpeg configuration
     FFMPEG_PATH = os.environ.get('FFMPEG_PATH') or 'ffmpeg'
+    FFPROBE_PATH = os.environ.get('FFPROBE_PATH')  # Defaults to ffprobe next to FFmpeg
+    
+    # Number of FFmpeg log lines kept in memory per recording
+    FFMPEG_LOG_LINES = int(os.environ.get('FFMPEG_LOG_LINES', '200'))
+    
+    # Restart a recording when its output stops growing for this many seconds
+    RECORDING_STALL_TIMEOUT = int(os.environ.get('RECORDING_STALL_TIMEOUT', '45'))
+    
+    # Share one upstream connection per station between overlapping recordings
+    SHARED_INGEST = os.environ.get('SHARED_INGEST', 'true').lower() == 'true'
+    
+    # Capture mode: 'auto' stream-copies when the station already broadcasts the
+    # requested format, 'transcode' always re-encodes
+    CAPTURE_MODE = os.environ.get('CAPTURE_MODE', 'auto')
+    
+    # Hours a station's probed stream characteristics are reused
+    STATION_PROBE_MAX_AGE = int(os.environ.get('STATION_PROBE_MAX_AGE', '24'))
+    
+    # Minutes between health checks of every station, and days of check
+    # results kept
+    STATION_HEALTH_INTERVAL = int(os.environ.get('STATION_HEALTH_INTERVAL', '30'))
+    STATION_PROBE_RETENTION_DAYS = int(os.environ.get('STATION_PROBE_RETENTION_DAYS', '7'))
+    
+    # Write recordings as fixed-length segments that are joined on completion,
+    # so a crash loses at most one segment
+    SEGMENTED_RECORDING = os.environ.get('SEGMENTED_RECORDING', 'false').lower() == 'true'
+    SEGMENT_SECONDS = int(os.environ.get('SEGMENT_SECONDS', '300'))
+
+    # Recordings post-processed at once (defaults to the number of cores), how
+    # many of them may run heavy steps such as joining or copying files, and
+    # the nice value those steps run at so captures keep priority
+    POSTPROCESS_WORKERS = int(os.environ.get('POSTPROCESS_WORKERS') or os.cpu_count() or 1)
+    POSTPROCESS_HEAVY_SLOTS = int(os.environ.get('POSTPROCESS_HEAVY_SLOTS') or max(1, POSTPROCESS_WORKERS // 2))
+    POSTPROCESS_NICE = int(os.environ.get('POSTPROCESS_NICE', '10'))
+    POSTPROCESS_MAX_ATTEMPTS = int(os.environ.get('POSTPROCESS_MAX_ATTEMPTS', '3'))
+    
+    # Capture budgets; new recordings wait, then are rejected, when starting
+    # them would exceed one. All are disabled with 0; the CPU budget is in
+    # percent of each core
+    MAX_CONCURRENT_RECORDINGS = int(os.environ.get('MAX_CONCURRENT_RECORDINGS', '0'))
+    CAPTURE_CPU_BUDGET = float(os.environ.get('CAPTURE_CPU_BUDGET', '0'))
+    CAPTURE_MEMORY_BUDGET_MB = int(os.environ.get('CAPTURE_MEMORY_BUDGET_MB', '0'))
+    CAPTURE_BANDWIDTH_BUDGET_KBPS = int(os.environ.get('CAPTURE_BANDWIDTH_BUDGET_KBPS', '0'))
+    
+    # Seconds a recording may wait for capacity before it is rejected
+    ADMISSION_QUEUE_TIMEOUT = int(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '300'))
+    
+    # Seconds before a recording's start time its job runs, to connect to the
+    # station and buffer audio so the recording starts on time
+    PREROLL_SECONDS = int(os.environ.get('PREROLL_SECONDS', '15'))
+    
+    # Seconds the streams behind a station's playlist URL are reused
+    RESOLVER_CACHE_TTL = int(os.environ.get('RESOLVER_CACHE_TTL', '3600'))
+    
+    # Continuous capture: length of the timeshift ring's segments in seconds,
+    # and hours kept for stations that don't set their own
+    TIMESHIFT_SEGMENT_SECONDS = int(os.environ.get('TIMESHIFT_SEGMENT_SECONDS', '60'))
+    TIMESHIFT_DEFAULT_HOURS = int(os.environ.get('TIMESHIFT_DEFAULT_HOURS', '2'))
+    
+    # Days an extracted clip is kept after it was last downloaded
+    CLIP_CACHE_DAYS = int(os.environ.get('CLIP_CACHE_DAYS', '7'))
@@ -1,13 +1,16 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
 from wtforms import StringField, PasswordField, BooleanField, TextAreaField, SelectField, IntegerField, TimeField, DateTimeField, SelectMultipleField, SubmitField
-from wtforms.validators import DataRequired, Length, EqualTo, URL, Optional, ValidationError
+from wtforms.validators import DataRequired, Length, EqualTo, URL, Optional, NumberRange, ValidationError
 from datetime import datetime, time
 import logging
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Longest timeshift a station can keep; a week of audio is already several GB
+MAX_TIMESHIFT_HOURS = 168
+
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
     password = PasswordField('Password', validators=[DataRequired()])
@@ -26,8 +29,40 @@ class RadioStationForm(FlaskForm):
     name = StringField('Station Name', validators=[DataRequired(), Length(max=100)])
     url = StringField('Stream URL', validators=[DataRequired(), URL()])
     description = TextAreaField('Description')
+    continuous_capture = BooleanField('Continuous Capture (keep recent audio to save after the fact)')
+    timeshift_hours = IntegerField('Hours of Audio to Keep', default=2, validators=[Optional(), NumberRange(min=1, max=MAX_TIMESHIFT_HOURS)])
     submit = SubmitField('Save Station')
 
+class ClipForm(FlaskForm):
+    start = StringField('Start (HH:MM:SS)', validators=[DataRequired()])
+    end = StringField('End (HH:MM:SS)', validators=[DataRequired()])
+    submit = SubmitField('Create Clip')
+    
+    def validate_start(self, field):
+        from utils.clips import parse_offset
+        try:
+            parse_offset(field.data)
+        except ValueError:
+            raise ValidationError('Enter the start as HH:MM:SS, MM:SS or seconds')
+    
+    def validate_end(self, field):
+        from utils.clips import parse_offset
+        try:
+            end = parse_offset(field.data)
+            start = parse_offset(self.start.data or '')
+        except ValueError:
+            if not self.start.errors:
+                raise ValidationError('Enter the end as HH:MM:SS, MM:SS or seconds')
+            return
+        if end <= start:
+            raise ValidationError('The end must be after the start')
+
+class TimeshiftForm(FlaskForm):
+    name = StringField('Recording Name', validators=[DataRequired(), Length(max=100)])
+    start_time = DateTimeField('Start Time', format='%Y-%m-%dT%H:%M', validators=[DataRequired()])
+    duration = IntegerField('Duration (minutes)', validators=[DataRequired(), NumberRange(min=1)])
+    submit = SubmitField('Save Recording')
+
 class RecordingForm(FlaskForm):
     name = StringField('Recording Name', validators=[DataRequired(), Length(max=100)])
     station_id = SelectField('Radio Station', coerce=int, validators=[DataRequired()])
@@ -0,0 +1,8 @@
+# Gunicorn settings for the Docker image
+
+
+def post_worker_init(worker):
+    # Every worker competes for the scheduler lease once it has loaded the
+    # application; the one holding it runs the recording jobs
+    from app import start_scheduling
+    start_scheduling()
@@ -25,36 +25,90 @@ class AppSettings(db.Model):
     @classmethod
     def get(cls, key, default=None):
         """Get a setting value by key"""
-        setting = cls.query.filter_by(key=key).first()
-        return setting.value if setting else default
+        # Served from the in-process cache instead of a query
+        from utils.settings import settings_cache
+        return settings_cache.get(key, default)
     
     @classmethod
     def set(cls, key, value):
         """Set a setting value"""
+        from utils.settings import settings_cache
         setting = cls.query.filter_by(key=key).first()
         if setting:
             setting.value = value
         else:
             setting = cls(key=key, value=value)
             db.session.add(setting)
+        
+        # Tell other processes their cached settings are out of date
+        SettingsVersion.bump(db.session)
         db.session.commit()
+        settings_cache.written(key, value)
         
     def __repr__(self):
         return f'<AppSettings {self.key}>'
 
+class SettingsVersion(db.Model):
+    # A single row, incremented on every settings change
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    @classmethod
+    def bump(cls, session):
+        """Increment the version as part of the session's transaction"""
+        if not session.query(cls).filter_by(id=1).update({cls.version: cls.version + 1}):
+            session.add(cls(id=1, version=1))
+    
+    def __repr__(self):
+        return f'<SettingsVersion {self.version}>'
+
+class SchedulerLease(db.Model):
+    # A single row naming the process that runs the scheduler's jobs
+    id = db.Column(db.Integer, primary_key=True)
+    holder = db.Column(db.String(100), nullable=False)  # Host, PID and a random suffix
+    expires_at = db.Column(db.DateTime, nullable=False)  # UTC; anyone may take the lease after this
+    
+    def __repr__(self):
+        return f'<SchedulerLease {self.holder}>'
+
 class RadioStation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     url = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    continuous_capture = db.Column(db.Boolean, default=False)  # Keep a timeshift ring of recent audio
+    timeshift_hours = db.Column(db.Integer, default=2)  # Hours of audio kept in the ring
     
     recordings = db.relationship('Recording', backref='station', lazy=True)
     recurring_recordings = db.relationship('RecurringRecording', backref='station', lazy=True)
+    probes = db.relationship('StationProbe', backref='station', lazy='dynamic', cascade='all, delete-orphan')
+    
+    # Sorting the recordings list by station
+    __table_args__ = (db.Index('ix_radio_station_name', 'name'),)
     
     def __repr__(self):
         return f'<RadioStation {self.name}>'
 
+class StationProbe(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    station_id = db.Column(db.Integer, db.ForeignKey('radio_station.id'), nullable=False)
+    url = db.Column(db.String(255), nullable=False)  # URL that was probed
+    probed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    codec_name = db.Column(db.String(32))
+    sample_rate = db.Column(db.Integer)
+    channels = db.Column(db.Integer)
+    bit_rate = db.Column(db.Integer)  # Bits per second
+    reachable = db.Column(db.Boolean, default=True)
+    latency_ms = db.Column(db.Integer)  # Time until the stream answered
+    error = db.Column(db.Text)  # Why the stream could not be probed
+    
+    # Latest check of each station
+    __table_args__ = (db.Index('ix_station_probe_station_id_probed_at', 'station_id', 'probed_at'),)
+    
+    def __repr__(self):
+        return f'<StationProbe {self.station_id} {self.codec_name}>'
+
 class Recording(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -71,10 +125,94 @@ class Recording(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     process_id = db.Column(db.Integer)  # Process ID of the ffmpeg process
     send_notification = db.Column(db.Boolean, default=True)  # Whether to send Pushover notification
+    recorded_duration = db.Column(db.Integer)  # Measured duration of the final file in seconds
+    start_latency = db.Column(db.Float)  # Seconds between the start time and the first captured audio
+    file_mtime = db.Column(db.Float)  # Modification time of the file when last checked
+    file_missing = db.Column(db.Boolean, default=False)  # File was gone when last checked
+    
+    parts = db.relationship('RecordingPart', backref='recording', lazy=True,
+                            order_by='RecordingPart.sequence', cascade='all, delete-orphan')
+    post_process_steps = db.relationship('PostProcessStep', backref='recording', lazy=True,
+                                         order_by='PostProcessStep.id', cascade='all, delete-orphan')
+    clips = db.relationship('Clip', backref='recording', lazy=True,
+                            order_by='Clip.start_offset', cascade='all, delete-orphan')
+    
+    # Recordings by status, such as the active ones checked every minute, and
+    # the recordings list's sort keys; SQLite appends the row ID to each index,
+    # which covers the list's tie-break on id
+    __table_args__ = (
+        db.Index('ix_recording_status_start_time', 'status', 'start_time'),
+        db.Index('ix_recording_start_time', 'start_time'),
+        db.Index('ix_recording_name', 'name'),
+        db.Index('ix_recording_duration', 'duration'),
+        db.Index('ix_recording_station_id', 'station_id'),
+    )
     
     def __repr__(self):
         return f'<Recording {self.name}>'
 
+class RecordingPart(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    recording_id = db.Column(db.Integer, db.ForeignKey('recording.id'), nullable=False)
+    sequence = db.Column(db.Integer, nullable=False)  # 1 for the first interrupted capture, and so on
+    file_path = db.Column(db.String(255), nullable=False)
+    file_size = db.Column(db.Integer)  # Size in bytes
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<RecordingPart {self.recording_id}#{self.sequence}>'
+
+class PostProcessStep(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    recording_id = db.Column(db.Integer, db.ForeignKey('recording.id'), nullable=False)
+    step = db.Column(db.String(20), nullable=False)  # finalize, copy, podcast, retention, notify
+    status = db.Column(db.String(20), default='pending')  # pending, running, done, failed, skipped
+    attempts = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_post_process_step_recording_id', 'recording_id'),)
+    
+    def __repr__(self):
+        return f'<PostProcessStep {self.recording_id}:{self.step} {self.status}>'
+
+class Clip(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    recording_id = db.Column(db.Integer, db.ForeignKey('recording.id'), nullable=False)
+    start_offset = db.Column(db.Integer, nullable=False)  # Seconds into the recording
+    end_offset = db.Column(db.Integer, nullable=False)
+    file_path = db.Column(db.String(255), nullable=False)
+    file_size = db.Column(db.Integer)  # Size in bytes
+    status = db.Column(db.String(20), default='pending')  # pending, running, ready, failed
+    error = db.Column(db.Text)
+    claimed_at = db.Column(db.DateTime)  # When a worker started cutting it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_accessed = db.Column(db.DateTime, default=datetime.utcnow)  # Last download, for pruning the cache
+    
+    __table_args__ = (db.UniqueConstraint('recording_id', 'start_offset', 'end_offset'),)
+    
+    def __repr__(self):
+        return f'<Clip {self.recording_id} {self.start_offset}-{self.end_offset}>'
+
+class MediaMetadata(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.Integer, nullable=False)  # Size in bytes when probed
+    mtime = db.Column(db.Float, nullable=False)  # Modification time when probed
+    duration = db.Column(db.Float)  # Measured duration in seconds
+    bit_rate = db.Column(db.Integer)  # Bits per second
+    codec_name = db.Column(db.String(20))
+    sample_rate = db.Column(db.Integer)
+    channels = db.Column(db.Integer)
+    probed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # One probe per version of a file; a file that changes is probed again
+    __table_args__ = (db.UniqueConstraint('path', 'size', 'mtime'),)
+    
+    def __repr__(self):
+        return f'<MediaMetadata {self.path}>'
+
 class RecurringRecording(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -100,7 +238,9 @@ class RecurringRecording(db.Model):
 # Association table for recurring recordings and their instances
 recurring_recording_instance = db.Table('recurring_recording_instance',
     db.Column('recurring_id', db.Integer, db.ForeignKey('recurring_recording.id'), primary_key=True),
-    db.Column('recording_id', db.Integer, db.ForeignKey('recording.id'), primary_key=True)
+    db.Column('recording_id', db.Integer, db.ForeignKey('recording.id'), primary_key=True),
+    # The primary key starts with recurring_id, so lookups by recording need their own index
+    db.Index('ix_recurring_recording_instance_recording_id', 'recording_id', 'recurring_id')
 )
 
 class Podcast(db.Model):
@@ -131,8 +271,18 @@ class PodcastEpisode(db.Model):
     duration = db.Column(db.Integer)  # Duration in seconds
     publication_date = db.Column(db.DateTime, default=datetime.utcnow)
     recording_id = db.Column(db.Integer, db.ForeignKey('recording.id'))
+    file_mtime = db.Column(db.Float)  # Modification time of the file when last checked
+    file_missing = db.Column(db.Boolean, default=False)  # File was gone when last checked
     
     recording = db.relationship('Recording')
     
+    # A podcast's episodes newest first for its page, and in ID order for its
+    # feed's archive pages
+    __table_args__ = (
+        db.Index('ix_podcast_episode_podcast_id_publication_date', 'podcast_id', 'publication_date'),
+        db.Index('ix_podcast_episode_recording_id', 'recording_id'),
+        db.Index('ix_podcast_episode_podcast_id_id', 'podcast_id', 'id'),
+    )
+    
     def __repr__(self):
         return f'<PodcastEpisode {self.title}>'
@@ -0,0 +1,51 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Config reads the environment when it is imported, so the database and
+# recordings go to a scratch directory before anything imports the app
+_scratch = tempfile.mkdtemp(prefix='webradio-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_scratch, 'webradio.db')}"
+os.environ['RECORDINGS_DIR'] = os.path.join(_scratch, 'recordings')
+os.environ['UPLOAD_FOLDER'] = os.path.join(_scratch, 'images')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app():
+    """The application, with its database created; importing it runs no jobs."""
+    from app import app as flask_app
+    flask_app.testing = True
+    return flask_app
+
+
+@pytest.fixture
+def session(app):
+    """The request session, emptied of every row after the test."""
+    from models import db
+    with app.app_context():
+        yield db.session
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+
+
+@pytest.fixture
+def client(app, session):
+    """A test client logged in as an admin user."""
+    from models import User
+    from werkzeug.security import generate_password_hash
+
+    user = User(username='tester', password_hash=generate_password_hash('secret'))
+    session.add(user)
+    session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['_user_id'] = str(user.id)
+        flask_session['_fresh'] = True
+    return client
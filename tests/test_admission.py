@@ -0,0 +1,61 @@
+import pytest
+
+from config import Config
+from utils.admission import AdmissionController, DEFAULT_COSTS
+from utils.recorder import RecordingRegistry
+
+URL = 'http://example.com/stream'
+
+
+@pytest.fixture
+def registry():
+    return RecordingRegistry()
+
+@pytest.fixture
+def admission(registry):
+    return AdmissionController(registry)
+
+
+def test_budgets_are_disabled_by_default(admission):
+    for recording_id in range(50):
+        assert admission.admit(recording_id, URL, stream_copy=False) is None
+
+def test_admitted_captures_reserve_their_cost(admission, registry, monkeypatch):
+    monkeypatch.setattr(Config, 'MAX_CONCURRENT_RECORDINGS', 2)
+
+    assert admission.admit(1, URL, stream_copy=True) is None
+    assert registry.get(1)['starting']
+    assert registry.get(1)['cost'] == DEFAULT_COSTS[True]
+    assert admission.admit(2, URL, stream_copy=True) is None
+
+    assert admission.admit(3, URL, stream_copy=True) == 'more than 2 concurrent recordings'
+    assert 3 not in registry
+    assert admission.queued_since(3) is not None
+
+def test_cpu_budget_counts_every_core(admission, monkeypatch):
+    monkeypatch.setattr(Config, 'CAPTURE_CPU_BUDGET', 20)
+    monkeypatch.setattr('utils.admission.os.cpu_count', lambda: 1)
+
+    # A transcode is assumed to use 15% of a core
+    assert admission.admit(1, URL, stream_copy=False) is None
+    assert 'CPU' in admission.admit(2, URL, stream_copy=False)
+
+    monkeypatch.setattr('utils.admission.os.cpu_count', lambda: 2)
+    assert admission.admit(2, URL, stream_copy=False) is None
+
+def test_shared_station_bandwidth_is_counted_once(admission, monkeypatch):
+    monkeypatch.setattr(Config, 'CAPTURE_BANDWIDTH_BUDGET_KBPS', 200)
+    monkeypatch.setattr(Config, 'SHARED_INGEST', True)
+
+    assert admission.admit(1, URL, stream_copy=True, kbps=128) is None
+    assert admission.admit(2, URL, stream_copy=True, kbps=128) is None
+    assert 'bandwidth' in admission.admit(3, 'http://example.com/other', stream_copy=True, kbps=128)
+
+def test_release_forgets_the_queueing(admission, monkeypatch):
+    monkeypatch.setattr(Config, 'MAX_CONCURRENT_RECORDINGS', 1)
+    admission.admit(1, URL, stream_copy=True)
+    admission.admit(2, URL, stream_copy=True)
+
+    admission.release(2)
+
+    assert admission.queued_since(2) is None
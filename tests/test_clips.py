@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import utils.clips as clips
+from models import RadioStation, Recording, Clip
+from utils.clips import parse_offset, format_offset, request_clip
+
+
+@pytest.fixture
+def recording(session, tmp_path):
+    path = tmp_path / 'show.mp3'
+    path.write_bytes(b'audio')
+    station = RadioStation(name='Station', url='http://example.com/stream')
+    recording = Recording(name='Show', station=station, start_time=datetime.now(), duration=60,
+                          status='completed', format='mp3', local_path=str(path))
+    session.add(recording)
+    session.commit()
+    return recording
+
+@pytest.fixture
+def cuts(monkeypatch):
+    cuts = []
+
+    def extract_clip(source, output_file, start, duration, ffmpeg_path, encoding_params=None):
+        cuts.append((start, duration))
+        with open(output_file, 'wb') as f:
+            f.write(b'clip')
+        return True
+
+    monkeypatch.setattr(clips, 'extract_clip', extract_clip)
+    return cuts
+
+@pytest.fixture
+def submitted(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(clips, 'submit_clip', submitted.append)
+    return submitted
+
+def _clip(session, recording, tmp_path, start, status, claimed_at=None):
+    clip = Clip(recording_id=recording.id, start_offset=start, end_offset=start + 10,
+                file_path=str(tmp_path / f'clip-{start}.mp3'), status=status, claimed_at=claimed_at)
+    session.add(clip)
+    session.commit()
+    return clip
+
+
+def test_offsets_round_trip():
+    assert parse_offset('90') == 90
+    assert parse_offset('01:30') == 90
+    assert parse_offset('1:00:05') == 3605
+    assert format_offset(3605) == '1:00:05'
+    with pytest.raises(ValueError):
+        parse_offset('1:-5')
+
+def test_clip_is_reused_until_its_file_is_gone(session, recording):
+    clip = request_clip(session, recording, 60, 120)
+    session.commit()
+    clip.status = 'ready'
+    session.commit()
+
+    assert request_clip(session, recording, 60, 120) is clip
+    # The cached file was never written, so the clip is cut again
+    assert clip.status == 'pending'
+
+def test_pending_clip_is_cut_once(session, recording, tmp_path, cuts):
+    clip_id = _clip(session, recording, tmp_path, 60, 'pending').id
+
+    clips.extract_recording_clip(clip_id)
+    clips.extract_recording_clip(clip_id)
+
+    clip = session.get(Clip, clip_id)
+    assert cuts == [(60, 10)]
+    assert clip.status == 'ready'
+    assert clip.claimed_at is not None
+
+def test_clip_claimed_elsewhere_is_not_cut(session, recording, tmp_path, cuts):
+    clip = _clip(session, recording, tmp_path, 60, 'running', datetime.utcnow())
+
+    clips.extract_recording_clip(clip.id)
+
+    assert cuts == []
+
+def test_only_abandoned_clips_are_resumed(session, recording, tmp_path, submitted):
+    pending = _clip(session, recording, tmp_path, 0, 'pending')
+    running = _clip(session, recording, tmp_path, 60, 'running', datetime.utcnow())
+    abandoned = _clip(session, recording, tmp_path, 120, 'running', datetime.utcnow() - timedelta(hours=2))
+
+    clips.resume_clips(session)
+
+    session.expire_all()
+    assert sorted(submitted) == sorted([pending.id, abandoned.id])
+    assert running.status == 'running'
+    assert abandoned.status == 'pending'
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from config import Config
+from models import db, RadioStation, Recording
+from utils.db import StatusWriter, get_db_session, get_engine, get_pool_stats
+
+
+def test_background_sessions_share_the_app_engine(app):
+    first = get_db_session()
+    second = get_db_session()
+    try:
+        assert first is not second
+        assert first.get_bind() is second.get_bind() is db.get_engine(app)
+    finally:
+        first.close()
+        second.close()
+
+def test_closed_sessions_return_their_connections(app):
+    before = get_pool_stats()['checked_out']
+    session = get_db_session()
+    session.execute(db.text('SELECT 1'))
+    assert get_pool_stats()['checked_out'] == before + 1
+
+    session.close()
+
+    stats = get_pool_stats()
+    assert stats['checked_out'] == before
+    assert get_engine() is db.get_engine(app)
+
+def test_sqlite_connections_use_wal_and_wait_for_locks(app):
+    session = get_db_session()
+    try:
+        assert session.execute(db.text('PRAGMA journal_mode')).scalar() == 'wal'
+        # NORMAL
+        assert session.execute(db.text('PRAGMA synchronous')).scalar() == 1
+        assert session.execute(db.text('PRAGMA busy_timeout')).scalar() == Config.SQLITE_BUSY_TIMEOUT
+    finally:
+        session.close()
+
+def test_status_updates_are_merged_into_one_write(session):
+    station = RadioStation(name='Station', url='http://example.com/stream')
+    recordings = [Recording(name=f'Show {n}', station=station, start_time=datetime.now(), duration=60, status='scheduled')
+                  for n in range(2)]
+    session.add_all(recordings)
+    session.commit()
+    writer = StatusWriter(interval=3600)
+
+    writer.update(Recording, recordings[0].id, status='recording', file_size=100)
+    writer.update(Recording, recordings[0].id, file_size=200)
+    writer.update(Recording, recordings[1].id, file_size=50)
+    assert len(writer._pending) == 2
+    writer.flush()
+
+    session.expire_all()
+    assert (recordings[0].status, recordings[0].file_size) == ('recording', 200)
+    assert recordings[1].file_size == 50
+    assert writer._pending == {}
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+from werkzeug.exceptions import NotFound, RequestedRangeNotSatisfiable
+
+from config import Config
+from utils.downloads import send_media_file, get_file_etag
+
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def media_file(app):
+    os.makedirs(Config.RECORDINGS_DIR, exist_ok=True)
+    path = os.path.join(Config.RECORDINGS_DIR, 'show.mp3')
+    with open(path, 'wb') as f:
+        f.write(DATA)
+    yield path
+    os.remove(path)
+
+def _send(app, path, headers=None):
+    with app.test_request_context('/', headers=headers or {}) as context:
+        response = send_media_file(path, 'audio/mpeg')
+        # The body as the server sends it, which is empty for a 304
+        return response, b''.join(response.get_app_iter(context.request.environ))
+
+
+def test_full_download_has_strong_etag(app, media_file):
+    response, body = _send(app, media_file)
+    stat = os.stat(media_file)
+
+    assert response.status_code == 200
+    assert body == DATA
+    assert response.headers['ETag'] == f'"{get_file_etag(stat.st_mtime, stat.st_size)}"'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert 'attachment' in response.headers['Content-Disposition']
+
+def test_range_request_gets_partial_content(app, media_file):
+    response, body = _send(app, media_file, {'Range': 'bytes=10-19'})
+
+    assert response.status_code == 206
+    assert body == DATA[10:20]
+    assert response.headers['Content-Range'] == f'bytes 10-19/{len(DATA)}'
+
+def test_if_range_with_stale_etag_gets_whole_file(app, media_file):
+    response, body = _send(app, media_file, {'Range': 'bytes=10-', 'If-Range': '"stale"'})
+
+    assert response.status_code == 200
+    assert body == DATA
+
+def test_matching_etag_is_not_modified(app, media_file):
+    etag = _send(app, media_file)[0].headers['ETag']
+    response, body = _send(app, media_file, {'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert body == b''
+
+def test_unsatisfiable_range(app, media_file):
+    with pytest.raises(RequestedRangeNotSatisfiable):
+        _send(app, media_file, {'Range': f'bytes={len(DATA) + 10}-'})
+
+def test_missing_file_is_not_found(app):
+    with pytest.raises(NotFound):
+        _send(app, os.path.join(Config.RECORDINGS_DIR, 'gone.mp3'))
+
+def test_accel_redirect_hands_file_to_proxy(app, media_file, monkeypatch):
+    monkeypatch.setattr(Config, 'DOWNLOAD_MODE', 'x-accel-redirect')
+    response, body = _send(app, media_file, {'Range': 'bytes=0-9'})
+
+    assert response.status_code == 200
+    assert body == b''
+    assert response.headers['X-Accel-Redirect'] == Config.DOWNLOAD_ACCEL_PREFIX.rstrip('/') + '/show.mp3'
+    assert 'X-Sendfile' not in response.headers
+    assert 'Content-Length' not in response.headers
+    assert 'ETag' in response.headers
@@ -0,0 +1,145 @@
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import pytest
+
+import utils.media
+from models import Podcast, PodcastEpisode
+from utils.feeds import FeedCache, feed_cache
+from utils.files import reconcile_files
+
+BASE_URL = 'https://radio.example.com'
+
+
+@pytest.fixture
+def feeds_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(feed_cache, 'feeds_dir', str(tmp_path))
+    monkeypatch.setattr(feed_cache, '_loaded', OrderedDict())
+    monkeypatch.setattr(feed_cache, '_generations', {})
+    return tmp_path
+
+@pytest.fixture
+def base_url(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'FEED_BASE_URL', BASE_URL + '/')
+
+def _podcast(session, episodes):
+    podcast = Podcast(title='Show', description='A show', author='Host')
+    for index in range(episodes):
+        podcast.episodes.append(PodcastEpisode(
+            title=f'Episode {index}',
+            file_path=f'/tmp/episode-{index}.mp3',
+            file_size=1000,
+            publication_date=datetime(2024, 1, 1) + timedelta(days=index)
+        ))
+    session.add(podcast)
+    session.commit()
+    return podcast.id
+
+def _get(client, path, host='localhost', **headers):
+    return client.get(path, headers={'Host': host, **headers})
+
+
+def test_feed_links_use_the_configured_url(client, session, feeds_dir, base_url):
+    podcast_id = _podcast(session, 2)
+
+    response = _get(client, f'/podcasts/feed/{podcast_id}', host='evil.example.com')
+    again = _get(client, f'/podcasts/feed/{podcast_id}', host='other.example.com')
+
+    assert response.status_code == 200
+    assert b'evil.example.com' not in response.data
+    assert f'{BASE_URL}/download/episode/'.encode() in response.data
+    assert again.data == response.data
+    assert sorted(os.listdir(feeds_dir)) == [f'{podcast_id}.xml', f'{podcast_id}.xml.gz']
+
+def test_feed_is_not_cached_without_a_trusted_url(client, session, feeds_dir):
+    podcast_id = _podcast(session, 1)
+
+    response = _get(client, f'/podcasts/feed/{podcast_id}', host='evil.example.com')
+
+    assert b'http://evil.example.com/download/episode/' in response.data
+    assert os.listdir(feeds_dir) == []
+    assert _get(client, f'/podcasts/feed/{podcast_id}', host='radio.local').data != response.data
+
+def test_unchanged_feed_is_not_sent_again(client, session, feeds_dir, base_url):
+    podcast_id = _podcast(session, 1)
+    etag = _get(client, f'/podcasts/feed/{podcast_id}').headers['ETag']
+
+    response = _get(client, f'/podcasts/feed/{podcast_id}', **{'If-None-Match': etag})
+
+    assert response.status_code == 304
+
+def test_new_episode_replaces_the_cached_feed(client, session, feeds_dir, base_url):
+    podcast_id = _podcast(session, 1)
+    _get(client, f'/podcasts/feed/{podcast_id}')
+
+    session.add(PodcastEpisode(podcast_id=podcast_id, title='Late episode', file_path='/tmp/late.mp3',
+                               file_size=1000, publication_date=datetime(2024, 2, 1)))
+    session.commit()
+
+    assert b'Late episode' in _get(client, f'/podcasts/feed/{podcast_id}').data
+
+def test_loaded_feeds_are_bounded(tmp_path):
+    cache = FeedCache(str(tmp_path), max_loaded=2)
+
+    for podcast_id in range(1, 4):
+        cache.store(podcast_id, f'<rss>{podcast_id}</rss>'.encode(), cache.generation(podcast_id))
+    cache.get(2)
+
+    assert len(cache._loaded) == 2
+    assert cache.get(1).body == b'<rss>1</rss>'
+    assert list(cache._loaded) == [os.path.join(str(tmp_path), name) for name in ('2.xml', '1.xml')]
+
+@pytest.fixture
+def paged(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'FEED_PAGE_SIZE', 2)
+
+def test_old_episodes_move_to_archive_pages(client, session, feeds_dir, base_url, paged):
+    podcast_id = _podcast(session, 5)
+
+    main = _get(client, f'/podcasts/feed/{podcast_id}').data
+    archive = _get(client, f'/podcasts/feed/{podcast_id}/archive/1').data
+
+    assert f'{BASE_URL}/podcasts/feed/{podcast_id}/archive/1'.encode() in main
+    assert [b'Episode 0' in archive, b'Episode 1' in archive, b'Episode 2' in archive] == [True, True, False]
+    assert b'Episode 0' not in main
+    assert _get(client, f'/podcasts/feed/{podcast_id}/archive/2').status_code == 404
+
+def test_archive_pages_are_revalidated(client, session, feeds_dir, base_url, paged):
+    podcast_id = _podcast(session, 5)
+
+    response = _get(client, f'/podcasts/feed/{podcast_id}/archive/1')
+
+    assert not response.cache_control.immutable
+    assert response.cache_control.max_age == client.application.config['FEED_ARCHIVE_MAX_AGE']
+    assert _get(client, f'/podcasts/feed/{podcast_id}/archive/1',
+                **{'If-None-Match': response.headers['ETag']}).status_code == 304
+
+def test_edited_episode_changes_its_archive_page(client, session, feeds_dir, base_url, paged):
+    podcast_id = _podcast(session, 5)
+    _get(client, f'/podcasts/feed/{podcast_id}/archive/1')
+
+    episode = session.query(PodcastEpisode).filter_by(podcast_id=podcast_id, title='Episode 0').one()
+    episode.title = 'Renamed episode'
+    session.commit()
+
+    assert b'Renamed episode' in _get(client, f'/podcasts/feed/{podcast_id}/archive/1').data
+
+def test_measured_duration_changes_the_archive_page(client, session, feeds_dir, base_url, paged, tmp_path, monkeypatch):
+    podcast_id = _podcast(session, 5)
+    for episode in session.query(PodcastEpisode).filter_by(podcast_id=podcast_id):
+        path = tmp_path / f'episode-{episode.id}.mp3'
+        path.write_bytes(b'audio')
+        episode.file_path = str(path)
+        episode.file_mtime = path.stat().st_mtime
+        episode.file_size = path.stat().st_size
+        episode.duration = 60
+    session.commit()
+    before = _get(client, f'/podcasts/feed/{podcast_id}/archive/1').data
+    monkeypatch.setattr(utils.media, 'probe_media', lambda path, ffprobe_path: {'duration': 1234.0})
+
+    reconcile_files()
+
+    after = _get(client, f'/podcasts/feed/{podcast_id}/archive/1').data
+    assert b'1234' not in before
+    assert b'1234' in after
@@ -0,0 +1,101 @@
+from datetime import datetime
+
+import pytest
+
+import utils.media
+import utils.metadata
+from models import MediaMetadata, RadioStation, Recording
+from utils.files import record_file_stat, reconcile_files
+from utils.metadata import prune_media_metadata
+
+
+@pytest.fixture(autouse=True)
+def probed(monkeypatch):
+    probed = []
+
+    def probe_media(path, ffprobe_path):
+        probed.append(path)
+        return {'duration': 3600.0}
+
+    monkeypatch.setattr(utils.media, 'probe_media', probe_media)
+    return probed
+
+def _recording(session, path, status='completed'):
+    station = RadioStation(name='Station', url='http://example.com/stream')
+    recording = Recording(name='Show', station=station, start_time=datetime.now(), duration=60,
+                          status=status, local_path=str(path))
+    record_file_stat(recording, str(path))
+    session.add(recording)
+    session.commit()
+    return recording.id
+
+
+def test_file_stat_is_recorded(tmp_path):
+    path = tmp_path / 'show.mp3'
+    path.write_bytes(b'audio')
+    recording = Recording()
+
+    assert record_file_stat(recording, str(path))
+    assert (recording.file_size, recording.file_mtime, recording.file_missing) == (5, path.stat().st_mtime, False)
+    assert not record_file_stat(recording, str(tmp_path / 'gone.mp3'))
+    assert recording.file_missing
+
+def test_converted_file_is_found(session, tmp_path):
+    path = tmp_path / 'show.mp3'
+    path.write_bytes(b'audio')
+    recording_id = _recording(session, path)
+    path.rename(tmp_path / 'show.ogg')
+
+    reconcile_files()
+
+    recording = session.get(Recording, recording_id)
+    assert recording.local_path == str(tmp_path / 'show.ogg')
+    assert not recording.file_missing
+    assert recording.recorded_duration == 3600
+
+def test_deleted_file_is_marked_missing_until_it_returns(session, tmp_path):
+    path = tmp_path / 'show.mp3'
+    path.write_bytes(b'audio')
+    recording_id = _recording(session, path)
+    path.unlink()
+
+    reconcile_files()
+    assert session.get(Recording, recording_id).file_missing
+
+    path.write_bytes(b'longer audio')
+    reconcile_files()
+    recording = session.get(Recording, recording_id)
+    assert not recording.file_missing
+    assert recording.file_size == len(b'longer audio')
+
+def test_missing_file_is_not_downloaded(client, session, tmp_path):
+    path = tmp_path / 'show.mp3'
+    path.write_bytes(b'audio')
+    recording_id = _recording(session, path)
+    path.unlink()
+    reconcile_files()
+
+    assert client.get(f'/download/{recording_id}').status_code == 404
+
+def test_partial_recordings_are_probed_once(session, tmp_path, probed):
+    path = tmp_path / 'show.mp3'
+    path.write_bytes(b'audio')
+    recording_id = _recording(session, path, status='partial')
+
+    reconcile_files()
+    reconcile_files()
+
+    assert probed == [str(path)]
+    assert session.get(Recording, recording_id).recorded_duration == 3600
+    assert session.query(MediaMetadata).count() == 1
+
+def test_old_metadata_is_pruned_in_batches(session, monkeypatch):
+    monkeypatch.setattr(utils.metadata, 'PRUNE_BATCH_SIZE', 2)
+    for size in range(5):
+        session.add(MediaMetadata(path='/show.mp3', size=size, mtime=1.0))
+    session.commit()
+
+    prune_media_metadata(session, {('/show.mp3', 1, 1.0), ('/show.mp3', 4, 1.0)})
+    session.commit()
+
+    assert sorted(metadata.size for metadata in session.query(MediaMetadata)) == [1, 4]
@@ -0,0 +1,112 @@
+import os
+import time
+
+import pytest
+
+import utils.ingest as ingest_module
+from utils.ingest import IngestHub, StationIngest, PCM_FEED, FRAMED_FEEDS, get_feed
+
+URL = 'http://example.com/stream'
+
+
+class FakeCapture:
+    """A capture process whose stdin is a pipe the test reads from."""
+
+    def __init__(self):
+        self.read_fd, write_fd = os.pipe()
+        self.stdin = os.fdopen(write_fd, 'wb')
+        self.terminated = False
+
+    def terminate(self):
+        self.terminated = True
+
+    def received(self):
+        os.set_blocking(self.read_fd, False)
+        data = b''
+        try:
+            while True:
+                chunk = os.read(self.read_fd, 65536)
+                if not chunk:
+                    break
+                data += chunk
+        except BlockingIOError:
+            pass
+        return data
+
+class FakeIngestProcess:
+    def poll(self):
+        return None
+
+    def terminate(self):
+        pass
+
+@pytest.fixture
+def hub():
+    hub = IngestHub()
+    # A running ingest, without starting FFmpeg
+    ingest = StationIngest.__new__(StationIngest)
+    ingest.url = URL
+    ingest.feed = PCM_FEED
+    ingest.key = ('ingest', URL, PCM_FEED.name)
+    ingest.subscribers = {}
+    ingest.bytes_read = 0
+    ingest.last_data = time.monotonic()
+    ingest.stopping = False
+    ingest.keep_until = 0
+    ingest.process = FakeIngestProcess()
+    hub._ingests[(URL, PCM_FEED.name)] = ingest
+    hub.ingest = ingest
+    return hub
+
+def _attach(hub, recording_id, interrupts=None):
+    capture = FakeCapture()
+    hub.attach(URL, PCM_FEED, 'ffmpeg', recording_id, capture,
+               on_interrupt=lambda reason: (interrupts if interrupts is not None else []).append(reason))
+    return capture
+
+
+def test_framed_codecs_are_passed_through():
+    assert get_feed('mp3') is FRAMED_FEEDS['mp3']
+    assert get_feed('vorbis') is PCM_FEED
+
+def test_every_capture_gets_the_same_audio(hub):
+    first = _attach(hub, 1)
+    second = _attach(hub, 2)
+
+    hub._fan_out(hub.ingest, b'abcd' * 4)
+
+    assert first.received() == b'abcd' * 4
+    assert second.received() == b'abcd' * 4
+
+def test_joining_capture_starts_on_a_frame_boundary(hub):
+    first = _attach(hub, 1)
+    hub._fan_out(hub.ingest, b'abcdef')
+    second = _attach(hub, 2)
+
+    hub._fan_out(hub.ingest, b'ghijklmn')
+
+    assert first.received() == b'abcdefghijklmn'
+    # PCM frames are 4 bytes, so the 2 bytes finishing the current frame are skipped
+    assert second.received() == b'ijklmn'
+
+def test_detached_capture_is_never_written_again(hub):
+    capture = _attach(hub, 1)
+    subscriber = hub.ingest.subscribers[1]
+
+    hub.detach(1)
+    hub._fan_out(hub.ingest, b'late')
+
+    assert subscriber.closed
+    assert capture.received() == b''
+
+def test_slow_capture_is_dropped(hub, monkeypatch):
+    monkeypatch.setattr(ingest_module, 'MAX_SUBSCRIBER_BACKLOG', 1024)
+    interrupts = []
+    capture = _attach(hub, 1, interrupts)
+
+    # More than the pipe holds, and nobody reads it
+    hub._fan_out(hub.ingest, b'x' * (1024 * 1024))
+
+    assert interrupts == ['capture fell behind the shared ingest']
+    assert capture.terminated
+    assert 1 not in hub.ingest.subscribers
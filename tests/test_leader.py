@@ -0,0 +1,162 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import utils.recorder as recorder
+from models import RadioStation, Recording, SchedulerLease
+from utils.leader import SchedulerLeader
+
+
+class Events:
+    """Records the leadership callbacks of one process."""
+
+    def __init__(self):
+        self.calls = []
+
+    def callbacks(self):
+        return {
+            'on_elected': lambda: self.calls.append('elected'),
+            'on_deposed': lambda: self.calls.append('deposed')
+        }
+
+class FakeCapture:
+    """A capture whose exit handler runs as soon as it is asked to stop."""
+
+    def __init__(self, registry, recording_id, exits=True):
+        self.registry = registry
+        self.recording_id = recording_id
+        self.exits = exits
+        self.signals = []
+
+    def terminate(self):
+        self.signals.append('terminate')
+        if self.exits:
+            self.registry.remove(self.recording_id)
+
+    def kill(self):
+        self.signals.append('kill')
+
+class FakeTimer:
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+@pytest.fixture
+def leaders(session):
+    started = []
+
+    def start(lease_seconds=30, renew_interval=0.1):
+        leader = SchedulerLeader(lease_seconds, renew_interval)
+        events = Events()
+        leader.start(**events.callbacks())
+        started.append(leader)
+        return leader, events
+
+    yield start
+    for leader in started:
+        leader.stop()
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = recorder.RecordingRegistry()
+    monkeypatch.setattr(recorder, 'active_recordings', registry)
+    return registry
+
+def _recording(session, path, **fields):
+    station = RadioStation(name='Station', url='http://example.com/stream')
+    recording = Recording(name='Show', station=station, start_time=datetime.now(), duration=60,
+                          local_path=str(path), **fields)
+    session.add(recording)
+    session.commit()
+    return recording.id
+
+
+def test_only_one_process_leads(leaders):
+    first, first_events = leaders()
+    second, second_events = leaders()
+
+    assert first.is_leader
+    assert first_events.calls == ['elected']
+    assert not second.is_leader
+    assert second_events.calls == []
+
+def test_released_lease_is_taken_over(leaders):
+    first, _ = leaders()
+    second, second_events = leaders()
+
+    first.stop()
+
+    assert _wait_for(lambda: second.is_leader)
+    assert second_events.calls == ['elected']
+
+def test_expired_lease_fails_over_and_deposes_old_leader(leaders, session):
+    first, first_events = leaders(renew_interval=60)
+    second, _ = leaders()
+
+    # The leader stopped renewing, e.g. because its process hung
+    session.query(SchedulerLease).filter_by(id=1).update(
+        {SchedulerLease.expires_at: datetime.utcnow() - timedelta(seconds=1)}
+    )
+    session.commit()
+
+    assert _wait_for(lambda: second.is_leader)
+    first._heartbeat()
+    assert not first.is_leader
+    assert first_events.calls == ['elected', 'deposed']
+
+def test_deposed_leader_stops_its_captures(registry, monkeypatch):
+    monkeypatch.setattr(recorder, 'HAND_OVER_TIMEOUT', 0.2)
+    running = FakeCapture(registry, 1)
+    stuck = FakeCapture(registry, 2, exits=False)
+    adopted = FakeCapture(registry, 3)
+    timer = FakeTimer()
+    registry.add(1, process=running)
+    registry.add(2, process=stuck)
+    registry.add(3, process=adopted, adopted=True)
+    registry.add(4, preroll=timer)
+
+    recorder.hand_over_recordings()
+
+    assert running.signals == ['terminate']
+    assert stuck.signals == ['terminate', 'kill']
+    # Another process's capture is left for the new leader to adopt
+    assert adopted.signals == []
+    assert timer.cancelled
+    assert 3 not in registry and 4 not in registry
+
+def test_handed_over_capture_is_kept_for_the_new_leader(registry, session, tmp_path):
+    output_file = tmp_path / 'show.mp3'
+    output_file.write_bytes(b'audio')
+    recording_id = _recording(session, output_file, status='recording', process_id=1234)
+    registry.add(recording_id, handed_over=True)
+
+    recorder.handle_recording_exit(recording_id, 255, '', str(output_file), False)
+
+    recording = session.get(Recording, recording_id)
+    assert recording.status == 'recording'
+    assert recording.process_id is None
+    assert [part.file_path for part in recording.parts] == [str(tmp_path / 'show-part1.mp3')]
+    assert recording_id not in registry
+
+def test_new_leader_resumes_an_adopted_capture_once_it_ends(registry, session, tmp_path, monkeypatch):
+    resumed = []
+    monkeypatch.setattr(recorder, 'resume_recording', resumed.append)
+    monkeypatch.setattr(recorder, 'is_process_running', lambda pid: False)
+    recording_id = _recording(session, tmp_path / 'show.mp3', status='recording', process_id=1234)
+    registry.add(recording_id, process=recorder.DummyProcess(1234), adopted=True)
+
+    recorder.check_active_recordings()
+
+    assert resumed == [recording_id]
+    assert recording_id not in registry
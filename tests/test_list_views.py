@@ -0,0 +1,39 @@
+from datetime import datetime, time, timedelta
+
+import pytest
+
+from models import RadioStation, Recording, RecurringRecording, Podcast, PodcastEpisode
+
+
+def _seed(session, count):
+    station = RadioStation(name='Station', url='http://example.com/stream')
+    for index in range(count):
+        recurring = RecurringRecording(name=f'Show {index}', station=station, schedule_type='daily',
+                                       start_time=time(9, 0), duration=60, create_podcast=True)
+        podcast = Podcast(title=f'Show {index}', recurring_recording=recurring)
+        for run in range(2):
+            recording = Recording(name=f'Show {index}', station=station, duration=60, status='completed',
+                                  start_time=datetime(2024, 1, 1, 9) + timedelta(days=run))
+            recurring.recordings.append(recording)
+            podcast.episodes.append(PodcastEpisode(title=f'Episode {run}', file_path=f'/tmp/{index}-{run}.mp3',
+                                                   recording=recording, publication_date=recording.start_time))
+        session.add(podcast)
+        # A podcast without a recurring recording
+        session.add(Podcast(title=f'Other {index}'))
+    session.commit()
+
+def _statements(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    return int(response.headers['X-SQL-Statements'])
+
+
+@pytest.mark.parametrize('path', ['/recurring', '/podcasts'])
+def test_list_query_count_does_not_grow_with_rows(client, session, path):
+    _seed(session, 1)
+    few = _statements(client, path)
+
+    _seed(session, 10)
+    many = _statements(client, path)
+
+    assert many == few
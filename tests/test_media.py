@@ -0,0 +1,35 @@
+from collections import namedtuple
+
+from utils.media import can_stream_copy, get_target_bitrate, estimate_recording_size
+from utils.recorder import get_encoding_params
+
+Probe = namedtuple('Probe', 'codec_name bit_rate sample_rate channels')
+
+
+def test_matching_codecs_are_stream_copied():
+    assert can_stream_copy('mp3', 'mp3')
+    assert can_stream_copy('vorbis', 'ogg')
+    assert can_stream_copy('opus', 'ogg')
+    assert not can_stream_copy('aac', 'mp3')
+    assert not can_stream_copy(None, 'mp3')
+
+def test_lossy_formats_are_not_encoded_above_the_source():
+    assert get_target_bitrate('mp3', 64000) == 64
+    assert get_target_bitrate('mp3', 100000) == 128
+    assert get_target_bitrate('mp3', 320000) is None
+    assert get_target_bitrate('flac', 64000) is None
+
+def test_encoding_params_follow_the_source_bitrate():
+    assert get_encoding_params('mp3') == ['-c:a', 'libmp3lame', '-q:a', '2']
+    assert get_encoding_params('mp3', 64000) == ['-c:a', 'libmp3lame', '-b:a', '64k']
+    assert get_encoding_params('ogg', 96000) == ['-c:a', 'libvorbis', '-b:a', '96k']
+    assert get_encoding_params('wav', 64000) == ['-c:a', 'pcm_s16le']
+
+def test_stream_copied_size_uses_the_station_bitrate():
+    probe = Probe('mp3', 128000, 44100, 2)
+
+    assert estimate_recording_size('mp3', 60, probe, stream_copy=True) == 128000 * 60 // 8
+    # Re-encoding a 128k station stays at 128k
+    assert estimate_recording_size('mp3', 60, probe) == 128000 * 60 // 8
+    assert estimate_recording_size('mp3', 60) == 190000 * 60 // 8
+    assert estimate_recording_size('wav', 1, Probe('pcm', None, 48000, 1)) == 48000 * 16 // 8
@@ -0,0 +1,87 @@
+import json
+import base64
+from datetime import datetime, timedelta
+
+from models import RadioStation, Recording
+from utils.pagination import KeysetPage, encode_cursor, decode_cursor
+
+
+def _add_recordings(session, count):
+    station = RadioStation(name='Station', url='http://example.com/stream')
+    session.add(station)
+    session.flush()
+
+    start = datetime(2024, 1, 1, 8, 0)
+    for index in range(count):
+        # Pairs share a start time, so the ID has to break ties
+        session.add(Recording(
+            name=f'Show {index}',
+            station_id=station.id,
+            start_time=start + timedelta(hours=index // 2),
+            duration=60
+        ))
+    session.commit()
+
+def _page(after=None, before=None, per_page=3):
+    return KeysetPage(Recording.query, Recording.start_time, Recording.id, 'start_time',
+                      descending=True, per_page=per_page, after=after, before=before)
+
+def _expected_order():
+    return [r.id for r in Recording.query.order_by(Recording.start_time.desc(), Recording.id.desc())]
+
+
+def test_cursor_round_trip():
+    moment = datetime(2024, 5, 6, 7, 8, 9)
+    assert decode_cursor(encode_cursor(moment, 12)) == (moment, 12)
+    assert decode_cursor(encode_cursor('Show', 3)) == ('Show', 3)
+
+def test_invalid_cursor_is_ignored():
+    assert decode_cursor('not a cursor') is None
+
+def test_cursor_values_must_be_comparable():
+    def cursor(payload):
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    assert decode_cursor(cursor(['v', None, 3])) == (None, 3)
+    assert decode_cursor(cursor(['v', 1.5, 3])) == (1.5, 3)
+    for payload in (['v', [1, 2], 3], ['v', {'a': 1}, 3], ['v', True, 3], ['v', 'x', '3'],
+                    ['dt', 5, 3], ['x', 'a', 3], {'v': 1, 'a': 2, 'b': 3}, ['v', 1]):
+        assert decode_cursor(cursor(payload)) is None, payload
+
+def test_pages_forward_cover_every_row_once(session):
+    _add_recordings(session, 8)
+
+    seen = []
+    page = _page()
+    assert not page.has_prev
+    while True:
+        seen.extend(row.id for row in page.items)
+        if not page.has_next:
+            break
+        page = _page(after=page.next_cursor)
+
+    assert seen == _expected_order()
+    assert page.next_cursor is None
+
+def test_previous_page_mirrors_next(session):
+    _add_recordings(session, 8)
+
+    first = _page()
+    second = _page(after=first.next_cursor)
+    back = _page(before=second.prev_cursor)
+
+    assert [row.id for row in back.items] == [row.id for row in first.items]
+    assert not back.has_prev
+    assert back.has_next
+
+def test_invalid_cursor_shows_first_page(session):
+    _add_recordings(session, 5)
+    nested = encode_cursor([1, 2], 3)
+
+    assert [row.id for row in _page(after='garbage').items] == _expected_order()[:3]
+    assert [row.id for row in _page(after=nested).items] == _expected_order()[:3]
+
+def test_recordings_list_ignores_malformed_cursors(client):
+    for after in (encode_cursor([1, 2], 3), encode_cursor({'a': 1}, 3), 'garbage'):
+        response = client.get('/recordings', query_string={'after': after, 'sort_by': 'name'})
+        assert response.status_code == 200
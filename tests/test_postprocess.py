@@ -0,0 +1,88 @@
+import time
+from datetime import datetime
+
+import pytest
+
+import utils.postprocess as postprocess
+from models import RadioStation, Recording
+from utils.postprocess import PostProcessor, StepAborted
+
+
+@pytest.fixture
+def processor():
+    return PostProcessor(workers=4, heavy_slots=1, niceness=0)
+
+@pytest.fixture
+def ran(monkeypatch):
+    ran = []
+
+    def step(name):
+        def run(session, recording):
+            ran.append(name)
+        return run
+
+    monkeypatch.setattr(postprocess, 'STEP_FUNCTIONS', {name: step(name) for name in postprocess.COMPLETION_STEPS})
+    return ran
+
+def _recording(session, processor, steps=postprocess.COMPLETION_STEPS):
+    station = RadioStation(name='Station', url='http://example.com/stream')
+    recording = Recording(name='Show', station=station, start_time=datetime.now(), duration=60, status='processing')
+    session.add(recording)
+    processor.enqueue(session, recording, steps)
+    session.commit()
+    return recording
+
+def _statuses(recording):
+    return [(step.step, step.status) for step in recording.post_process_steps]
+
+
+def test_steps_run_in_order(session, processor, ran):
+    recording = _recording(session, processor)
+
+    processor._run_pending_steps(session, recording.id)
+
+    assert ran == postprocess.COMPLETION_STEPS
+    assert {status for step, status in _statuses(recording)} == {'done'}
+
+def test_aborted_step_skips_the_rest(session, processor, ran, monkeypatch):
+    def abort(session, recording):
+        raise StepAborted('no file')
+    monkeypatch.setitem(postprocess.STEP_FUNCTIONS, 'finalize', abort)
+    recording = _recording(session, processor)
+
+    processor._run_pending_steps(session, recording.id)
+
+    assert ran == []
+    assert _statuses(recording) == [('finalize', 'failed')] + [(step, 'skipped') for step in postprocess.COMPLETION_STEPS[1:]]
+
+def test_failed_step_is_retried_later(session, processor, ran, monkeypatch):
+    retries = []
+    monkeypatch.setattr(processor, '_retry_later', retries.append)
+    def fail(session, recording):
+        raise OSError('disk busy')
+    monkeypatch.setitem(postprocess.STEP_FUNCTIONS, 'copy', fail)
+    recording = _recording(session, processor)
+
+    processor._run_pending_steps(session, recording.id)
+
+    assert ran == ['finalize']
+    assert _statuses(recording)[1] == ('copy', 'pending')
+    assert recording.post_process_steps[1].error == 'disk busy'
+    assert retries == [recording.id]
+
+def test_heavy_tasks_share_the_heavy_slots(processor):
+    running = []
+    peak = []
+
+    def task():
+        running.append(1)
+        peak.append(len(running))
+        time.sleep(0.05)
+        running.pop()
+
+    for _ in range(4):
+        processor.run_heavy(task)
+    processor._executor.shutdown(wait=True)
+
+    assert len(peak) == 4
+    assert max(peak) == 1
@@ -0,0 +1,74 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import utils.prober as prober
+import utils.recorder as recorder
+from models import RadioStation, StationProbe
+
+URL = 'http://example.com/stream'
+
+
+@pytest.fixture
+def station(session):
+    station = RadioStation(name='Station', url=URL)
+    session.add(station)
+    session.commit()
+    return station
+
+@pytest.fixture
+def later(monkeypatch):
+    calls = []
+    monkeypatch.setattr(recorder, 'probe_station_later', lambda *args: calls.append(args))
+    return calls
+
+def _probe(station, age, **fields):
+    return StationProbe(station_id=station.id, url=URL, reachable=True, codec_name='mp3',
+                        probed_at=datetime.utcnow() - age, **fields)
+
+
+def test_recent_probe_is_used(session, station, later):
+    session.add(_probe(station, timedelta(minutes=5), bit_rate=128000))
+    session.commit()
+
+    probe = recorder.get_station_probe(session, station.id, URL, 'ffmpeg')
+
+    assert probe.bit_rate == 128000
+    assert later == []
+
+def test_missing_probe_does_not_delay_the_recording(session, station, later):
+    session.add(_probe(station, timedelta(days=30)))
+    session.commit()
+
+    assert recorder.get_station_probe(session, station.id, URL, 'ffmpeg') is None
+    assert later == [(station.id, URL, 'ffmpeg')]
+
+def test_background_probe_is_stored_once(session, station, monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    def sample(station_id, stream_url, ffmpeg_path):
+        calls.append(station_id)
+        release.wait(5)
+        return {'station_id': station_id, 'url': stream_url, 'probed_at': datetime.utcnow(),
+                'reachable': True, 'codec_name': 'aac', 'bit_rate': 64000}
+
+    monkeypatch.setattr(prober, 'sample_station', sample)
+    prober.probe_station_later(station.id, URL, 'ffmpeg')
+    prober.probe_station_later(station.id, URL, 'ffmpeg')
+    release.set()
+    deadline = time.monotonic() + 5
+    while prober._pending and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert calls == [station.id]
+    session.expire_all()
+    assert session.query(StationProbe).filter_by(codec_name='aac').count() == 1
+
+def test_latest_probe_of_each_station(session, station):
+    session.add_all([_probe(station, timedelta(hours=2), bit_rate=1), _probe(station, timedelta(hours=1), bit_rate=2)])
+    session.commit()
+
+    assert prober.get_latest_probes(session)[station.id].bit_rate == 2
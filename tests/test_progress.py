@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import utils.recorder as recorder
+from config import Config
+
+
+class FakeProcess:
+    def __init__(self):
+        self.signals = []
+
+    def terminate(self):
+        self.signals.append('terminate')
+
+    def kill(self):
+        self.signals.append('kill')
+
+class FakeStatusWriter:
+    def __init__(self):
+        self.updates = []
+
+    def update(self, model, row_id, **fields):
+        self.updates.append((row_id, fields))
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = recorder.RecordingRegistry()
+    monkeypatch.setattr(recorder, 'active_recordings', registry)
+    return registry
+
+@pytest.fixture
+def status_writer(monkeypatch):
+    writer = FakeStatusWriter()
+    monkeypatch.setattr(recorder, 'status_writer', writer)
+    return writer
+
+def _report(tracker, **values):
+    for key, value in values.items():
+        tracker.feed(f'{key}={value}'.encode())
+    tracker.feed(b'progress=continue')
+
+
+def test_progress_blocks_are_parsed(registry, status_writer):
+    registry.add(1)
+    tracker = recorder.ProgressTracker(1)
+
+    _report(tracker, out_time='00:01:02.500000', total_size=4096, bitrate='128.0kbits/s')
+
+    progress = registry.get(1)['progress']
+    assert progress['out_time'] == 62.5
+    assert progress['total_size'] == 4096
+    assert progress['bitrate'] == 128.0
+    assert status_writer.updates == [(1, {'file_size': 4096})]
+
+def test_only_growth_moves_last_growth(registry, status_writer):
+    registry.add(1)
+    tracker = recorder.ProgressTracker(1)
+
+    _report(tracker, out_time='00:00:01.000000', total_size=100)
+    first = registry.get(1)['last_growth']
+    _report(tracker, out_time='00:00:01.000000', total_size=100)
+
+    assert registry.get(1)['last_growth'] == first
+    assert len(status_writer.updates) == 1
+
+def test_start_latency_is_measured_once(registry, status_writer):
+    registry.add(1)
+    tracker = recorder.ProgressTracker(1, scheduled_start=datetime.now() - timedelta(seconds=12))
+
+    _report(tracker, out_time='00:00:10.000000', total_size=100)
+    latency = registry.get(1)['start_latency']
+    _report(tracker, out_time='00:00:20.000000', total_size=200)
+
+    assert latency == pytest.approx(2, abs=0.5)
+    assert registry.get(1)['start_latency'] == latency
+
+def test_stalled_capture_is_terminated_then_killed(registry, monkeypatch):
+    process = FakeProcess()
+    now = [1000.0]
+    monkeypatch.setattr(recorder.time, 'monotonic', lambda: now[0])
+    registry.add(1, process=process, last_growth=now[0])
+
+    recorder.check_stalled_recordings()
+    assert process.signals == []
+
+    now[0] += Config.RECORDING_STALL_TIMEOUT + 1
+    recorder.check_stalled_recordings()
+    assert process.signals == ['terminate']
+    assert registry.get(1)['interrupted']
+
+    now[0] += recorder.STALL_KILL_GRACE + 1
+    recorder.check_stalled_recordings()
+    assert process.signals == ['terminate', 'kill']
+
+def test_adopted_captures_are_not_watched(registry, monkeypatch):
+    process = FakeProcess()
+    monkeypatch.setattr(recorder.time, 'monotonic', lambda: 10 ** 6)
+    registry.add(1, process=process)
+
+    recorder.check_stalled_recordings()
+
+    assert process.signals == []
+
+def test_segmented_captures_grow_by_audio_captured(registry, status_writer, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(recorder.time, 'monotonic', lambda: now[0])
+    registry.add(1)
+    tracker = recorder.ProgressTracker(1)
+
+    _report(tracker, out_time='00:00:01.000000', total_size='N/A')
+    now[0] += 5
+    _report(tracker, out_time='00:00:02.000000', total_size='N/A')
+
+    assert registry.get(1)['last_growth'] == 1005.0
+    assert status_writer.updates == []
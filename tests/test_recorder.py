@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+import utils.recorder as recorder
+from config import Config
+from models import Recording
+
+
+def _join_files(paths, output_file, ffmpeg_path):
+    # Stands in for FFmpeg's concat demuxer, which joins without re-encoding
+    with open(output_file, 'wb') as output:
+        for path in paths:
+            with open(path, 'rb') as f:
+                output.write(f.read())
+    return True
+
+def _write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+@pytest.fixture
+def concat(monkeypatch):
+    calls = []
+
+    def fake_concat(paths, output_file, ffmpeg_path):
+        calls.append(list(paths))
+        return _join_files(paths, output_file, ffmpeg_path)
+
+    monkeypatch.setattr(recorder, 'concat_files', fake_concat)
+    return calls
+
+
+def test_segment_numbering_continues_after_a_restart(tmp_path):
+    segment_dir = str(tmp_path)
+    args = recorder.get_segment_output_args(segment_dir, 'aac')
+    assert args[args.index('-segment_format') + 1] == 'adts'
+    assert args[args.index('-segment_time') + 1] == str(Config.SEGMENT_SECONDS)
+    assert args[args.index('-segment_start_number') + 1] == '0'
+    assert args[-1] == os.path.join(segment_dir, 'seg-%05d.aac')
+
+    for number in range(3):
+        _write(tmp_path / f'seg-{number:05d}.aac', b'x')
+    args = recorder.get_segment_output_args(segment_dir, 'aac')
+    assert args[args.index('-segment_start_number') + 1] == '3'
+
+def test_segments_are_assembled_in_order_and_removed(tmp_path, concat):
+    segment_dir = tmp_path / '.segments' / 'recording-1'
+    segment_dir.mkdir(parents=True)
+    # Listed out of order, and with a stray file
+    for number, data in ((10, b'c'), (2, b'b'), (1, b'a')):
+        _write(segment_dir / f'seg-{number:05d}.mp3', data)
+    _write(segment_dir / 'list.txt', b'')
+    output_file = str(tmp_path / 'show.mp3')
+
+    assert recorder.assemble_segments(str(segment_dir), output_file, 'ffmpeg')
+
+    with open(output_file, 'rb') as f:
+        assert f.read() == b'abc'
+    assert not segment_dir.exists()
+
+def test_no_segments_leaves_nothing_assembled(tmp_path, concat):
+    assert not recorder.assemble_segments(str(tmp_path / 'missing'), str(tmp_path / 'show.mp3'), 'ffmpeg')
+    assert concat == []
+
+def test_interrupted_captures_become_numbered_parts(tmp_path):
+    recording = Recording()
+    output_file = str(tmp_path / 'show.mp3')
+
+    for data in (b'first', b'second'):
+        _write(output_file, data)
+        recorder.save_partial_file(recording, output_file)
+
+    assert [part.sequence for part in recording.parts] == [1, 2]
+    assert [os.path.basename(part.file_path) for part in recording.parts] == ['show-part1.mp3', 'show-part2.mp3']
+    assert recording.parts[1].file_size == len(b'second')
+    assert not os.path.exists(output_file)
+
+def test_parts_and_last_capture_are_merged_in_order(tmp_path, concat):
+    recording = Recording()
+    output_file = str(tmp_path / 'show.mp3')
+    for data in (b'one-', b'two-'):
+        _write(output_file, data)
+        recorder.save_partial_file(recording, output_file)
+    part_paths = [part.file_path for part in recording.parts]
+    _write(output_file, b'three')
+
+    assert recorder.merge_recording_parts(recording, output_file, 'ffmpeg')
+
+    with open(output_file, 'rb') as f:
+        assert f.read() == b'one-two-three'
+    assert concat == [part_paths + [output_file]]
+    assert not any(os.path.exists(path) for path in part_paths)
+    assert recording.parts == []
+
+def test_single_part_is_renamed_without_ffmpeg(tmp_path, concat):
+    recording = Recording()
+    output_file = str(tmp_path / 'show.mp3')
+    _write(output_file, b'only')
+    recorder.save_partial_file(recording, output_file)
+
+    assert recorder.merge_recording_parts(recording, output_file, 'ffmpeg')
+
+    with open(output_file, 'rb') as f:
+        assert f.read() == b'only'
+    assert concat == []
+
+def test_nothing_to_merge_without_parts(tmp_path, concat):
+    output_file = str(tmp_path / 'show.mp3')
+    _write(output_file, b'whole')
+
+    assert not recorder.merge_recording_parts(Recording(), output_file, 'ffmpeg')
+    assert concat == []
@@ -0,0 +1,66 @@
+import pytest
+
+import utils.resolver as resolver
+from utils.resolver import StreamResolver, parse_playlist
+
+BASE = 'http://example.com/radio/'
+
+
+def test_pls_entries_are_listed_in_order():
+    text = '[playlist]\nNumberOfEntries=2\nFile1=http://a.example.com/live\nTitle1=A\nFile2=backup\n'
+
+    assert parse_playlist(text, BASE + 'station.pls') == ['http://a.example.com/live', BASE + 'backup']
+
+def test_m3u_comments_are_skipped():
+    text = '#EXTM3U\n#EXTINF:-1,Station\nhttp://a.example.com/live\n\nlow.mp3\n'
+
+    assert parse_playlist(text, BASE + 'station.m3u') == ['http://a.example.com/live', BASE + 'low.mp3']
+
+def test_hls_variants_are_ranked_by_bandwidth():
+    text = ('#EXTM3U\n'
+            '#EXT-X-STREAM-INF:BANDWIDTH=64000\nlow.m3u8\n'
+            '#EXT-X-STREAM-INF:BANDWIDTH=256000\nhigh.m3u8\n')
+
+    assert parse_playlist(text, BASE + 'master.m3u8') == [BASE + 'high.m3u8', BASE + 'low.m3u8']
+
+def test_hls_media_playlist_is_the_stream_itself():
+    text = '#EXTM3U\n#EXT-X-TARGETDURATION:10\n#EXTINF:10,\nseg1.aac\n'
+
+    assert parse_playlist(text, BASE + 'media.m3u8') == []
+
+@pytest.fixture
+def network(monkeypatch):
+    calls = {'expand': 0}
+    latencies = {}
+
+    def expand(self, url, depth=0):
+        calls['expand'] += 1
+        return ['http://slow.example.com/live', 'http://dead.example.com/live', 'http://fast.example.com/live']
+
+    monkeypatch.setattr(StreamResolver, '_expand', expand)
+    monkeypatch.setattr(resolver, 'measure_connect_latency', lambda url: latencies.get(url))
+    latencies.update({'http://slow.example.com/live': 0.5, 'http://fast.example.com/live': 0.1})
+    return calls
+
+def test_fastest_live_entry_is_chosen_and_cached(network):
+    stream_resolver = StreamResolver()
+
+    assert stream_resolver.resolve(1, BASE + 'station.pls') == 'http://fast.example.com/live'
+    assert stream_resolver.resolve(1, BASE + 'station.pls') == 'http://fast.example.com/live'
+    assert network['expand'] == 1
+
+def test_changed_url_or_invalidation_resolves_again(network):
+    stream_resolver = StreamResolver()
+    stream_resolver.resolve(1, BASE + 'station.pls')
+
+    stream_resolver.resolve(1, BASE + 'other.pls')
+    stream_resolver.invalidate(1)
+    stream_resolver.resolve(1, BASE + 'other.pls')
+
+    assert network['expand'] == 3
+
+def test_direct_stream_is_used_as_is(monkeypatch):
+    monkeypatch.setattr(StreamResolver, '_expand', lambda self, url, depth=0: [url])
+    monkeypatch.setattr(resolver, 'measure_connect_latency', lambda url: pytest.fail('should not be timed'))
+
+    assert StreamResolver().resolve(1, 'http://example.com/live') == 'http://example.com/live'
@@ -0,0 +1,92 @@
+import threading
+from datetime import datetime, time
+
+import pytest
+from apscheduler.triggers.cron import CronTrigger
+
+import utils.recorder as recorder
+from models import RadioStation, Recording, RecurringRecording
+from utils.scheduling import PrerollTrigger, build_recurring_trigger, get_next_start, get_scheduled_start
+
+
+class FakeJob:
+    def __init__(self, trigger, now):
+        self.trigger = trigger
+        self.next_run_time = trigger.get_next_fire_time(None, now)
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = recorder.RecordingRegistry()
+    monkeypatch.setattr(recorder, 'active_recordings', registry)
+    return registry
+
+@pytest.fixture
+def launched(monkeypatch):
+    launched = []
+    monkeypatch.setattr(recorder, 'launch_capture', lambda recording_data, cmd, feed=None: launched.append(recording_data['id']))
+    return launched
+
+def _recording(session, status):
+    station = RadioStation(name='Station', url='http://example.com/stream')
+    recording = Recording(name='Show', station=station, start_time=datetime.now(), duration=60, status=status)
+    session.add(recording)
+    session.commit()
+    return recording
+
+
+def test_preroll_fires_before_each_start():
+    trigger = PrerollTrigger(CronTrigger(hour=9, minute=0), 15)
+    now = datetime(2024, 1, 1, 8, 0).astimezone()
+
+    fire_time = trigger.get_next_fire_time(None, now)
+    assert fire_time.strftime('%H:%M:%S') == '08:59:45'
+    # The next run is a day later, not the same start again
+    assert trigger.get_next_fire_time(fire_time, fire_time).strftime('%d %H:%M:%S') == '02 08:59:45'
+
+def test_preroll_job_reports_the_start_time():
+    job = FakeJob(PrerollTrigger(CronTrigger(hour=9, minute=0), 15), datetime(2024, 1, 1, 8, 0).astimezone())
+
+    assert get_next_start(job).strftime('%H:%M:%S') == '09:00:00'
+
+def test_occurrence_due_in_the_preroll_is_found():
+    recurring = RecurringRecording(start_time=time(0, 0))
+
+    assert get_scheduled_start(recurring, datetime(2024, 1, 1, 23, 59, 50)) == datetime(2024, 1, 2, 0, 0)
+
+def test_unknown_schedule_type_is_refused():
+    recurring = RecurringRecording(id=1, schedule_type='hourly', start_time=time(9, 0))
+
+    with pytest.raises(ValueError):
+        build_recurring_trigger(recurring)
+
+def test_capture_launches_after_preroll(session, registry, launched):
+    recording = _recording(session, 'recording')
+    registry.add(recording.id, starting=True)
+
+    recorder.launch_after_preroll({'id': recording.id}, [])
+
+    assert launched == [recording.id]
+
+def test_deleted_recording_is_not_launched_after_preroll(session, registry, launched):
+    recording = _recording(session, 'recording')
+    recording_id = recording.id
+    registry.add(recording_id, starting=True)
+    session.delete(recording)
+    session.commit()
+
+    recorder.launch_after_preroll({'id': recording_id}, [])
+
+    assert launched == []
+    assert recording_id not in registry
+
+def test_cancelled_preroll_never_launches(registry):
+    fired = threading.Event()
+    timer = threading.Timer(0.2, fired.set)
+    registry.add(1, starting=True, preroll=timer)
+    timer.start()
+
+    assert recorder.cancel_preroll(1)
+
+    assert not fired.wait(0.5)
+    assert 1 not in registry
+    assert not recorder.cancel_preroll(1)
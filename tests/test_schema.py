@@ -0,0 +1,61 @@
+from sqlalchemy import create_engine, inspect, text
+
+from models import db
+from utils.schema import MIGRATIONS, run_migrations, check_query_plans
+
+# The recording table as the first release created it
+FIRST_RELEASE_RECORDING = """
+    CREATE TABLE recording (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        station_id INTEGER NOT NULL,
+        start_time DATETIME NOT NULL,
+        duration INTEGER NOT NULL,
+        file_name VARCHAR(255),
+        local_path VARCHAR(255),
+        status VARCHAR(20),
+        file_size INTEGER,
+        format VARCHAR(10)
+    )
+"""
+
+
+def _first_release_engine(path):
+    engine = create_engine(f'sqlite:///{path}')
+    tables = [table for table in db.metadata.sorted_tables if table.name != 'recording']
+    db.metadata.create_all(engine, tables=tables)
+    with engine.begin() as connection:
+        connection.execute(text(FIRST_RELEASE_RECORDING))
+        # An index later found redundant
+        connection.execute(text('CREATE INDEX ix_recording_status ON recording (status)'))
+    return engine
+
+def _recording_indexes(engine):
+    return {index['name'] for index in inspect(engine).get_indexes('recording')}
+
+
+def test_new_database_is_at_latest_version(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'new.db'}")
+    db.metadata.create_all(engine)
+
+    assert run_migrations(engine) == len(MIGRATIONS)
+    # A second start applies nothing
+    assert run_migrations(engine) == len(MIGRATIONS)
+    with engine.connect() as connection:
+        assert connection.execute(text('SELECT COUNT(*) FROM schema_version')).scalar() == len(MIGRATIONS)
+
+def test_old_database_gains_columns_and_indexes(tmp_path):
+    engine = _first_release_engine(tmp_path / 'old.db')
+
+    assert run_migrations(engine) == len(MIGRATIONS)
+
+    columns = {column['name'] for column in inspect(engine).get_columns('recording')}
+    assert {'recorded_duration', 'start_latency', 'file_mtime', 'file_missing'} <= columns
+    indexes = _recording_indexes(engine)
+    assert 'ix_recording_status_start_time' in indexes
+    assert 'ix_recording_start_time' in indexes
+    assert 'ix_recording_status' not in indexes
+
+def test_hot_queries_use_indexes(session):
+    for name, plan, problems in check_query_plans(session):
+        assert not problems, f'{name}: {plan}'
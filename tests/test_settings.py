@@ -0,0 +1,57 @@
+import pytest
+
+import utils.db as db_module
+import utils.settings as settings
+from models import AppSettings, SettingsVersion
+from utils.settings import SettingsCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = SettingsCache(check_interval=60)
+    monkeypatch.setattr(settings, 'settings_cache', cache)
+    return cache
+
+@pytest.fixture
+def loads(monkeypatch):
+    loads = []
+    original = db_module.get_db_session
+
+    def get_db_session():
+        loads.append(1)
+        return original()
+
+    monkeypatch.setattr(db_module, 'get_db_session', get_db_session)
+    return loads
+
+
+def test_settings_are_loaded_once(session, cache, loads):
+    session.add(AppSettings(key='default_audio_format', value='ogg'))
+    session.commit()
+
+    assert AppSettings.get('default_audio_format') == 'ogg'
+    assert AppSettings.get('missing', 'mp3') == 'mp3'
+    assert len(loads) == 1
+
+def test_own_writes_apply_without_a_reload(session, cache, loads):
+    AppSettings.get('default_audio_format')
+
+    AppSettings.set('default_audio_format', 'flac')
+
+    assert AppSettings.get('default_audio_format') == 'flac'
+    assert len(loads) == 1
+
+def test_other_processes_writes_are_picked_up_after_the_check_interval(session, cache):
+    setting = AppSettings(key='default_audio_format', value='mp3')
+    session.add(setting)
+    session.commit()
+    assert cache.get('default_audio_format') == 'mp3'
+
+    # As another process writes it
+    setting.value = 'aac'
+    SettingsVersion.bump(session)
+    session.commit()
+    assert cache.get('default_audio_format') == 'mp3'
+
+    cache._next_check = 0
+    assert cache.get('default_audio_format') == 'aac'
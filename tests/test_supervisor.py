@@ -0,0 +1,80 @@
+import sys
+import threading
+import subprocess
+
+import pytest
+
+from utils.supervisor import ProcessSupervisor, RingBuffer
+
+
+def _spawn(code):
+    return subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+@pytest.fixture
+def supervisor():
+    return ProcessSupervisor(max_output_lines=3, tick=0.05)
+
+
+def test_ring_buffer_keeps_the_last_lines():
+    buffer = RingBuffer(max_lines=2)
+
+    assert buffer.feed(b'one\ntwo\rthree\npart') == [b'one', b'two', b'three']
+    assert buffer.text() == 'two\nthree\npart'
+
+def test_ring_buffer_splits_endless_lines():
+    buffer = RingBuffer()
+
+    assert buffer.feed(b'x' * 5000) == [b'x' * 5000]
+    assert buffer.feed(b'y\n') == [b'y']
+
+def test_exit_is_reported_with_stdout_lines_and_stderr_tail(supervisor):
+    lines = []
+    exited = threading.Event()
+    result = {}
+
+    def on_exit(key, returncode, stderr_output):
+        result.update(key=key, returncode=returncode, stderr=stderr_output)
+        exited.set()
+
+    code = ("import sys\n"
+            "print('out1'); print('out2')\n"
+            "for i in range(5): print(f'err{i}', file=sys.stderr)\n"
+            "sys.exit(3)")
+    supervisor.watch('capture', _spawn(code), on_exit, on_stdout=lines.append)
+
+    assert exited.wait(10)
+    assert result == {'key': 'capture', 'returncode': 3, 'stderr': 'err2\nerr3\nerr4'}
+    assert lines == [b'out1', b'out2']
+    assert not supervisor.is_watching('capture')
+
+def test_raw_stdout_is_passed_through_unsplit(supervisor):
+    chunks = []
+    exited = threading.Event()
+
+    code = "import sys; sys.stdout.buffer.write(b'a\\nb\\rc')"
+    supervisor.watch('ingest', _spawn(code), lambda *args: exited.set(), on_stdout_data=chunks.append)
+
+    assert exited.wait(10)
+    assert b''.join(chunks) == b'a\nb\rc'
+
+def test_many_processes_share_one_loop(supervisor):
+    exits = []
+    done = threading.Event()
+
+    def on_exit(key, returncode, stderr_output):
+        exits.append(key)
+        if len(exits) == 10:
+            done.set()
+
+    for key in range(10):
+        supervisor.watch(key, _spawn('pass'), on_exit)
+
+    assert done.wait(10)
+    assert sorted(exits) == list(range(10))
+
+def test_periodic_tasks_run_on_the_loop(supervisor):
+    ran = threading.Event()
+    supervisor.add_periodic(0.05, ran.set)
+    supervisor.watch('sleeper', _spawn('import time; time.sleep(0.5)'), lambda *args: None)
+
+    assert ran.wait(5)
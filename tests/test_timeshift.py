@@ -0,0 +1,89 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import utils.timeshift as timeshift
+from config import Config
+from forms import RadioStationForm, TimeshiftForm
+from utils.timeshift import TimeshiftRing, SEGMENT_TIME_FORMAT
+
+
+@pytest.fixture
+def ring(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'RECORDINGS_DIR', str(tmp_path))
+    monkeypatch.setattr(Config, 'TIMESHIFT_SEGMENT_SECONDS', 600)
+    # One hour in ten-minute segments
+    return TimeshiftRing(1, 'http://example.com/stream', 'http://example.com/stream', 1, 'mp3', 'ffmpeg')
+
+def _segment(ring, start, extension='mp3'):
+    os.makedirs(ring.directory, exist_ok=True)
+    path = os.path.join(ring.directory, f'{start.strftime(SEGMENT_TIME_FORMAT)}.{extension}')
+    with open(path, 'wb') as f:
+        f.write(b'audio')
+    return path
+
+def _files(ring):
+    return sorted(os.listdir(ring.directory))
+
+
+def test_scan_keeps_only_what_the_ring_covers(ring):
+    now = datetime.now().replace(microsecond=0)
+    recent = [_segment(ring, now - timedelta(minutes=minutes)) for minutes in (25, 15, 5)]
+    _segment(ring, now - timedelta(hours=3))
+    _segment(ring, now - timedelta(minutes=35), 'aac')
+    with open(os.path.join(ring.directory, 'notes.txt'), 'w') as f:
+        f.write('stray')
+
+    ring._scan()
+
+    assert [segment.path for segment in ring.segments()] == recent
+    assert _files(ring) == sorted(os.path.basename(path) for path in recent)
+
+def test_scan_bounds_the_index(ring):
+    now = datetime.now().replace(microsecond=0)
+    paths = [_segment(ring, now - timedelta(minutes=minutes)) for minutes in range(65, 0, -5)]
+
+    ring._scan()
+
+    assert len(ring._index) == ring.max_segments == 6
+    assert [segment.path for segment in ring._index] == paths[-6:]
+    assert len(_files(ring)) == 6
+
+def test_new_segment_replaces_the_oldest(ring):
+    now = datetime.now().replace(microsecond=0)
+    for minutes in range(60, 0, -10):
+        _segment(ring, now - timedelta(minutes=minutes))
+    ring._scan()
+    oldest = ring._index[0].path
+
+    ring._segment_finished(_segment(ring, now).encode())
+
+    assert not os.path.exists(oldest)
+    assert len(_files(ring)) == 6
+
+def test_extract_trims_the_covering_segments(ring, monkeypatch):
+    calls = []
+    monkeypatch.setattr(timeshift, 'concat_files', lambda *args: calls.append(args) or True)
+    start = datetime.now().replace(microsecond=0) - timedelta(minutes=30)
+    paths = [_segment(ring, start + timedelta(minutes=minutes)) for minutes in (0, 10, 20)]
+    ring._scan()
+
+    assert ring.extract(start + timedelta(minutes=5), start + timedelta(minutes=12), 'out.mp3')
+
+    assert calls == [(paths[:2], 'out.mp3', 'ffmpeg', 300, 120)]
+
+@pytest.mark.parametrize('hours, valid', [(1, True), (168, True), (0, False), (1000, False)])
+def test_timeshift_hours_are_bounded(app, monkeypatch, hours, valid):
+    monkeypatch.setitem(app.config, 'WTF_CSRF_ENABLED', False)
+    with app.test_request_context():
+        form = RadioStationForm(MultiDict({'name': 'Station', 'url': 'http://example.com/stream', 'timeshift_hours': str(hours)}))
+        assert form.validate() == valid
+
+def test_timeshift_recording_needs_a_duration(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'WTF_CSRF_ENABLED', False)
+    with app.test_request_context():
+        form = TimeshiftForm(MultiDict({'name': 'Show', 'start_time': '2024-01-01T09:00', 'duration': '-5'}))
+        assert not form.validate()
+        assert 'duration' in form.errors
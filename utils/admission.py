@@ -0,0 +1,271 @@
+import os
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import psutil
+
+from models import Recording, RecurringRecording, StationProbe
+from utils.media import can_stream_copy
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Resources a capture uses: CPU in percent of one core, resident memory in
+# bytes and stream bandwidth in kbit/s
+CaptureCost = namedtuple('CaptureCost', ['cpu_percent', 'rss', 'kbps'])
+
+# Assumed costs until captures of each kind have been measured, keyed by
+# whether the capture stream-copies
+DEFAULT_COSTS = {
+    True: CaptureCost(2.0, 20 * 1024 * 1024, 128),
+    False: CaptureCost(15.0, 40 * 1024 * 1024, 128)
+}
+
+# Weight of each new measurement in the running cost averages
+COST_SMOOTHING = 0.2
+
+# How often running captures are measured, in seconds
+ADMISSION_SAMPLE_INTERVAL = 5
+
+# Seconds between admission attempts for a queued capture
+ADMISSION_RETRY_INTERVAL = 15
+
+# Upcoming occurrences of a recurring recording checked for overcommitment
+SCHEDULE_CHECK_OCCURRENCES = 7
+
+
+class AdmissionController:
+    """
+    Decide whether another capture fits within the configured budgets.
+
+    Running captures are measured with psutil and their progress reports,
+    and the averages per kind of capture are used to estimate the cost of
+    captures that have not started yet.
+    """
+
+    def __init__(self, registry):
+        self._registry = registry
+        # Reentrant, as admit() estimates costs while holding it
+        self._lock = threading.RLock()
+        self._averages = dict(DEFAULT_COSTS)
+        self._processes = {}
+        self._queued_since = {}
+
+    def sample(self):
+        """Measure the running captures and update the cost averages."""
+        entries = self._registry.snapshot()
+
+        for recording_id in list(self._processes):
+            if recording_id not in entries:
+                del self._processes[recording_id]
+
+        for recording_id, entry in entries.items():
+            pid = getattr(entry.get('process'), 'pid', None)
+            if pid is None:
+                continue
+            try:
+                process = self._processes.get(recording_id)
+                if process is None or process.pid != pid:
+                    # The first CPU reading of a process is meaningless
+                    process = self._processes[recording_id] = psutil.Process(pid)
+                    process.cpu_percent(None)
+                    continue
+                cpu_percent = process.cpu_percent(None)
+                rss = process.memory_info().rss
+            except psutil.Error:
+                self._processes.pop(recording_id, None)
+                continue
+
+            progress = entry.get('progress') or {}
+            kbps = progress.get('bitrate') or entry.get('kbps') or 0
+            cost = CaptureCost(cpu_percent, rss, kbps)
+            self._registry.update(recording_id, cost=cost)
+
+            stream_copy = entry.get('stream_copy', False)
+            with self._lock:
+                average = self._averages[stream_copy]
+                self._averages[stream_copy] = CaptureCost(*(
+                    old + COST_SMOOTHING * (new - old) for old, new in zip(average, cost)
+                ))
+
+    def estimate(self, stream_copy, kbps=None):
+        """Estimate the cost of a capture that has not started."""
+        with self._lock:
+            average = self._averages[bool(stream_copy)]
+        return average._replace(kbps=kbps or DEFAULT_COSTS[bool(stream_copy)].kbps)
+
+    def current_load(self):
+        """
+        Return the number of running captures and their combined cost. With a
+        shared ingest, bandwidth is counted once per station.
+        """
+        captures = self._running_captures()
+        return len(captures), self._combine(captures)
+
+    def admit(self, recording_id, stream_url, stream_copy, kbps=None):
+        """
+        Check whether a capture can start now, and reserve its estimated cost
+        if it can.
+
+        The reservation is a registry entry marked as starting, so captures
+        admitted at the same time, such as those due at the top of the hour,
+        count it before its FFmpeg runs. launch_capture replaces the entry,
+        and the caller removes it if the capture doesn't start.
+
+        Returns:
+            str: Why the capture has to wait, or None if it can start
+        """
+        with self._lock:
+            captures = self._running_captures()
+            estimate = self.estimate(stream_copy, kbps)
+            captures.append((stream_url, estimate))
+            reason = self._check_budgets(len(captures), self._combine(captures))
+            if reason:
+                self._queued_since.setdefault(recording_id, datetime.now())
+            else:
+                self._registry.add(
+                    recording_id,
+                    starting=True,
+                    stream_url=stream_url,
+                    stream_copy=bool(stream_copy),
+                    kbps=kbps,
+                    cost=estimate
+                )
+        return reason
+
+    def queued_since(self, recording_id):
+        """When a capture was first refused admission, or None."""
+        with self._lock:
+            return self._queued_since.get(recording_id)
+
+    def release(self, recording_id):
+        """Forget a capture's queueing once it has started or been rejected."""
+        with self._lock:
+            self._queued_since.pop(recording_id, None)
+
+    def check_schedule(self, session, job_id):
+        """
+        Check whether the time slots of a scheduled job would exceed the
+        capture budgets, counting every other scheduled job and running
+        capture that overlaps them.
+
+        Args:
+            session: Database session
+            job_id (str): Scheduler job ID of a one-off or recurring recording
+
+        Returns:
+            str: A warning describing the first overcommitted slot, or None
+        """
+        # Import scheduler at function level to avoid circular imports
+        from app import scheduler
+
+        job = scheduler.get_job(job_id)
+        if job is None or job.next_run_time is None:
+            return None
+
+        now = datetime.now(job.next_run_time.tzinfo)
+        slots = self._job_slots(session, job, now, now + timedelta(days=SCHEDULE_CHECK_OCCURRENCES * 31))
+        if not slots:
+            return None
+
+        horizon = max(end for start, end, _, _ in slots)
+        others = []
+        for other in scheduler.get_jobs():
+            if other.id != job_id:
+                others.extend(self._job_slots(session, other, now, horizon))
+        for entry in self._registry.snapshot().values():
+            cost = entry.get('cost') or self.estimate(entry.get('stream_copy'), entry.get('kbps'))
+            end_time = entry.get('end_time')
+            if end_time is not None:
+                others.append((now, end_time.replace(tzinfo=now.tzinfo), entry.get('stream_url'), cost))
+
+        for start, end, stream_url, cost in slots:
+            overlapping = [slot for slot in others if slot[0] < end and slot[1] > start]
+            # Captures only start, so the peak is at the start of one of them
+            for instant in [start] + [slot[0] for slot in overlapping if slot[0] > start]:
+                active = [(stream_url, cost)] + [
+                    (slot[2], slot[3]) for slot in overlapping if slot[0] <= instant < slot[1]
+                ]
+                reason = self._check_budgets(len(active), self._combine(active))
+                if reason:
+                    return f"At {instant.strftime('%Y-%m-%d %H:%M')}, {len(active)} recordings would run at once: {reason}"
+        return None
+
+    def _job_slots(self, session, job, now, horizon):
+        """List (start, end, stream URL, estimated cost) for a job's runs before horizon."""
+        kind, _, item_id = job.id.partition('_')
+        if kind in ('recording', 'admission'):
+            item = session.query(Recording).get(int(item_id))
+        elif kind == 'recurring':
+            item = session.query(RecurringRecording).get(int(item_id))
+        else:
+            return []
+        if item is None or item.station is None:
+            return []
+
+        cost = self._estimate_for_station(session, item.station, item.format or 'mp3')
+        duration = timedelta(minutes=item.duration)
+
+        slots = []
+        run_time = job.next_run_time
+        while run_time is not None and run_time < horizon and len(slots) < SCHEDULE_CHECK_OCCURRENCES:
+            slots.append((run_time, run_time + duration, item.station.url, cost))
+            run_time = job.trigger.get_next_fire_time(run_time, run_time + timedelta(seconds=1))
+        return slots
+
+    def _estimate_for_station(self, session, station, audio_format):
+        probe = session.query(StationProbe).filter_by(
+            station_id=station.id,
+            url=station.url
+        ).order_by(StationProbe.probed_at.desc()).first()
+
+        stream_copy = False
+        kbps = None
+        if probe:
+            stream_copy = Config.CAPTURE_MODE == 'auto' and can_stream_copy(probe.codec_name, audio_format)
+            kbps = probe.bit_rate // 1000 if probe.bit_rate else None
+        return self.estimate(stream_copy, kbps)
+
+    def _running_captures(self):
+        """List (stream URL, cost) for each capture in the registry."""
+        return [
+            (entry.get('stream_url'), entry.get('cost') or self.estimate(entry.get('stream_copy'), entry.get('kbps')))
+            for entry in self._registry.snapshot().values()
+        ]
+
+    def _combine(self, captures):
+        """Add up capture costs, counting a shared station's bandwidth once."""
+        cpu_percent = sum(cost.cpu_percent for _, cost in captures)
+        rss = sum(cost.rss for _, cost in captures)
+
+        if Config.SHARED_INGEST:
+            per_station = {}
+            kbps = 0
+            for stream_url, cost in captures:
+                if stream_url is None:
+                    kbps += cost.kbps
+                else:
+                    per_station[stream_url] = max(per_station.get(stream_url, 0), cost.kbps)
+            kbps += sum(per_station.values())
+        else:
+            kbps = sum(cost.kbps for _, cost in captures)
+        return CaptureCost(cpu_percent, rss, kbps)
+
+    def _check_budgets(self, count, load):
+        if Config.MAX_CONCURRENT_RECORDINGS and count > Config.MAX_CONCURRENT_RECORDINGS:
+            return f"more than {Config.MAX_CONCURRENT_RECORDINGS} concurrent recordings"
+
+        cpu_budget = Config.CAPTURE_CPU_BUDGET * (os.cpu_count() or 1)
+        if cpu_budget and load.cpu_percent > cpu_budget:
+            return f"estimated CPU use {load.cpu_percent:.0f}% exceeds the budget of {cpu_budget:.0f}%"
+
+        memory_budget = Config.CAPTURE_MEMORY_BUDGET_MB * 1024 * 1024
+        if memory_budget and load.rss > memory_budget:
+            return f"estimated memory use {load.rss / (1024 * 1024):.0f} MB exceeds the budget of {Config.CAPTURE_MEMORY_BUDGET_MB} MB"
+
+        if Config.CAPTURE_BANDWIDTH_BUDGET_KBPS and load.kbps > Config.CAPTURE_BANDWIDTH_BUDGET_KBPS:
+            return f"estimated bandwidth {load.kbps:.0f} kbit/s exceeds the budget of {Config.CAPTURE_BANDWIDTH_BUDGET_KBPS} kbit/s"
+
+        return None
@@ -0,0 +1,199 @@
+import os
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+
+from models import Recording, Clip
+from utils.media import extract_clip
+from utils.postprocess import post_processor
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Formats whose audio frames are short and decode on their own, so a copied
+# clip starts within one frame of the requested offset. Ogg pages hold
+# seconds of audio, so Ogg clips are re-encoded
+COPY_CLIP_FORMATS = {'mp3', 'aac', 'flac', 'wav'}
+
+# Seconds after which a clip still marked running is taken to be abandoned
+# by its worker; cutting even a long re-encoded clip takes minutes
+CLIP_CLAIM_TIMEOUT = 3600
+
+
+def get_clips_dir():
+    """Directory holding extracted clips."""
+    return os.path.join(Config.RECORDINGS_DIR, '.clips')
+
+def parse_offset(text):
+    """
+    Parse an offset into a recording, given as seconds, MM:SS or HH:MM:SS.
+
+    Returns:
+        int: The offset in seconds
+
+    Raises:
+        ValueError: If the text is not an offset
+    """
+    parts = text.strip().split(':')
+    if len(parts) > 3 or not all(part.isdigit() for part in parts):
+        raise ValueError(f"Invalid offset: {text}")
+    seconds = 0
+    for part in parts:
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+def format_offset(seconds):
+    """Format an offset in seconds as H:MM:SS."""
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+def request_clip(session, recording, start, end):
+    """
+    Get the clip of a recording between two offsets, reusing a cached one.
+
+    A new or stale clip is marked pending; the caller commits the session and
+    then calls submit_clip() if the clip is pending.
+
+    Args:
+        session: The database session the recording belongs to
+        recording: The Recording object
+        start (int): Start offset in seconds
+        end (int): End offset in seconds
+
+    Returns:
+        Clip: The clip
+    """
+    clip = session.query(Clip).filter_by(recording_id=recording.id, start_offset=start, end_offset=end).first()
+    if clip is None:
+        file_name = f"{recording.id}-{start}-{end}.{recording.format or 'mp3'}"
+        clip = Clip(
+            recording_id=recording.id,
+            start_offset=start,
+            end_offset=end,
+            file_path=os.path.join(get_clips_dir(), file_name),
+            status='pending'
+        )
+        session.add(clip)
+    elif clip.status == 'failed' or (clip.status == 'ready' and not os.path.exists(clip.file_path)):
+        clip.status = 'pending'
+        clip.error = None
+    return clip
+
+def submit_clip(clip_id):
+    """Extract a pending clip on the post-processing pool."""
+    post_processor.run_heavy(extract_recording_clip, clip_id)
+
+def extract_recording_clip(clip_id):
+    """Cut a clip out of its recording's file and store the result."""
+    # Import app at function level to avoid circular imports
+    from app import app
+    from utils.db import get_db_session
+    from utils.recorder import get_ffmpeg_path, get_encoding_params
+
+    with app.app_context():
+        session = get_db_session()
+        try:
+            # Claim the clip, so a clip submitted twice, or by two leaders
+            # in turn, is only cut once
+            claimed = session.query(Clip).filter_by(id=clip_id, status='pending').update(
+                {'status': 'running', 'claimed_at': datetime.utcnow()},
+                synchronize_session=False
+            )
+            session.commit()
+            if not claimed:
+                return
+            clip = session.query(Clip).get(clip_id)
+            recording = session.query(Recording).get(clip.recording_id)
+
+            if not recording.local_path or not os.path.exists(recording.local_path):
+                clip.status = 'failed'
+                clip.error = 'Recording file not found'
+                session.commit()
+                return
+
+            os.makedirs(os.path.dirname(clip.file_path), exist_ok=True)
+            ffmpeg_path = get_ffmpeg_path(session)
+            duration = clip.end_offset - clip.start_offset
+
+            extracted = False
+            if recording.format in COPY_CLIP_FORMATS:
+                extracted = extract_clip(recording.local_path, clip.file_path, clip.start_offset, duration, ffmpeg_path)
+            if not extracted:
+                # Only the clip is decoded, so this stays cheap for long recordings
+                logger.info(f"Re-encoding clip {clip_id} of recording {recording.id}")
+                extracted = extract_clip(
+                    recording.local_path,
+                    clip.file_path,
+                    clip.start_offset,
+                    duration,
+                    ffmpeg_path,
+                    get_encoding_params(recording.format)
+                )
+
+            if extracted:
+                clip.status = 'ready'
+                clip.file_size = os.path.getsize(clip.file_path)
+                logger.info(f"Clip {clip_id} of recording {recording.id} is ready")
+            else:
+                clip.status = 'failed'
+                clip.error = 'FFmpeg could not cut the clip'
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error extracting clip {clip_id}: {str(e)}")
+            clip = session.query(Clip).get(clip_id)
+            if clip:
+                clip.status = 'failed'
+                clip.error = str(e)
+                session.commit()
+        finally:
+            session.close()
+
+def resume_clips(session):
+    """
+    Requeue pending clips, and clips whose worker stopped before finishing
+    them. A clip another process is still cutting, such as the previous
+    scheduler leader, is left to it.
+    """
+    stale = datetime.utcnow() - timedelta(seconds=CLIP_CLAIM_TIMEOUT)
+    session.query(Clip).filter(
+        Clip.status == 'running',
+        or_(Clip.claimed_at.is_(None), Clip.claimed_at < stale)
+    ).update({'status': 'pending'}, synchronize_session=False)
+    session.commit()
+
+    clip_ids = [clip_id for clip_id, in session.query(Clip.id).filter_by(status='pending')]
+    for clip_id in clip_ids:
+        submit_clip(clip_id)
+
+def delete_clip_files(recording):
+    """Delete the cached clip files of a recording."""
+    for clip in recording.clips:
+        if os.path.exists(clip.file_path):
+            os.remove(clip.file_path)
+
+def prune_clips():
+    """Delete clips nobody downloaded for CLIP_CACHE_DAYS; run daily by the scheduler."""
+    # Import app at function level to avoid circular imports
+    from app import app
+    from utils.db import get_db_session
+
+    with app.app_context():
+        session = get_db_session()
+        try:
+            oldest = datetime.utcnow() - timedelta(days=Config.CLIP_CACHE_DAYS)
+            clips = session.query(Clip).filter(
+                Clip.status.in_(['ready', 'failed']),
+                Clip.last_accessed < oldest
+            ).all()
+            for clip in clips:
+                if os.path.exists(clip.file_path):
+                    os.remove(clip.file_path)
+                session.delete(clip)
+            session.commit()
+            if clips:
+                logger.info(f"Deleted {len(clips)} unused clip(s)")
+        except Exception as e:
+            logger.error(f"Error pruning clips: {str(e)}")
+        finally:
+            session.close()
@@ -0,0 +1,193 @@
+import time
+import sqlite3
+import logging
+import threading
+
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import Pool
+
+from models import db
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Sessions for background tasks; each call gives an independent session
+# bound to the application's engine, so they share its connection pool
+_session_factory = sessionmaker()
+
+# Counts of engines and connections created in this process
+_stats_lock = threading.Lock()
+_stats = {
+    'engines': 0,
+    'connections_opened': 0,
+    'connections_closed': 0,
+    'checkouts': 0,
+    'checked_out': 0
+}
+
+
+# Values accepted by PRAGMA synchronous
+SYNCHRONOUS_MODES = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+
+def _count(name, delta=1):
+    with _stats_lock:
+        _stats[name] += delta
+
+@event.listens_for(Pool, 'first_connect')
+def _on_first_connect(dbapi_connection, connection_record):
+    # Every engine has its own pool, so a pool's first connection marks a new engine
+    _count('engines')
+    if _stats['engines'] > 1:
+        logger.warning(f"{_stats['engines']} database engines have been created; background tasks should use get_db_session()")
+
+@event.listens_for(Pool, 'connect')
+def _on_connect(dbapi_connection, connection_record):
+    _count('connections_opened')
+
+@event.listens_for(Pool, 'close')
+def _on_close(dbapi_connection, connection_record):
+    _count('connections_closed')
+
+@event.listens_for(Pool, 'checkout')
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    _count('checkouts')
+    _count('checked_out')
+
+@event.listens_for(Pool, 'checkin')
+def _on_checkin(dbapi_connection, connection_record):
+    _count('checked_out', -1)
+
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+
+    # WAL lets readers run alongside the writer, NORMAL sync is safe with WAL
+    # and skips an fsync per commit, and the busy timeout makes a writer wait
+    # for the lock instead of failing with "database is locked"
+    synchronous = Config.SQLITE_SYNCHRONOUS.upper()
+    if synchronous not in SYNCHRONOUS_MODES:
+        logger.warning(f"Unknown SQLITE_SYNCHRONOUS value '{Config.SQLITE_SYNCHRONOUS}', using NORMAL")
+        synchronous = 'NORMAL'
+
+    cursor = dbapi_connection.cursor()
+    try:
+        if Config.SQLITE_WAL:
+            cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.execute(f'PRAGMA busy_timeout={int(Config.SQLITE_BUSY_TIMEOUT)}')
+    finally:
+        cursor.close()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_request_statement(connection, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.sql_statements = g.get('sql_statements', 0) + 1
+
+def reset_request_statement_count():
+    """
+    Start counting a request's statements from zero. The count is kept on g,
+    which belongs to the app context, and a request reuses an app context
+    that is already active, as in tests.
+    """
+    g.sql_statements = 0
+
+def get_request_statement_count():
+    """Return the number of SQL statements run so far by the current request."""
+    return g.get('sql_statements', 0) if has_request_context() else 0
+
+def get_engine():
+    """Return the application's engine, shared by requests and background tasks."""
+    # Import app at function level to avoid circular imports
+    from app import app
+    return db.get_engine(app)
+
+def get_db_session():
+    """Create a database session for a background task. The caller closes it."""
+    return _session_factory(bind=get_engine())
+
+def get_pool_stats():
+    """
+    Report engine and connection counts, to spot sessions that bypass the
+    shared engine or leak connections.
+
+    Returns:
+        dict: Counters since startup and the shared pool's current state
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['pool'] = get_engine().pool.status()
+    return stats
+
+
+class StatusWriter:
+    """
+    Funnel frequent small updates, such as recording status and size, through
+    one writer thread.
+
+    Updates to the same row are merged, and everything pending is written in
+    a single short transaction every interval, so captures don't compete with
+    each other or with web requests for the database's write lock.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+
+    def update(self, model, row_id, **fields):
+        """
+        Queue an update of one row. Later values of a field replace earlier ones.
+
+        Args:
+            model: The model class, for example Recording
+            row_id (int): Primary key of the row
+            **fields: Columns to set
+        """
+        with self._lock:
+            self._pending.setdefault((model, row_id), {}).update(fields)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='status-writer', daemon=True)
+                self._thread.start()
+
+    def flush(self):
+        """Write everything pending now, for callers that read the rows next."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return
+
+            session = get_db_session()
+            try:
+                for (model, row_id), fields in batch.items():
+                    session.query(model).filter_by(id=row_id).update(fields, synchronize_session=False)
+                session.commit()
+            except OperationalError as e:
+                session.rollback()
+                logger.warning(f"Could not write {len(batch)} status update(s), retrying: {str(e)}")
+                with self._lock:
+                    # Keep newer values queued since this batch was taken
+                    for key, fields in batch.items():
+                        self._pending[key] = {**fields, **self._pending.get(key, {})}
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Error writing status updates: {str(e)}")
+            finally:
+                session.close()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+# Process-wide writer for recorder status updates
+status_writer = StatusWriter(Config.STATUS_WRITE_INTERVAL)
@@ -0,0 +1,109 @@
+import os
+import logging
+from urllib.parse import quote
+
+from flask import abort, current_app, request
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.utils import send_file
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Ways of sending a download: the application streams it, or hands the path
+# to nginx (X-Accel-Redirect) or Apache/lighttpd (X-Sendfile) to stream
+DOWNLOAD_MODES = {'direct', 'x-accel-redirect', 'x-sendfile'}
+
+
+def get_file_etag(mtime, size):
+    """
+    Strong ETag of a file from its modification time and size.
+
+    Uses nginx's format, so a file keeps its ETag when downloads switch
+    between direct and X-Accel-Redirect mode.
+    """
+    return f'{int(mtime):x}-{size:x}'
+
+def get_accel_path(path):
+    """
+    Map a file under RECORDINGS_DIR to the proxy's internal location.
+
+    Returns:
+        str: The URI for X-Accel-Redirect, or None if the file lies elsewhere
+    """
+    # abspath() rather than realpath(), which would stat every directory
+    root = os.path.abspath(Config.RECORDINGS_DIR)
+    file_path = os.path.abspath(path)
+    if os.path.commonpath([root, file_path]) != root:
+        return None
+    relative = os.path.relpath(file_path, root).replace(os.sep, '/')
+    return Config.DOWNLOAD_ACCEL_PREFIX.rstrip('/') + '/' + quote(relative)
+
+def send_media_file(path, mimetype, download_name=None):
+    """
+    Send a recording, episode or clip as an attachment.
+
+    In direct mode the response answers Range requests with 206 and
+    conditional requests with 304, and the file is streamed with the
+    server's file wrapper. In the X-Accel-Redirect and X-Sendfile modes the
+    response carries only headers, and the proxy streams the file and
+    handles ranges itself, so the worker is free as soon as it returns.
+
+    Args:
+        path (str): The file to send
+        mimetype (str): Its MIME type
+        download_name (str, optional): File name offered to the client,
+            defaults to the file's own name
+
+    Returns:
+        Response: The download response
+    """
+    mode = Config.DOWNLOAD_MODE
+    if mode not in DOWNLOAD_MODES:
+        logger.warning(f"Unknown DOWNLOAD_MODE '{mode}', sending downloads directly")
+        mode = 'direct'
+
+    accel_path = None
+    if mode == 'x-accel-redirect':
+        accel_path = get_accel_path(path)
+        if accel_path is None:
+            logger.warning(f"{path} is outside RECORDINGS_DIR, sending it directly")
+            mode = 'direct'
+
+    offload = mode != 'direct'
+    try:
+        # send_file() stats the file; the ETag and ranges reuse its result
+        # rather than stat the file again
+        response = send_file(
+            path,
+            request.environ,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=download_name or os.path.basename(path),
+            conditional=False,
+            etag=False,
+            use_x_sendfile=offload,
+            response_class=current_app.response_class
+        )
+    except (FileNotFoundError, NotADirectoryError):
+        abort(404)
+
+    size = response.content_length
+    response.set_etag(get_file_etag(response.last_modified.timestamp(), size))
+
+    # Werkzeug only advertises ranges on a range response; players look for
+    # it on the first response before they seek
+    response.headers['Accept-Ranges'] = 'bytes'
+    if offload:
+        # The proxy sets the length of the body it sends
+        del response.headers['Content-Length']
+        if mode == 'x-accel-redirect':
+            del response.headers['X-Sendfile']
+            response.headers['X-Accel-Redirect'] = accel_path
+        return response
+
+    try:
+        return response.make_conditional(request.environ, accept_ranges=True, complete_length=size)
+    except RequestedRangeNotSatisfiable:
+        response.close()
+        raise
@@ -0,0 +1,254 @@
+import os
+import gzip
+import hashlib
+import logging
+import threading
+from collections import namedtuple, OrderedDict
+from datetime import datetime, timezone
+
+from feedgen.ext.base import BaseExtension
+from lxml import etree
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import Podcast, PodcastEpisode
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# A rendered feed, its gzip-compressed copy, the ETag of the uncompressed
+# bytes and when it was rendered
+CachedFeed = namedtuple('CachedFeed', ['body', 'gzipped', 'etag', 'last_modified'])
+
+# Rendered feeds kept in memory; the least recently served are dropped first
+MAX_LOADED_FEEDS = 256
+
+ATOM_NS = 'http://www.w3.org/2005/Atom'
+FEED_HISTORY_NS = 'http://purl.org/syndication/history/1.0'
+
+
+def get_feeds_dir():
+    """Directory holding rendered podcast feeds."""
+    return os.path.join(Config.RECORDINGS_DIR, '.feeds')
+
+def get_archive_page_count(episode_count, page_size):
+    """
+    Count the complete archive pages of a feed, leaving the main feed
+    between one and two pages of the newest episodes.
+    """
+    return max(0, episode_count - page_size) // page_size
+
+def make_feed(body, gzipped=None, mtime_ns=None):
+    """Wrap a rendered feed for serving, compressing it if no copy is given."""
+    if gzipped is None:
+        gzipped = gzip.compress(body, compresslevel=9)
+    etag = hashlib.sha1(body).hexdigest()
+    if mtime_ns is None:
+        last_modified = datetime.now(timezone.utc)
+    else:
+        last_modified = datetime.fromtimestamp(mtime_ns / 1e9, timezone.utc)
+    return CachedFeed(body, gzipped, etag, last_modified.replace(microsecond=0))
+
+
+class ArchiveExtension(BaseExtension):
+    """
+    Feedgen extension adding RFC 5005 archive links to an RSS feed.
+
+    Feedgen's RSS output keeps only the self link, so prev-archive and
+    current links, and the fh:archive marker of archive pages, are added
+    here.
+    """
+
+    def __init__(self):
+        self._links = []
+        self._archive = False
+
+    def link(self, rel, href):
+        """Add an atom:link to the channel."""
+        self._links.append((rel, href))
+
+    def archive(self):
+        """Mark the feed as an archive page."""
+        self._archive = True
+
+    def extend_ns(self):
+        return {'fh': FEED_HISTORY_NS}
+
+    def extend_rss(self, rss_feed):
+        channel = rss_feed[0]
+        if self._archive:
+            etree.SubElement(channel, f'{{{FEED_HISTORY_NS}}}archive')
+        for rel, href in self._links:
+            etree.SubElement(channel, f'{{{ATOM_NS}}}link', rel=rel, href=href)
+        return rss_feed
+
+
+class FeedCache:
+    """
+    Rendered podcast feeds, kept on disk with a gzip copy beside each one.
+
+    Each podcast has one file for its main feed and one per archive page.
+    Serving a cached feed costs a stat of its file; the bytes of the most
+    recently served feeds are kept in memory until the file changes.
+    Changing a podcast or its episodes deletes its files, in whichever
+    process made the change, and the next request renders the feed again.
+    """
+
+    def __init__(self, feeds_dir, max_loaded=MAX_LOADED_FEEDS):
+        self.feeds_dir = feeds_dir
+        self.max_loaded = max_loaded
+        self._lock = threading.Lock()
+        self._loaded = OrderedDict()
+        self._generations = {}
+
+    def _path(self, podcast_id, page=None):
+        page_suffix = f'-p{page}' if page is not None else ''
+        return os.path.join(self.feeds_dir, f'{podcast_id}{page_suffix}.xml')
+
+    def get(self, podcast_id, page=None):
+        """
+        Look up a podcast's rendered feed.
+
+        Args:
+            podcast_id (int): The podcast's ID
+            page (int, optional): Archive page number, or None for the main feed
+
+        Returns:
+            CachedFeed: The feed, or None if it has to be rendered
+        """
+        path = self._path(podcast_id, page)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            with self._lock:
+                loaded = self._loaded.get(path)
+                if loaded and loaded[0] == mtime_ns:
+                    self._loaded.move_to_end(path)
+                    return loaded[1]
+
+            with open(path, 'rb') as f:
+                body = f.read()
+            with open(path + '.gz', 'rb') as f:
+                gzipped = f.read()
+        except FileNotFoundError:
+            return None
+
+        feed = make_feed(body, gzipped, mtime_ns)
+        with self._lock:
+            self._keep_loaded(path, mtime_ns, feed)
+        return feed
+
+    def generation(self, podcast_id):
+        """Return a token to pass to store(), taken before reading the podcast."""
+        return self._generations.get(podcast_id, 0)
+
+    def store(self, podcast_id, body, generation, page=None):
+        """
+        Cache a rendered feed and its compressed copy.
+
+        The feed isn't written if the podcast changed since generation was
+        taken, as it may have been rendered from the old data.
+
+        Args:
+            podcast_id (int): The podcast's ID
+            body (bytes): The rendered feed
+            generation: The token from generation()
+            page (int, optional): Archive page number, or None for the main feed
+
+        Returns:
+            CachedFeed: The feed, ready to serve
+        """
+        gzipped = gzip.compress(body, compresslevel=9)
+        path = self._path(podcast_id, page)
+
+        with self._lock:
+            if generation != self._generations.get(podcast_id, 0):
+                return make_feed(body, gzipped)
+            try:
+                os.makedirs(self.feeds_dir, exist_ok=True)
+                # Write the compressed copy first; a feed file is only served
+                # when both exist
+                for file_path, data in ((path + '.gz', gzipped), (path, body)):
+                    temp_path = f'{file_path}.{os.getpid()}.tmp'
+                    with open(temp_path, 'wb') as f:
+                        f.write(data)
+                    os.replace(temp_path, file_path)
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError as e:
+                logger.error(f"Error caching feed of podcast {podcast_id}: {str(e)}")
+                return make_feed(body, gzipped)
+
+            feed = make_feed(body, gzipped, mtime_ns)
+            self._keep_loaded(path, mtime_ns, feed)
+        return feed
+
+    def invalidate(self, podcast_id, archives=True):
+        """
+        Delete a podcast's rendered feeds.
+
+        Args:
+            podcast_id (int): The podcast's ID
+            archives (bool): Whether archive pages go too; new episodes only
+                change the main feed
+        """
+        def matches(name):
+            return name.startswith(f'{podcast_id}.') or (archives and name.startswith(f'{podcast_id}-p'))
+
+        with self._lock:
+            self._generations[podcast_id] = self._generations.get(podcast_id, 0) + 1
+            for path in [p for p in self._loaded if matches(os.path.basename(p))]:
+                del self._loaded[path]
+            try:
+                names = os.listdir(self.feeds_dir)
+            except FileNotFoundError:
+                return
+            # Feed files go before their compressed copies
+            for name in sorted((n for n in names if matches(n)), key=len):
+                try:
+                    os.remove(os.path.join(self.feeds_dir, name))
+                except FileNotFoundError:
+                    pass
+        logger.debug(f"Invalidated cached feeds of podcast {podcast_id}")
+
+    def _keep_loaded(self, path, mtime_ns, feed):
+        # Called with the lock held
+        self._loaded[path] = (mtime_ns, feed)
+        self._loaded.move_to_end(path)
+        while len(self._loaded) > self.max_loaded:
+            self._loaded.popitem(last=False)
+
+
+# Process-wide feed cache
+feed_cache = FeedCache(get_feeds_dir())
+
+
+def mark_podcast_changed(session, podcast_id, archives=True):
+    """
+    Have a podcast's cached feeds deleted when the session commits, for
+    changes the session doesn't see, such as bulk updates of its episodes.
+    """
+    changed = session.info.setdefault('changed_podcasts', {})
+    changed[podcast_id] = changed.get(podcast_id, False) or archives
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_podcasts(session, flush_context):
+    # Maps each changed podcast to whether its archive pages changed too
+    changed = session.info.setdefault('changed_podcasts', {})
+    for instance in session.new:
+        if isinstance(instance, PodcastEpisode):
+            changed.setdefault(instance.podcast_id, False)
+    for instance in list(session.dirty) + list(session.deleted):
+        if isinstance(instance, Podcast):
+            changed[instance.id] = True
+        elif isinstance(instance, PodcastEpisode):
+            changed[instance.podcast_id] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_podcasts(session):
+    # Only once committed, so a request can't cache the old rows again
+    for podcast_id, archives in session.info.pop('changed_podcasts', {}).items():
+        if podcast_id is not None:
+            feed_cache.invalidate(podcast_id, archives)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_changed_podcasts(session, previous_transaction):
+    session.info.pop('changed_podcasts', None)
@@ -0,0 +1,146 @@
+import os
+import logging
+
+from models import Recording, PodcastEpisode, MediaMetadata
+from utils.metadata import prune_media_metadata
+from utils.feeds import mark_podcast_changed
+
+logger = logging.getLogger(__name__)
+
+# Extensions a recording's file may have been converted to
+SUPPORTED_FORMATS = ['mp3', 'ogg', 'aac', 'flac', 'wav']
+
+
+def record_file_stat(item, path):
+    """
+    Store the size and mtime of a finalized file on its Recording or PodcastEpisode.
+
+    Returns:
+        bool: True if the file exists
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        item.file_missing = True
+        return False
+    item.file_size = stat.st_size
+    item.file_mtime = stat.st_mtime
+    item.file_missing = False
+    return True
+
+def find_moved_file(path):
+    """Look for a file under the other supported extensions."""
+    base_path = os.path.splitext(path)[0]
+    for fmt in SUPPORTED_FORMATS:
+        candidate = f"{base_path}.{fmt}"
+        if candidate != path and os.path.exists(candidate):
+            return candidate
+    return None
+
+def _reconcile(item, path_attr):
+    path = getattr(item, path_attr)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        stat = None
+
+    if stat is None:
+        moved = find_moved_file(path)
+        if moved:
+            logger.info(f"{type(item).__name__} {item.id} file moved from {path} to {moved}")
+            setattr(item, path_attr, moved)
+            record_file_stat(item, moved)
+        elif not item.file_missing:
+            logger.warning(f"{type(item).__name__} {item.id} file is missing: {path}")
+            item.file_missing = True
+        return
+
+    if item.file_missing or item.file_size != stat.st_size or item.file_mtime != stat.st_mtime:
+        item.file_size = stat.st_size
+        item.file_mtime = stat.st_mtime
+        item.file_missing = False
+
+def reconcile_files():
+    """
+    Check the recorded files against the database; run periodically by the scheduler.
+
+    Downloads and deletions trust the stored path, so this is where files
+    moved, converted or deleted outside the application are noticed: a file
+    found under another extension has its path updated, and one that is gone
+    is marked missing until it comes back.
+
+    Files not probed yet, or changed since, are probed, and the measured
+    durations copied to their recordings and episodes. Probing runs with no
+    transaction open and each result is committed on its own, so a long
+    backfill doesn't hold SQLite's write lock against captures and requests.
+    """
+    # Import app at function level to avoid circular imports
+    from app import app
+    from utils.db import get_db_session
+    from utils.media import get_ffprobe_path, probe_media
+    from utils.recorder import get_ffmpeg_path
+
+    with app.app_context():
+        session = get_db_session()
+        try:
+            ffprobe_path = get_ffprobe_path(get_ffmpeg_path(session))
+
+            # Paths and stats first, in one short transaction
+            files = []
+            podcast_ids = {}
+
+            def check(item, path_attr, duration_attr):
+                _reconcile(item, path_attr)
+                if not item.file_missing and item.file_mtime is not None:
+                    files.append((type(item), item.id, getattr(item, path_attr), item.file_size,
+                                  item.file_mtime, duration_attr, getattr(item, duration_attr)))
+
+            recordings = session.query(Recording).filter(
+                # Partial recordings keep their files too
+                Recording.status.in_(['completed', 'partial']),
+                Recording.local_path.isnot(None)
+            ).all()
+            for recording in recordings:
+                check(recording, 'local_path', 'recorded_duration')
+
+            for episode in session.query(PodcastEpisode).all():
+                check(episode, 'file_path', 'duration')
+                podcast_ids[episode.id] = episode.podcast_id
+
+            known = {
+                (metadata.path, metadata.size, metadata.mtime): metadata.duration
+                for metadata in session.query(MediaMetadata).all()
+            }
+            session.commit()
+
+            for model, item_id, path, size, mtime, duration_attr, duration in files:
+                key = (path, size, mtime)
+                if key not in known:
+                    # A file that can't be probed is stored without a duration so it isn't probed again
+                    info = probe_media(path, ffprobe_path) or {}
+                    session.add(MediaMetadata(path=path, size=size, mtime=mtime, **info))
+                    known[key] = info.get('duration')
+                    logger.debug(f"Probed {path}: {info}")
+
+                    # Feeds show the measured duration
+                    if model is PodcastEpisode:
+                        mark_podcast_changed(session, podcast_ids[item_id])
+
+                measured = known[key]
+                if measured is not None and duration != int(measured):
+                    # Only if the file is unchanged since it was checked
+                    session.query(model).filter_by(id=item_id, file_mtime=mtime).update(
+                        {duration_attr: int(measured)},
+                        synchronize_session=False
+                    )
+                    if model is PodcastEpisode:
+                        mark_podcast_changed(session, podcast_ids[item_id])
+                session.commit()
+
+            prune_media_metadata(session, {file[2:5] for file in files})
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error reconciling recorded files: {str(e)}")
+        finally:
+            session.close()
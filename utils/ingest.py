@@ -0,0 +1,263 @@
+import os
+import time
+import logging
+import threading
+import subprocess
+from collections import namedtuple
+
+from config import Config
+from utils.supervisor import supervisor
+
+logger = logging.getLogger(__name__)
+
+# How an ingest hands audio to its captures: the ingest's FFmpeg output
+# options, the matching capture input options, and the byte boundary a
+# joining capture must start on
+IngestFeed = namedtuple('IngestFeed', ['name', 'output_args', 'input_args', 'frame_bytes'])
+
+# Raw PCM, which any source can be decoded to
+PCM_SAMPLE_RATE = 44100
+PCM_CHANNELS = 2
+_PCM_ARGS = ['-f', 's16le', '-ar', str(PCM_SAMPLE_RATE), '-ac', str(PCM_CHANNELS)]
+PCM_FEED = IngestFeed('pcm', _PCM_ARGS, _PCM_ARGS, 2 * PCM_CHANNELS)
+
+# Codecs whose streams resynchronise on frame headers, so the ingest can pass
+# the broadcast through untouched and captures may join at any byte
+FRAMED_FEEDS = {
+    'mp3': IngestFeed('mp3', ['-c:a', 'copy', '-f', 'mp3'], ['-f', 'mp3'], 1),
+    'aac': IngestFeed('aac', ['-c:a', 'copy', '-f', 'adts'], ['-f', 'aac'], 1)
+}
+
+# Audio a slow capture may fall behind before it is dropped (about 45 seconds)
+MAX_SUBSCRIBER_BACKLOG = 8 * 1024 * 1024
+
+# How often ingests are checked for stalls, in seconds
+INGEST_CHECK_INTERVAL = 5
+
+def get_feed(codec_name):
+    """Choose the feed for a station broadcasting in the given codec."""
+    return FRAMED_FEEDS.get(codec_name, PCM_FEED)
+
+
+class _Subscriber:
+    """A capture process fed from a shared ingest through its stdin."""
+
+    def __init__(self, recording_id, process, on_interrupt, skip):
+        self.recording_id = recording_id
+        self.process = process
+        self.on_interrupt = on_interrupt
+        self.fd = process.stdin.fileno()
+        self.pending = bytearray()
+        # Bytes to drop so the first sample this capture sees is frame-aligned
+        self.skip = skip
+        # Held while writing to fd and while closing it; once closed, the fd
+        # number may belong to another file
+        self.lock = threading.Lock()
+        self.closed = False
+        os.set_blocking(self.fd, False)
+
+
+class StationIngest:
+    """A single upstream connection to a station, passed on as one feed."""
+
+    def __init__(self, url, feed, ffmpeg_path):
+        self.url = url
+        self.feed = feed
+        self.key = ('ingest', url, feed.name)
+        self.subscribers = {}
+        self.bytes_read = 0
+        self.last_data = time.monotonic()
+        self.stopping = False
+        # Kept running without captures until then, for captures about to start
+        self.keep_until = 0
+
+        cmd = [
+            ffmpeg_path,
+            '-nostdin',
+            '-reconnect', '1',
+            '-reconnect_streamed', '1',
+            '-reconnect_delay_max', '30',
+            '-reconnect_attempts', '10',
+            '-i', url,
+            '-vn'
+        ] + feed.output_args + ['pipe:1']
+
+        logger.info(f"Starting shared ingest: {' '.join(cmd)}")
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+
+
+class IngestHub:
+    """
+    Share one ingest per station URL between overlapping captures.
+
+    Captures read the feed on stdin. They can attach to a running ingest at
+    any time and leave when their own duration ends; the ingest stops once
+    its last capture has left.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ingests = {}
+        self._by_recording = {}
+
+    def attach(self, url, feed, ffmpeg_path, recording_id, process, on_interrupt):
+        """
+        Feed a capture process from the shared ingest for a station URL.
+
+        Args:
+            url (str): The station stream URL
+            feed (IngestFeed): The feed the capture reads; its input_args must
+                precede the capture's '-i pipe:0'
+            ffmpeg_path (str): FFmpeg executable used if a new ingest is needed
+            recording_id (int): The ID of the recording being captured
+            process: The capture's subprocess.Popen object, with stdin as a pipe
+            on_interrupt (callable): Called with a reason if the ingest fails
+                while the capture is still attached
+        """
+        with self._lock:
+            ingest = self._ingests.get((url, feed.name))
+            if ingest is None or ingest.stopping:
+                ingest = self._start(url, feed, ffmpeg_path)
+            else:
+                logger.info(f"Recording {recording_id} joining shared ingest for {url}")
+
+            skip = -ingest.bytes_read % feed.frame_bytes
+            ingest.subscribers[recording_id] = _Subscriber(recording_id, process, on_interrupt, skip)
+            self._by_recording[recording_id] = ingest
+
+    def warm(self, url, feed, ffmpeg_path, seconds):
+        """
+        Connect to a station ahead of a capture, keeping the ingest running
+        for the given number of seconds even if no capture attaches.
+        """
+        with self._lock:
+            ingest = self._ingests.get((url, feed.name))
+            if ingest is None or ingest.stopping:
+                logger.info(f"Warming up shared ingest for {url}")
+                ingest = self._start(url, feed, ffmpeg_path)
+            ingest.keep_until = max(ingest.keep_until, time.monotonic() + seconds)
+
+    def detach(self, recording_id):
+        """Stop feeding a capture, stopping its ingest if nobody else uses it."""
+        with self._lock:
+            ingest = self._by_recording.pop(recording_id, None)
+            if ingest is None:
+                return
+            subscriber = ingest.subscribers.pop(recording_id, None)
+            if subscriber:
+                self._close(subscriber)
+            if (not ingest.subscribers and not ingest.stopping and ingest.process.poll() is None
+                    and time.monotonic() >= ingest.keep_until):
+                logger.info(f"Last capture left shared ingest for {ingest.url}, stopping it")
+                self._stop(ingest)
+
+    def check_stalled(self):
+        """
+        Stop ingests that have not produced audio within the stall timeout,
+        and warmed-up ingests no capture attached to.
+        """
+        now = time.monotonic()
+        with self._lock:
+            ingests = list(self._ingests.values())
+        for ingest in ingests:
+            if ingest.stopping:
+                continue
+            if now - ingest.last_data > Config.RECORDING_STALL_TIMEOUT:
+                logger.warning(f"Shared ingest for {ingest.url} stalled, restarting")
+                with self._lock:
+                    self._stop(ingest)
+            elif not ingest.subscribers and now >= ingest.keep_until:
+                logger.info(f"No capture attached to warmed-up ingest for {ingest.url}, stopping it")
+                with self._lock:
+                    self._stop(ingest)
+
+    def _start(self, url, feed, ffmpeg_path):
+        ingest = StationIngest(url, feed, ffmpeg_path)
+        self._ingests[(url, feed.name)] = ingest
+        supervisor.watch(
+            ingest.key,
+            ingest.process,
+            on_exit=lambda key, returncode, stderr_output, ingest=ingest: self._ingest_exited(ingest, returncode, stderr_output),
+            on_stdout_data=lambda data, ingest=ingest: self._fan_out(ingest, data)
+        )
+        return ingest
+
+    def _fan_out(self, ingest, data):
+        ingest.last_data = time.monotonic()
+
+        # Count bytes under the lock so joiners align to the next chunk
+        with self._lock:
+            ingest.bytes_read += len(data)
+            subscribers = list(ingest.subscribers.values())
+
+        for subscriber in subscribers:
+            if subscriber.skip:
+                dropped = min(subscriber.skip, len(data))
+                subscriber.skip -= dropped
+                subscriber.pending += data[dropped:]
+            else:
+                subscriber.pending += data
+
+            finished = False
+            with subscriber.lock:
+                # Detached since the list was copied
+                if subscriber.closed:
+                    continue
+                try:
+                    written = os.write(subscriber.fd, subscriber.pending)
+                    del subscriber.pending[:written]
+                except BlockingIOError:
+                    pass
+                except OSError:
+                    # The capture finished and closed its input
+                    finished = True
+            if finished:
+                self.detach(subscriber.recording_id)
+                continue
+
+            if len(subscriber.pending) > MAX_SUBSCRIBER_BACKLOG:
+                logger.warning(f"Recording {subscriber.recording_id} fell too far behind shared ingest, dropping it")
+                self._interrupt(subscriber, 'capture fell behind the shared ingest')
+
+    def _ingest_exited(self, ingest, returncode, stderr_output):
+        with self._lock:
+            if self._ingests.get((ingest.url, ingest.feed.name)) is ingest:
+                del self._ingests[(ingest.url, ingest.feed.name)]
+            subscribers = list(ingest.subscribers.values())
+
+        if subscribers:
+            logger.warning(f"Shared ingest for {ingest.url} exited with code {returncode} while {len(subscribers)} capture(s) were attached")
+            logger.error(f"FFmpeg error output for shared ingest {ingest.url}: {stderr_output}")
+        for subscriber in subscribers:
+            self._interrupt(subscriber, 'shared ingest exited')
+
+    def _interrupt(self, subscriber, reason):
+        try:
+            subscriber.on_interrupt(reason)
+        finally:
+            self.detach(subscriber.recording_id)
+            subscriber.process.terminate()
+
+    def _stop(self, ingest):
+        ingest.stopping = True
+        if self._ingests.get((ingest.url, ingest.feed.name)) is ingest:
+            del self._ingests[(ingest.url, ingest.feed.name)]
+        ingest.process.terminate()
+
+    def _close(self, subscriber):
+        with subscriber.lock:
+            subscriber.closed = True
+            try:
+                subscriber.process.stdin.close()
+            except OSError:
+                pass
+
+
+# Process-wide hub shared by all captures
+ingest_hub = IngestHub()
+supervisor.add_periodic(INGEST_CHECK_INTERVAL, ingest_hub.check_stalled)
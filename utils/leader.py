@@ -0,0 +1,179 @@
+import os
+import uuid
+import socket
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from models import SchedulerLease
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerLeader:
+    """
+    Elect the one process that runs the scheduler's jobs.
+
+    Under gunicorn every worker imports the application and creates a
+    scheduler. Their jobs live in the shared database job store, so a job
+    added or removed in any worker is seen by all of them, but only the
+    process holding the lease runs them; the others keep their scheduler
+    paused. The lease is a single row holding its holder and an expiry time.
+    The leader renews it every SCHEDULER_LEASE_RENEW seconds, and once it has
+    gone SCHEDULER_LEASE_SECONDS without renewing, another worker takes over.
+
+    Args:
+        lease_seconds (int): How long a lease lasts without renewal
+        renew_interval (int): Seconds between renewals and takeover attempts
+    """
+
+    def __init__(self, lease_seconds, renew_interval):
+        self.lease_seconds = lease_seconds
+        self.renew_interval = renew_interval
+        self.identity = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.is_leader = False
+        self._expires_at = None
+        self._callbacks = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, on_elected, on_deposed, on_renewed=None):
+        """
+        Take the lease if it is free and keep trying in the background.
+
+        Args:
+            on_elected: Called when this process becomes the leader
+            on_deposed: Called when it loses the lease while still running
+            on_renewed (optional): Called after each renewal of a held lease
+        """
+        self._callbacks = (on_elected, on_deposed, on_renewed)
+        # Try right away, so a single process leads from startup
+        self._heartbeat()
+        self._thread = threading.Thread(target=self._run, name='scheduler-leader', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stop renewing and give up the lease, so another worker takes over at once."""
+        self._stop.set()
+        if not self.is_leader:
+            return
+        self.is_leader = False
+
+        session = self._session()
+        try:
+            session.query(SchedulerLease).filter_by(id=1, holder=self.identity).update(
+                {SchedulerLease.expires_at: datetime.utcnow()},
+                synchronize_session=False
+            )
+            session.commit()
+            logger.info(f"Released the scheduler lease held by {self.identity}")
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error releasing the scheduler lease: {str(e)}")
+        finally:
+            session.close()
+
+    def _run(self):
+        while not self._stop.wait(self.renew_interval):
+            self._heartbeat()
+
+    def _heartbeat(self):
+        on_elected, on_deposed, on_renewed = self._callbacks
+        held = self._acquire()
+        try:
+            if held and not self.is_leader:
+                self.is_leader = True
+                logger.info(f"{self.identity} is now the scheduler leader")
+                on_elected()
+            elif not held and self.is_leader:
+                self.is_leader = False
+                logger.error(f"{self.identity} lost the scheduler lease, stopping its jobs and captures")
+                on_deposed()
+            elif held and on_renewed:
+                on_renewed()
+        except Exception as e:
+            logger.error(f"Error changing scheduler leadership: {str(e)}")
+
+    def _acquire(self):
+        """
+        Take or renew the lease.
+
+        Returns:
+            bool: Whether this process holds the lease
+        """
+        session = self._session()
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        try:
+            # One conditional UPDATE, so two workers can't both take an expired lease
+            held = session.query(SchedulerLease).filter(
+                SchedulerLease.id == 1,
+                or_(SchedulerLease.holder == self.identity, SchedulerLease.expires_at < now)
+            ).update(
+                {SchedulerLease.holder: self.identity, SchedulerLease.expires_at: expires_at},
+                synchronize_session=False
+            ) > 0
+            if not held and session.get(SchedulerLease, 1) is None:
+                session.add(SchedulerLease(id=1, holder=self.identity, expires_at=expires_at))
+                held = True
+            session.commit()
+        except IntegrityError:
+            # Another worker created the lease first
+            session.rollback()
+            return False
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error renewing the scheduler lease: {str(e)}")
+            # Keep leading while the lease we last wrote lasts; nobody else can take it before then
+            return self.is_leader and datetime.utcnow() < self._expires_at
+        finally:
+            session.close()
+
+        if held:
+            self._expires_at = expires_at
+        return held
+
+    @staticmethod
+    def _session():
+        # Import at function level to avoid circular imports
+        from utils.db import get_db_session
+        return get_db_session()
+
+
+def run_on_leader(func, *args, job_id):
+    """
+    Run a task in the scheduler leader's process.
+
+    Work that keeps state in the process running it, like the timeshift
+    rings and the post-processing pool, has to happen in the leader. The task
+    is added to the shared job store to run now, and the leader picks it up
+    at once if this is the leader, or at its next renewal otherwise.
+
+    Args:
+        func: Module-level function to run, so the job store can save it
+        *args: Its arguments
+        job_id (str): Job ID; a pending task with the same ID is replaced
+    """
+    # Import scheduler at function level to avoid circular imports
+    from app import scheduler
+    scheduler.add_job(
+        func,
+        'date',
+        run_date=datetime.now(),
+        args=list(args),
+        id=job_id,
+        replace_existing=True
+    )
+
+
+# Process-wide leader election
+scheduler_leader = SchedulerLeader(
+    lease_seconds=Config.SCHEDULER_LEASE_SECONDS,
+    renew_interval=Config.SCHEDULER_LEASE_RENEW
+)
@@ -0,0 +1,273 @@
+import os
+import json
+import logging
+import subprocess
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Source codecs that can be stream-copied into each recording format
+COPY_COMPATIBLE_CODECS = {
+    'mp3': ('mp3',),
+    'aac': ('aac',),
+    'ogg': ('vorbis', 'opus'),
+    'flac': ('flac',),
+    'wav': ('pcm_s16le',)
+}
+
+# Default bitrates of the lossy encoders in kbit/s, and the rates offered when
+# a station broadcasts below them
+DEFAULT_BITRATES = {
+    'mp3': 190,
+    'ogg': 128,
+    'aac': 192
+}
+STANDARD_BITRATES = (32, 48, 64, 96, 128, 160, 192)
+
+def get_ffprobe_path(ffmpeg_path=None):
+    """
+    Get the FFprobe executable that accompanies an FFmpeg executable.
+
+    Args:
+        ffmpeg_path (str, optional): Path of the FFmpeg executable in use
+    """
+    if Config.FFPROBE_PATH:
+        return Config.FFPROBE_PATH
+    if ffmpeg_path and os.path.dirname(ffmpeg_path):
+        return os.path.join(os.path.dirname(ffmpeg_path), 'ffprobe')
+    return 'ffprobe'
+
+def probe_stream(url, ffprobe_path, timeout=15):
+    """
+    Probe the first audio stream of a URL or file.
+
+    Args:
+        url (str): Stream URL or file path
+        ffprobe_path (str): FFprobe executable
+        timeout (int): Seconds to wait before giving up
+
+    Returns:
+        dict: codec_name, sample_rate, channels and bit_rate, or None if the
+        source could not be probed
+    """
+    cmd = [
+        ffprobe_path,
+        '-v', 'error',
+        '-select_streams', 'a:0',
+        '-show_entries', 'stream=codec_name,sample_rate,channels,bit_rate',
+        '-of', 'json',
+        url
+    ]
+
+    try:
+        result = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Could not probe {url}: {str(e)}")
+        return None
+
+    if result.returncode != 0:
+        logger.warning(f"FFprobe failed for {url}: {result.stderr.decode('utf-8', errors='replace').strip()}")
+        return None
+
+    try:
+        streams = json.loads(result.stdout).get('streams') or []
+    except ValueError:
+        return None
+    if not streams:
+        return None
+
+    stream = streams[0]
+    return {
+        'codec_name': stream.get('codec_name'),
+        'sample_rate': _to_int(stream.get('sample_rate')),
+        'channels': _to_int(stream.get('channels')),
+        'bit_rate': _to_int(stream.get('bit_rate'))
+    }
+
+def can_stream_copy(codec_name, audio_format):
+    """Check if audio in the given codec can be saved as a format without re-encoding."""
+    return codec_name in COPY_COMPATIBLE_CODECS.get(audio_format, ())
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def concat_files(paths, output_file, ffmpeg_path, inpoint=None, outpoint=None):
+    """
+    Join audio files end to end without re-encoding, using the concat demuxer.
+
+    Args:
+        paths (list): Files to join, in order
+        output_file (str): Path of the joined file
+        ffmpeg_path (str): FFmpeg executable
+        inpoint (float, optional): Seconds to skip at the start of the first file
+        outpoint (float, optional): Seconds into the last file to stop at
+
+    Returns:
+        bool: True if the joined file was written
+    """
+    list_file = f"{output_file}.concat.txt"
+    try:
+        with open(list_file, 'w') as f:
+            for index, path in enumerate(paths):
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+                if index == 0 and inpoint:
+                    f.write(f"inpoint {inpoint:.3f}\n")
+                if index == len(paths) - 1 and outpoint:
+                    f.write(f"outpoint {outpoint:.3f}\n")
+
+        cmd = [
+            ffmpeg_path,
+            '-y',
+            '-nostdin',
+            '-v', 'error',
+            '-f', 'concat',
+            '-safe', '0',
+            '-i', list_file,
+            '-c', 'copy',
+            output_file
+        ]
+        result = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True)
+        if result.returncode != 0:
+            logger.error(f"Error joining {len(paths)} files into {output_file}: {result.stderr.decode('utf-8', errors='replace').strip()}")
+            return False
+        return True
+    except OSError as e:
+        logger.error(f"Error joining files into {output_file}: {str(e)}")
+        return False
+    finally:
+        if os.path.exists(list_file):
+            os.remove(list_file)
+
+def extract_clip(source, output_file, start, duration, ffmpeg_path, encoding_args=None):
+    """
+    Cut part of an audio file into a new file.
+
+    The seek happens on the input, so FFmpeg jumps straight to the start
+    offset and only reads the clip itself.
+
+    Args:
+        source (str): The file to cut from
+        output_file (str): Path of the clip
+        start (float): Offset of the clip in seconds
+        duration (float): Length of the clip in seconds
+        ffmpeg_path (str): FFmpeg executable
+        encoding_args (list, optional): Encoder options; the audio is copied if not given
+
+    Returns:
+        bool: True if the clip was written
+    """
+    cmd = [
+        ffmpeg_path,
+        '-y',
+        '-nostdin',
+        '-v', 'error',
+        '-ss', f'{start:.3f}',
+        '-i', source,
+        '-t', f'{duration:.3f}',
+        '-vn',
+        '-map_metadata', '0'
+    ] + (encoding_args or ['-c:a', 'copy']) + [output_file]
+
+    try:
+        result = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True)
+    except OSError as e:
+        logger.error(f"Error cutting a clip from {source}: {str(e)}")
+        return False
+    if result.returncode != 0 or not os.path.exists(output_file) or os.path.getsize(output_file) == 0:
+        logger.error(f"Error cutting a clip from {source}: {result.stderr.decode('utf-8', errors='replace').strip()}")
+        return False
+    return True
+
+def probe_media(path, ffprobe_path, timeout=30):
+    """
+    Measure a finished audio file: its duration and its first audio stream.
+
+    Returns:
+        dict: duration in seconds, bit_rate, codec_name, sample_rate and
+        channels, or None if the file could not be probed
+    """
+    cmd = [
+        ffprobe_path,
+        '-v', 'error',
+        '-select_streams', 'a:0',
+        '-show_entries', 'format=duration,bit_rate:stream=codec_name,sample_rate,channels,bit_rate',
+        '-of', 'json',
+        path
+    ]
+
+    try:
+        result = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, timeout=timeout)
+        info = json.loads(result.stdout)
+    except (OSError, subprocess.TimeoutExpired, ValueError) as e:
+        logger.warning(f"Could not probe {path}: {str(e)}")
+        return None
+
+    file_format = info.get('format') or {}
+    stream = (info.get('streams') or [{}])[0]
+    try:
+        duration = float(file_format.get('duration'))
+    except (TypeError, ValueError):
+        logger.warning(f"FFprobe found no duration in {path}")
+        return None
+
+    return {
+        'duration': duration,
+        # Variable bitrate streams only report the overall bitrate
+        'bit_rate': _to_int(stream.get('bit_rate')) or _to_int(file_format.get('bit_rate')),
+        'codec_name': stream.get('codec_name'),
+        'sample_rate': _to_int(stream.get('sample_rate')),
+        'channels': _to_int(stream.get('channels'))
+    }
+
+def get_target_bitrate(audio_format, source_bit_rate=None):
+    """
+    Choose the bitrate to encode a lossy format at.
+
+    Re-encoding above the station's own bitrate only wastes space, so a
+    station broadcasting below the encoder default is matched instead.
+
+    Args:
+        audio_format (str): The recording format
+        source_bit_rate (int, optional): The station's bitrate in bits per second
+
+    Returns:
+        int: Bitrate in kbit/s, or None if the encoder default should be used
+    """
+    default = DEFAULT_BITRATES.get(audio_format)
+    if not default or not source_bit_rate:
+        return None
+    source_kbps = source_bit_rate / 1000
+    if source_kbps >= default:
+        return None
+    return next((rate for rate in STANDARD_BITRATES if rate >= source_kbps), None)
+
+def estimate_recording_size(audio_format, duration_seconds, probe=None, stream_copy=False):
+    """
+    Estimate the size of a recording in bytes.
+
+    Args:
+        audio_format (str): The recording format
+        duration_seconds (int): Length of the recording
+        probe (StationProbe, optional): The station's stream characteristics
+        stream_copy (bool): Whether the broadcast is saved without re-encoding
+    """
+    bit_rate = probe.bit_rate if probe else None
+    sample_rate = (probe.sample_rate if probe else None) or 44100
+    channels = (probe.channels if probe else None) or 2
+
+    if audio_format == 'wav':
+        bits_per_second = sample_rate * channels * 16
+    elif audio_format == 'flac':
+        # FLAC typically halves PCM
+        bits_per_second = sample_rate * channels * 16 * 0.6
+    elif stream_copy and bit_rate:
+        bits_per_second = bit_rate
+    else:
+        kbps = get_target_bitrate(audio_format, bit_rate) or DEFAULT_BITRATES.get(audio_format, 190)
+        bits_per_second = kbps * 1000
+    return int(bits_per_second * duration_seconds / 8)
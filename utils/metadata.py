@@ -0,0 +1,75 @@
+import logging
+
+from sqlalchemy import and_
+
+from models import MediaMetadata
+from utils.media import probe_media
+
+logger = logging.getLogger(__name__)
+
+# Rows of metadata checked per query when pruning
+PRUNE_BATCH_SIZE = 500
+
+
+def metadata_join(path_column, size_column, mtime_column):
+    """
+    Join condition matching a file's stored path, size and mtime to its
+    metadata, for pages that show measured durations without probing.
+    """
+    return and_(
+        MediaMetadata.path == path_column,
+        MediaMetadata.size == size_column,
+        MediaMetadata.mtime == mtime_column
+    )
+
+def get_media_metadata(session, path, size, mtime, ffprobe_path):
+    """
+    Get the metadata of one version of a file, probing it the first time.
+
+    Probing runs FFprobe, so this is only called from post-processing and
+    the file reconciler, never while handling a request. A file that can't
+    be probed is stored without a duration so it isn't probed again.
+
+    Args:
+        session: The database session
+        path (str): The file
+        size (int): Its size in bytes
+        mtime (float): Its modification time
+        ffprobe_path (str): FFprobe executable
+
+    Returns:
+        MediaMetadata: The file's metadata
+    """
+    metadata = session.query(MediaMetadata).filter_by(path=path, size=size, mtime=mtime).first()
+    if metadata is None:
+        info = probe_media(path, ffprobe_path) or {}
+        metadata = MediaMetadata(path=path, size=size, mtime=mtime, **info)
+        session.add(metadata)
+        logger.debug(f"Probed {path}: {info}")
+    return metadata
+
+def prune_media_metadata(session, keys):
+    """
+    Delete the metadata of file versions no longer in use.
+
+    Args:
+        session: The database session
+        keys (set): (path, size, mtime) of every file still referenced
+    """
+    deleted = 0
+    last_id = 0
+    while True:
+        # A batch at a time, so the table is never loaded whole
+        rows = session.query(MediaMetadata.id, MediaMetadata.path, MediaMetadata.size, MediaMetadata.mtime).filter(
+            MediaMetadata.id > last_id
+        ).order_by(MediaMetadata.id).limit(PRUNE_BATCH_SIZE).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        stale = [row.id for row in rows if (row.path, row.size, row.mtime) not in keys]
+        if stale:
+            deleted += session.query(MediaMetadata).filter(
+                MediaMetadata.id.in_(stale)
+            ).delete(synchronize_session=False)
+    if deleted:
+        logger.info(f"Deleted metadata of {deleted} old file version(s)")
@@ -20,14 +20,9 @@ def send_notification(message, recording_id=None):
             # Check if notifications should be sent for this recording
             if recording_id:
                 from models import Recording, RecurringRecording
-                from sqlalchemy.orm import sessionmaker
-                from sqlalchemy import create_engine
-                from config import Config
+                from utils.db import get_db_session
                 
-                # Create a new session
-                engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
-                Session = sessionmaker(bind=engine)
-                session = Session()
+                session = get_db_session()
                 
                 # Try to find the recording
                 recording = session.query(Recording).get(recording_id)
@@ -57,14 +52,10 @@ def send_pushover_notification(message):
     from app import app
     
     with app.app_context():
-        user_key = current_app.config.get('PUSHOVER_USER_KEY')
-        api_token = current_app.config.get('PUSHOVER_API_TOKEN')
-        
-        # Try to get from AppSettings if not in config
-        if not user_key or not api_token:
-            from models import AppSettings
-            user_key = user_key or AppSettings.get('PUSHOVER_USER_KEY')
-            api_token = api_token or AppSettings.get('PUSHOVER_API_TOKEN')
+        # Settings saved in the app take precedence over the environment
+        from models import AppSettings
+        user_key = AppSettings.get('PUSHOVER_USER_KEY') or current_app.config.get('PUSHOVER_USER_KEY')
+        api_token = AppSettings.get('PUSHOVER_API_TOKEN') or current_app.config.get('PUSHOVER_API_TOKEN')
         
         if not user_key or not api_token:
             logger.debug("Pushover not configured, skipping notification")
@@ -0,0 +1,102 @@
+import json
+import base64
+import logging
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+logger = logging.getLogger(__name__)
+
+# Sort values a cursor may carry; anything else can't be compared with a column
+CURSOR_VALUE_TYPES = (str, int, float, type(None))
+
+
+def encode_cursor(value, row_id):
+    """Encode a row's sort value and ID as an opaque, URL-safe cursor."""
+    if isinstance(value, datetime):
+        payload = ['dt', value.isoformat(), row_id]
+    else:
+        payload = ['v', value, row_id]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor made by encode_cursor().
+
+    Returns:
+        tuple: The sort value and row ID, or None if the cursor is invalid
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(payload, list):
+            raise ValueError('not a list')
+        kind, value, row_id = payload
+        if not isinstance(row_id, int) or isinstance(row_id, bool):
+            raise ValueError('row ID is not an integer')
+        if kind == 'dt' and isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        elif kind != 'v' or not isinstance(value, CURSOR_VALUE_TYPES) or isinstance(value, bool):
+            raise ValueError('unsupported sort value')
+        return value, row_id
+    except (ValueError, TypeError):
+        logger.debug(f"Ignoring invalid cursor {cursor!r}")
+        return None
+
+
+class KeysetPage:
+    """
+    One page of a query ordered by a sort column and then the row ID.
+
+    Pages continue from the last row shown rather than skipping an offset,
+    so with an index on the sort column every page costs the same, however
+    far back it is.
+
+    Args:
+        query: The query to page through, without ordering
+        sort_column: Column to order by
+        id_column: Unique column breaking ties, normally the primary key
+        sort_key (str): Attribute of a result row holding the sort value
+        descending (bool): Whether the newest or largest rows come first
+        per_page (int): Rows on a page
+        after (str, optional): Cursor of the row the page starts after
+        before (str, optional): Cursor of the row the page ends before
+    """
+
+    def __init__(self, query, sort_column, id_column, sort_key, descending, per_page, after=None, before=None):
+        position = decode_cursor(before) if before else decode_cursor(after) if after else None
+        backwards = bool(before) and position is not None
+
+        # Going backwards reads in the opposite order and flips the rows after
+        reverse = descending != backwards
+        keys = tuple_(sort_column, id_column)
+        if position is not None:
+            query = query.filter(keys < tuple_(*position) if reverse else keys > tuple_(*position))
+        if reverse:
+            query = query.order_by(sort_column.desc(), id_column.desc())
+        else:
+            query = query.order_by(sort_column.asc(), id_column.asc())
+
+        rows = query.limit(per_page + 1).all()
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+        if backwards:
+            rows.reverse()
+
+        self.items = rows
+        self._sort_key = sort_key
+        self.has_next = more if not backwards else True
+        self.has_prev = position is not None and (more if backwards else True)
+
+    def _cursor(self, row):
+        return encode_cursor(getattr(row, self._sort_key), row.id)
+
+    @property
+    def next_cursor(self):
+        """Cursor for the following page, or None on the last page."""
+        return self._cursor(self.items[-1]) if self.has_next and self.items else None
+
+    @property
+    def prev_cursor(self):
+        """Cursor for the preceding page, or None on the first page."""
+        return self._cursor(self.items[0]) if self.has_prev and self.items else None
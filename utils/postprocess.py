@@ -0,0 +1,324 @@
+import os
+import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from models import Recording, PostProcessStep, PodcastEpisode
+from utils.notifications import send_notification
+from utils.storage import save_to_additional_locations
+from utils.files import record_file_stat
+from utils.metadata import get_media_metadata
+from utils.media import get_ffprobe_path
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Steps run after a recording completes, in order
+COMPLETION_STEPS = ['finalize', 'copy', 'podcast', 'retention', 'notify']
+
+# Steps that save a recording from a station's timeshift ring
+TIMESHIFT_STEPS = ['extract', 'finalize', 'notify']
+
+# Steps that read or write the whole recording file
+HEAVY_STEPS = {'extract', 'finalize', 'copy'}
+
+# Seconds before a failed step is tried again
+RETRY_DELAY = 60
+
+
+class StepAborted(Exception):
+    """Raised by a step when the remaining steps of a recording cannot run."""
+
+
+def extract_step(session, recording):
+    """Copy the recording's time window out of its station's timeshift ring."""
+    from utils.timeshift import timeshift_manager
+
+    ring = timeshift_manager.get(recording.station_id)
+    if ring is None:
+        recording.status = 'failed'
+        raise StepAborted(f"Station {recording.station_id} has no timeshift capture running")
+
+    end_time = recording.start_time + timedelta(minutes=recording.duration)
+    if not ring.extract(recording.start_time, end_time, recording.local_path):
+        raise Exception(f"Could not extract {recording.start_time} to {end_time} from the timeshift")
+
+def finalize_step(session, recording):
+    """Join segments or partial files, then record the size and measured metadata of the final file."""
+    from utils.recorder import finalize_recording_file, get_ffmpeg_path, get_segment_dir
+
+    finalize_recording_file(
+        recording,
+        recording.local_path,
+        get_ffmpeg_path(session),
+        get_segment_dir(recording.id, recording.local_path)
+    )
+
+    # Downloads and deletions use the stored path, size and mtime
+    if not record_file_stat(recording, recording.local_path):
+        if recording.status == 'processing':
+            recording.status = 'failed'
+        raise StepAborted(f"Output file not found: {recording.local_path}")
+
+    # Probe the finished file once; feeds and lists read the stored result
+    metadata = get_media_metadata(
+        session,
+        recording.local_path,
+        recording.file_size,
+        recording.file_mtime,
+        get_ffprobe_path(get_ffmpeg_path(session))
+    )
+    if metadata.duration is not None:
+        recording.recorded_duration = int(metadata.duration)
+
+    if recording.status == 'processing':
+        recording.status = 'completed'
+
+def copy_step(session, recording):
+    """Save the recording to its additional locations."""
+    save_to_additional_locations(recording)
+
+def podcast_step(session, recording):
+    """Create a podcast episode if the recording's recurring recording has a podcast."""
+    if not recording.recurring:
+        return
+    recurring = recording.recurring[0]
+    if not (recurring.create_podcast and recurring.podcast):
+        return
+
+    # Don't add the episode twice if the step is retried
+    if session.query(PodcastEpisode).filter_by(recording_id=recording.id).first():
+        return
+
+    # Get the filename without extension as the episode title
+    episode_name = os.path.splitext(os.path.basename(recording.local_path))[0]
+
+    episode = PodcastEpisode(
+        podcast_id=recurring.podcast.id,
+        title=episode_name,  # Use filename without extension as title
+        description=f"Episode recorded on {recording.start_time.strftime('%Y-%m-%d')}",
+        file_path=recording.local_path,
+        file_size=recording.file_size,
+        file_mtime=recording.file_mtime,
+        duration=recording.recorded_duration or recording.duration * 60,  # Convert minutes to seconds
+        recording_id=recording.id,
+        publication_date=recording.start_time  # Use recording start time instead of default
+    )
+    session.add(episode)
+
+def retention_step(session, recording):
+    """Delete the oldest recordings of a recurring recording beyond its keep limit."""
+    if not recording.recurring:
+        return
+    recurring = recording.recurring[0]
+    if recurring.keep_recordings <= 0:
+        return
+
+    # Get all recordings for this recurring recording, newest first
+    all_recordings = sorted(recurring.recordings, key=lambda r: r.start_time, reverse=True)
+
+    for old_recording in all_recordings[recurring.keep_recordings:]:
+        # Delete the file if it exists
+        if old_recording.local_path and os.path.exists(old_recording.local_path):
+            try:
+                os.remove(old_recording.local_path)
+            except Exception as e:
+                logger.error(f"Error deleting old recording file: {str(e)}")
+
+        # Remove from recurring recordings but don't delete the recording itself
+        recurring.recordings.remove(old_recording)
+
+def notify_step(session, recording):
+    """Send the completion notification."""
+    hours = recording.duration // 60
+    minutes = recording.duration % 60
+    file_size_mb = (recording.file_size or 0) / (1024 * 1024)
+
+    notification_message = (
+        f"Recorded {hours} hour{'s' if hours != 1 else ''} and {minutes} minute{'s' if minutes != 1 else ''} "
+        f"of {recording.name}. The file size is {file_size_mb:.2f} MB."
+    )
+    send_notification(notification_message, recording.id)
+
+STEP_FUNCTIONS = {
+    'extract': extract_step,
+    'finalize': finalize_step,
+    'copy': copy_step,
+    'podcast': podcast_step,
+    'retention': retention_step,
+    'notify': notify_step
+}
+
+
+class PostProcessor:
+    """
+    Run the post-processing steps of finished recordings on a bounded pool.
+
+    Steps are stored as PostProcessStep rows, so work left pending when the
+    application stops is picked up again on startup. Each recording's steps
+    run in order on one worker; different recordings run side by side.
+    Heavy steps are further limited to a few at a time, and all workers run
+    at a lower CPU priority than the captures.
+    """
+
+    def __init__(self, workers, heavy_slots, niceness):
+        self._niceness = niceness
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='postprocess',
+            initializer=self._lower_priority
+        )
+        self._heavy = threading.BoundedSemaphore(heavy_slots)
+        self._lock = threading.Lock()
+        self._running = set()
+        self._resubmitted = set()
+
+    def enqueue(self, session, recording, steps=COMPLETION_STEPS):
+        """
+        Add post-processing steps to a recording. The caller commits the
+        session and then calls submit().
+
+        Args:
+            session: The database session the recording belongs to
+            recording: The Recording object
+            steps (list): Names of the steps to run, in order
+        """
+        for step in steps:
+            recording.post_process_steps.append(PostProcessStep(step=step, status='pending', attempts=0))
+
+    def submit(self, recording_id):
+        """Run a recording's pending steps on the pool."""
+        with self._lock:
+            if recording_id in self._running:
+                # The running worker picks up the new steps before it finishes
+                self._resubmitted.add(recording_id)
+                return
+            self._running.add(recording_id)
+        self._executor.submit(self._run, recording_id)
+
+    def resume_pending(self, session):
+        """Requeue steps left pending or running when the application stopped."""
+        steps = session.query(PostProcessStep).filter(PostProcessStep.status.in_(['pending', 'running'])).all()
+        for step in steps:
+            step.status = 'pending'
+        session.commit()
+
+        recording_ids = sorted({step.recording_id for step in steps})
+        if recording_ids:
+            logger.info(f"Resuming post-processing for {len(recording_ids)} recording(s)")
+        for recording_id in recording_ids:
+            self.submit(recording_id)
+
+    def run_heavy(self, func, *args):
+        """Run a one-off heavy task, such as cutting a clip, on the pool."""
+        def run():
+            with self._heavy:
+                try:
+                    func(*args)
+                except Exception as e:
+                    logger.error(f"Error in post-processing task {func.__name__}: {str(e)}")
+        self._executor.submit(run)
+
+    def _lower_priority(self):
+        # Linux schedules threads individually, and FFmpeg processes started
+        # from this thread inherit its priority
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self._niceness)
+        except (AttributeError, OSError) as e:
+            logger.debug(f"Could not lower post-processing priority: {str(e)}")
+
+    def _run(self, recording_id):
+        # Import app at function level to avoid circular imports
+        from app import app
+        from utils.db import get_db_session
+
+        with app.app_context():
+            while True:
+                session = get_db_session()
+                try:
+                    self._run_pending_steps(session, recording_id)
+                except Exception as e:
+                    logger.error(f"Error post-processing recording {recording_id}: {str(e)}")
+                finally:
+                    session.close()
+
+                with self._lock:
+                    if recording_id not in self._resubmitted:
+                        self._running.discard(recording_id)
+                        return
+                    self._resubmitted.discard(recording_id)
+
+    def _run_pending_steps(self, session, recording_id):
+        recording = session.query(Recording).get(recording_id)
+        if not recording:
+            return
+
+        for step in recording.post_process_steps:
+            if step.status != 'pending':
+                continue
+
+            step.status = 'running'
+            step.attempts += 1
+            session.commit()
+
+            try:
+                if step.step in HEAVY_STEPS:
+                    with self._heavy:
+                        STEP_FUNCTIONS[step.step](session, recording)
+                else:
+                    STEP_FUNCTIONS[step.step](session, recording)
+                step.status = 'done'
+                step.error = None
+                session.commit()
+            except StepAborted as e:
+                logger.error(f"Post-processing of recording {recording_id} stopped at {step.step}: {str(e)}")
+                self._abort(session, recording, step, str(e))
+                return
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Post-processing step {step.step} failed for recording {recording_id}: {str(e)}")
+                step.error = str(e)
+                if step.attempts < Config.POSTPROCESS_MAX_ATTEMPTS:
+                    step.status = 'pending'
+                    session.commit()
+                    self._retry_later(recording_id)
+                    return
+                if step.step in ('extract', 'finalize'):
+                    recording.status = 'failed'
+                    self._abort(session, recording, step, str(e))
+                    return
+                step.status = 'failed'
+                session.commit()
+
+    def _abort(self, session, recording, failed_step, error):
+        failed_step.status = 'failed'
+        failed_step.error = error
+        for step in recording.post_process_steps:
+            if step.status == 'pending':
+                step.status = 'skipped'
+        session.commit()
+
+    def _retry_later(self, recording_id):
+        from app import scheduler
+        scheduler.add_job(
+            submit_post_processing,
+            'date',
+            run_date=datetime.now() + timedelta(seconds=RETRY_DELAY),
+            args=[recording_id],
+            id=f'postprocess_{recording_id}',
+            replace_existing=True
+        )
+
+
+# Process-wide post-processing pool
+post_processor = PostProcessor(
+    workers=Config.POSTPROCESS_WORKERS,
+    heavy_slots=Config.POSTPROCESS_HEAVY_SLOTS,
+    niceness=Config.POSTPROCESS_NICE
+)
+
+
+def submit_post_processing(recording_id):
+    """Run a recording's pending steps; a scheduler job, so it runs in the scheduler leader."""
+    post_processor.submit(recording_id)
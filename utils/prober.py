@@ -0,0 +1,139 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, and_
+
+from models import RadioStation, StationProbe
+from utils.media import probe_stream, get_ffprobe_path
+from utils.resolver import stream_resolver, measure_connect_latency
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Stations checked at the same time
+PROBE_WORKERS = 4
+
+# Stations being probed for a recording that found no recent result
+_pending_lock = threading.Lock()
+_pending = set()
+_executor = ThreadPoolExecutor(max_workers=PROBE_WORKERS, thread_name_prefix='probe')
+
+
+def sample_station(station_id, stream_url, ffmpeg_path):
+    """
+    Check a station's stream: whether it answers, how quickly, and what it
+    broadcasts.
+
+    Args:
+        station_id (int): The station ID
+        stream_url (str): The station's stream, with any playlist already resolved
+        ffmpeg_path (str): FFmpeg executable, to find FFprobe
+
+    Returns:
+        dict: Fields for a StationProbe row
+    """
+    result = {'station_id': station_id, 'url': stream_url, 'probed_at': datetime.utcnow()}
+
+    latency = measure_connect_latency(stream_url)
+    stream = probe_stream(stream_url, get_ffprobe_path(ffmpeg_path))
+    if stream is None:
+        result.update(reachable=False, error='Stream could not be probed' if latency else 'Stream did not answer')
+        return result
+
+    result.update(stream, reachable=True)
+    if latency is not None:
+        result['latency_ms'] = int(latency * 1000)
+    return result
+
+def probe_station(session, station_id, stream_url, ffmpeg_path):
+    """
+    Check a station now and store the result.
+
+    Returns:
+        StationProbe: The stored result
+    """
+    probe = StationProbe(**sample_station(station_id, stream_url, ffmpeg_path))
+    session.add(probe)
+    session.commit()
+    return probe
+
+def probe_station_later(station_id, stream_url, ffmpeg_path):
+    """
+    Check a station in the background and store the result, so a recording
+    that found no recent result doesn't wait on the network. A station
+    already being checked is not checked twice.
+    """
+    key = (station_id, stream_url)
+    with _pending_lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+
+    def run():
+        from utils.db import get_db_session
+
+        session = get_db_session()
+        try:
+            probe = probe_station(session, station_id, stream_url, ffmpeg_path)
+            if probe.reachable:
+                logger.info(f"Probed station {station_id}: {probe.codec_name}, {probe.sample_rate} Hz, {probe.bit_rate} bit/s")
+            else:
+                logger.warning(f"Station {station_id} is unreachable: {probe.error}")
+        except Exception as e:
+            logger.error(f"Error probing station {station_id}: {str(e)}")
+        finally:
+            session.close()
+            with _pending_lock:
+                _pending.discard(key)
+
+    _executor.submit(run)
+
+def probe_all_stations():
+    """Check every station and prune old results; run periodically by the scheduler."""
+    # Import app at function level to avoid circular imports
+    from app import app
+    from utils.db import get_db_session
+    from utils.recorder import get_ffmpeg_path
+
+    with app.app_context():
+        session = get_db_session()
+        try:
+            ffmpeg_path = get_ffmpeg_path(session)
+            stations = [(station.id, station.url) for station in session.query(RadioStation).all()]
+
+            # Probing waits on the network, so stations are checked side by side
+            def check(station):
+                station_id, url = station
+                return sample_station(station_id, stream_resolver.resolve(station_id, url), ffmpeg_path)
+
+            with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as executor:
+                results = list(executor.map(check, stations))
+
+            for result in results:
+                session.add(StationProbe(**result))
+                if not result['reachable']:
+                    logger.warning(f"Station {result['station_id']} is unreachable: {result['error']}")
+
+            oldest = datetime.utcnow() - timedelta(days=Config.STATION_PROBE_RETENTION_DAYS)
+            session.query(StationProbe).filter(StationProbe.probed_at < oldest).delete(synchronize_session=False)
+            session.commit()
+            logger.info(f"Checked {len(results)} station(s)")
+        except Exception as e:
+            logger.error(f"Error checking stations: {str(e)}")
+        finally:
+            session.close()
+
+def get_latest_probes(session):
+    """Return the most recent check of each station, keyed by station ID."""
+    latest = session.query(
+        StationProbe.station_id,
+        func.max(StationProbe.probed_at).label('probed_at')
+    ).group_by(StationProbe.station_id).subquery()
+
+    probes = session.query(StationProbe).join(latest, and_(
+        StationProbe.station_id == latest.c.station_id,
+        StationProbe.probed_at == latest.c.probed_at
+    )).all()
+    return {probe.station_id: probe for probe in probes}
@@ -7,21 +7,234 @@ import psutil
 from datetime import datetime, timedelta
 import threading
 import signal
+from functools import partial
 from flask import current_app
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 import sys
 
 # Add parent directory to path to import models
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from models import Recording, RecurringRecording, Podcast, PodcastEpisode, db
+from models import Recording, RecordingPart, RecurringRecording, Podcast, StationProbe, db
+from utils.db import get_db_session, status_writer
 from utils.notifications import send_notification
-from utils.storage import save_to_additional_locations
+from utils.postprocess import post_processor
+from utils.supervisor import supervisor
+from utils.ingest import ingest_hub, get_feed, PCM_FEED
+from utils.admission import AdmissionController, ADMISSION_SAMPLE_INTERVAL, ADMISSION_RETRY_INTERVAL
+from utils.scheduling import get_scheduled_start
+from utils.resolver import stream_resolver
+from utils.media import (can_stream_copy, concat_files,
+                         get_target_bitrate, estimate_recording_size)
+from utils.prober import probe_station_later
+from config import Config
 
 logger = logging.getLogger(__name__)
 
-# Dictionary to keep track of active recording processes
-active_recordings = {}
+# How often the stall watchdog runs, in seconds
+STALL_CHECK_INTERVAL = 5
+
+# Grace period between asking a stalled FFmpeg to exit and killing it
+STALL_KILL_GRACE = 10
+
+# Seconds a warmed-up ingest waits past the start time for its capture
+PREROLL_GRACE = 30
+
+# Seconds a deposed leader waits for its captures to exit before killing them
+HAND_OVER_TIMEOUT = 10
+
+# Segment muxer output format for each recording format
+SEGMENT_FORMATS = {
+    'mp3': 'mp3',
+    'ogg': 'ogg',
+    'aac': 'adts',
+    'flac': 'flac',
+    'wav': 'wav'
+}
+
+class RecordingRegistry:
+    """Thread-safe registry of the recordings this process is tracking."""
+    
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}
+    
+    def add(self, recording_id, **info):
+        """Register a recording, replacing any previous entry."""
+        with self._lock:
+            self._entries[recording_id] = dict(info)
+    
+    def get(self, recording_id):
+        """Return a copy of a recording's entry, or None if not tracked."""
+        with self._lock:
+            entry = self._entries.get(recording_id)
+            return dict(entry) if entry is not None else None
+    
+    def update(self, recording_id, **fields):
+        """Update fields of a tracked recording. Returns False if not tracked."""
+        with self._lock:
+            entry = self._entries.get(recording_id)
+            if entry is None:
+                return False
+            entry.update(fields)
+            return True
+    
+    def remove(self, recording_id):
+        """Stop tracking a recording and return its last entry."""
+        with self._lock:
+            return self._entries.pop(recording_id, None)
+    
+    def snapshot(self):
+        """Return a point-in-time copy of all entries."""
+        with self._lock:
+            return {key: dict(entry) for key, entry in self._entries.items()}
+    
+    def __contains__(self, recording_id):
+        with self._lock:
+            return recording_id in self._entries
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+# Registry of active recording processes
+active_recordings = RecordingRegistry()
+
+# Admission control for new captures, measuring the running ones
+admission_controller = AdmissionController(active_recordings)
+
+def _parse_out_time(value):
+    """Convert an FFmpeg HH:MM:SS.micro timestamp to seconds."""
+    try:
+        hours, minutes, seconds = value.split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except (AttributeError, ValueError):
+        return None
+
+def _parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _parse_bitrate(value):
+    """Convert an FFmpeg bitrate such as '128.0kbits/s' to kbit/s."""
+    try:
+        return float(value.replace('kbits/s', ''))
+    except (AttributeError, ValueError):
+        return None
+
+class ProgressTracker:
+    """Accumulate the key=value blocks FFmpeg writes with -progress."""
+    
+    def __init__(self, recording_id, scheduled_start=None):
+        self.recording_id = recording_id
+        self.scheduled_start = scheduled_start
+        self._block = {}
+        self._last_size = -1
+        self._last_out_time = -1
+        self._measured_latency = False
+    
+    def feed(self, line):
+        """Handle one line of progress output."""
+        key, sep, value = line.decode('utf-8', errors='replace').partition('=')
+        if not sep:
+            return
+        key = key.strip()
+        value = value.strip()
+        
+        # Each block ends with a 'progress' line
+        if key != 'progress':
+            self._block[key] = value
+            return
+        
+        progress = {
+            'out_time': _parse_out_time(self._block.get('out_time')),
+            'total_size': _parse_int(self._block.get('total_size')),
+            'bitrate': _parse_bitrate(self._block.get('bitrate')),
+            'updated_at': datetime.now()
+        }
+        self._block = {}
+        
+        fields = {'progress': progress}
+        if progress['total_size'] is not None and progress['total_size'] > self._last_size:
+            self._last_size = progress['total_size']
+            fields['last_growth'] = time.monotonic()
+            
+            # Show the size so far to every web worker; the writer keeps only the latest
+            status_writer.update(Recording, self.recording_id, file_size=progress['total_size'])
+        
+        # The segment muxer reports total_size=N/A, which is no data rather
+        # than no growth, so audio captured counts as growth too
+        if progress['out_time'] is not None and progress['out_time'] > self._last_out_time:
+            self._last_out_time = progress['out_time']
+            fields['last_growth'] = time.monotonic()
+        
+        # The first audio was captured out_time seconds before this report
+        if (not self._measured_latency and self.scheduled_start
+                and progress['out_time'] and progress['total_size'] != 0):
+            self._measured_latency = True
+            first_audio = progress['updated_at'] - timedelta(seconds=progress['out_time'])
+            fields['start_latency'] = (first_audio - self.scheduled_start).total_seconds()
+            logger.info(f"Recording {self.recording_id} started {fields['start_latency']:.2f} seconds after its start time")
+        active_recordings.update(self.recording_id, **fields)
+
+def check_stalled_recordings():
+    """Stop captures whose output has not grown within the stall timeout."""
+    now = time.monotonic()
+    for recording_id, entry in active_recordings.snapshot().items():
+        # Adopted processes from a previous run report no progress
+        last_growth = entry.get('last_growth')
+        if last_growth is None or now - last_growth < Config.RECORDING_STALL_TIMEOUT:
+            continue
+        
+        process = entry['process']
+        if entry.get('stalled_at') is None:
+            logger.warning(f"Recording {recording_id} has not grown for {now - last_growth:.0f} seconds, restarting capture")
+            active_recordings.update(recording_id, stalled_at=now, interrupted=True)
+            process.terminate()
+        elif now - entry['stalled_at'] > STALL_KILL_GRACE:
+            logger.warning(f"FFmpeg for stalled recording {recording_id} ignored SIGTERM, killing it")
+            process.kill()
+
+supervisor.add_periodic(STALL_CHECK_INTERVAL, check_stalled_recordings)
+supervisor.add_periodic(ADMISSION_SAMPLE_INTERVAL, admission_controller.sample)
+
+def _interrupt_recording(recording_id, reason):
+    """Mark a capture so its exit is handled as an interruption."""
+    logger.warning(f"Recording {recording_id} interrupted: {reason}")
+    active_recordings.update(recording_id, interrupted=True)
+
+class DummyProcess:
+    """A capture started by another process, tracked by its process ID."""
+    
+    def __init__(self, pid):
+        self.pid = pid
+    
+    def poll(self):
+        return None if is_process_running(self.pid) else 1
+    
+    def terminate(self):
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    
+    def kill(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+def adopt_recording(recording):
+    """Track a capture still running from a previous run or scheduler leader."""
+    active_recordings.add(
+        recording.id,
+        process=DummyProcess(recording.process_id),
+        adopted=True,
+        start_time=recording.start_time,
+        end_time=recording.start_time + timedelta(minutes=recording.duration),
+        output_file=recording.local_path,
+        is_recurring=len(recording.recurring) > 0
+    )
 
 def is_process_running(pid):
     """Check if a process with the given PID is running."""
@@ -34,13 +247,187 @@ def is_process_running(pid):
     except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
         return False
 
-def get_db_session():
-    """Create a new database session."""
-    # Create a new session for background tasks to avoid thread issues
-    from config import Config
-    engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
-    Session = sessionmaker(bind=engine)
-    return Session()
+def get_ffmpeg_path(session):
+    """Get the FFmpeg executable from the environment or app settings."""
+    # Get FFmpeg path from environment variable or app settings
+    ffmpeg_path = os.environ.get('FFMPEG_PATH')
+    
+    # If not in environment, try to get from app settings
+    if not ffmpeg_path:
+        from models import AppSettings
+        ffmpeg_path = AppSettings.get('FFMPEG_PATH')
+    
+    # Default to 'ffmpeg' if not found anywhere
+    return ffmpeg_path or 'ffmpeg'
+
+def get_segment_dir(recording_id, output_file):
+    """Get the directory holding a segmented recording's segments."""
+    return os.path.join(os.path.dirname(output_file), '.segments', f'recording-{recording_id}')
+
+def list_segments(segment_dir):
+    """List a recording's segments in recording order."""
+    if not os.path.isdir(segment_dir):
+        return []
+    return [
+        os.path.join(segment_dir, name)
+        for name in sorted(os.listdir(segment_dir))
+        if name.startswith('seg-')
+    ]
+
+def get_segment_output_args(segment_dir, audio_format):
+    """
+    Get FFmpeg output options that write fixed-length segments, continuing the
+    numbering of any segments left by an earlier attempt.
+    """
+    ext = audio_format if audio_format in SEGMENT_FORMATS else 'mp3'
+    return [
+        '-f', 'segment',
+        '-segment_format', SEGMENT_FORMATS[ext],
+        '-segment_time', str(Config.SEGMENT_SECONDS),
+        '-segment_start_number', str(len(list_segments(segment_dir))),
+        '-reset_timestamps', '1',
+        os.path.join(segment_dir, f'seg-%05d.{ext}')
+    ]
+
+def assemble_segments(segment_dir, output_file, ffmpeg_path):
+    """
+    Join a recording's segments into its final file and remove them.
+    
+    Returns:
+        bool: True if the final file was written
+    """
+    segments = list_segments(segment_dir)
+    if not segments:
+        logger.error(f"No segments found in {segment_dir}")
+        return False
+    
+    if not concat_files(segments, output_file, ffmpeg_path):
+        return False
+    
+    logger.info(f"Assembled {len(segments)} segments into {os.path.basename(output_file)}")
+    shutil.rmtree(segment_dir, ignore_errors=True)
+    return True
+
+def save_partial_file(recording, output_file):
+    """Keep an interrupted capture's output as the recording's next numbered part."""
+    sequence = max((part.sequence for part in recording.parts), default=0) + 1
+    base_name, ext = os.path.splitext(output_file)
+    partial_file = f"{base_name}-part{sequence}{ext}"
+    
+    os.rename(output_file, partial_file)
+    recording.parts.append(RecordingPart(
+        sequence=sequence,
+        file_path=partial_file,
+        file_size=os.path.getsize(partial_file)
+    ))
+    logger.info(f"Created partial file: {partial_file}")
+
+def merge_recording_parts(recording, output_file, ffmpeg_path):
+    """
+    Join a recording's partial files, followed by the last capture if it
+    exists, into its final file without re-encoding.
+    
+    Returns:
+        bool: True if the final file was written
+    """
+    parts = [part.file_path for part in recording.parts if os.path.exists(part.file_path)]
+    files = parts + ([output_file] if os.path.exists(output_file) else [])
+    if not parts:
+        return False
+    
+    if len(files) == 1:
+        os.rename(files[0], output_file)
+    else:
+        base_name, ext = os.path.splitext(output_file)
+        merged_file = f"{base_name}-merged{ext}"
+        if not concat_files(files, merged_file, ffmpeg_path):
+            return False
+        os.replace(merged_file, output_file)
+        for path in parts:
+            os.remove(path)
+    
+    logger.info(f"Merged {len(files)} pieces into {os.path.basename(output_file)}")
+    recording.parts.clear()
+    return True
+
+def finalize_recording_file(recording, output_file, ffmpeg_path, segment_dir=None):
+    """
+    Build a recording's final file from its segments or partial files.
+    """
+    if segment_dir and os.path.isdir(segment_dir):
+        joined = assemble_segments(segment_dir, output_file, ffmpeg_path)
+    elif recording.parts:
+        joined = merge_recording_parts(recording, output_file, ffmpeg_path)
+    else:
+        return
+    
+    # finalize_step() records the joined file's size and probes it
+    if not joined:
+        logger.warning(f"Could not join the pieces of recording {recording.id}")
+
+def get_encoding_params(audio_format, source_bit_rate=None):
+    """
+    Get the FFmpeg encoder options for a recording format.
+    
+    Args:
+        audio_format (str): The recording format
+        source_bit_rate (int, optional): The station's bitrate in bits per second;
+            lossy formats are not encoded above it
+    """
+    bitrate = get_target_bitrate(audio_format, source_bit_rate)
+    if bitrate:
+        encoder = {'mp3': 'libmp3lame', 'ogg': 'libvorbis', 'aac': 'aac'}[audio_format]
+        return ['-c:a', encoder, '-b:a', f'{bitrate}k']
+    
+    if audio_format == 'mp3':
+        return ['-c:a', 'libmp3lame', '-q:a', '2']
+    elif audio_format == 'ogg':
+        return ['-c:a', 'libvorbis', '-q:a', '4']
+    elif audio_format == 'aac':
+        return ['-c:a', 'aac', '-b:a', '192k']
+    elif audio_format == 'flac':
+        return ['-c:a', 'flac']
+    elif audio_format == 'wav':
+        return ['-c:a', 'pcm_s16le']
+    else:
+        # Default to mp3
+        return ['-c:a', 'libmp3lame', '-q:a', '2']
+
+def check_disk_space(output_file, estimated_size):
+    """Log a warning if a recording's estimated size exceeds the free disk space."""
+    try:
+        free = shutil.disk_usage(os.path.dirname(output_file)).free
+    except OSError:
+        return
+    if estimated_size > free:
+        logger.warning(f"Recording {os.path.basename(output_file)} needs about {estimated_size / (1024 * 1024):.0f} MB "
+                       f"but only {free / (1024 * 1024):.0f} MB are free")
+
+def get_station_probe(session, station_id, url, ffmpeg_path):
+    """
+    Get a station's stream characteristics from a recent probe.
+    
+    Probing takes longer than the pre-roll, so when no recent result is
+    stored the station is probed in the background for later recordings,
+    and this one is transcoded.
+    
+    Returns:
+        StationProbe: The probe result, or None if there is no recent one
+    """
+    # The background prober usually has a recent result
+    oldest = datetime.utcnow() - timedelta(hours=Config.STATION_PROBE_MAX_AGE)
+    probe = session.query(StationProbe).filter(
+        StationProbe.station_id == station_id,
+        StationProbe.url == url,
+        StationProbe.codec_name.isnot(None),
+        StationProbe.probed_at >= oldest
+    ).order_by(StationProbe.probed_at.desc()).first()
+    if probe:
+        return probe
+    
+    logger.info(f"No recent probe of station {station_id}, transcoding and probing it in the background")
+    probe_station_later(station_id, url, ffmpeg_path)
+    return None
 
 def start_recording(recording_id, is_recurring=False):
     """Start a new recording."""
@@ -73,7 +460,7 @@ def start_recording(recording_id, is_recurring=False):
                 recording = Recording(
                     name=recurring.name,
                     station_id=recurring.station_id,
-                    start_time=datetime.now(),
+                    start_time=get_scheduled_start(recurring),
                     duration=recurring.duration,
                     file_name=formatted_name,
                     local_path=os.path.join(current_app.config['RECORDINGS_DIR'], formatted_name),
@@ -98,117 +485,146 @@ def start_recording(recording_id, is_recurring=False):
                     session.close()
                     return
         
-            # Update recording status
-            recording.status = 'recording'
-            session.commit()
-            
             # Store all necessary data before closing the session
             recording_data = {
                 'id': recording.id,
-                'stream_url': recording.station.url,
+                # Playlists are expanded to their fastest live stream
+                'stream_url': stream_resolver.resolve(recording.station_id, recording.station.url),
                 'audio_format': recording.format or 'mp3',
                 'output_file': recording.local_path,
-                'duration': recording.duration
+                'duration': recording.duration,
+                # Retried and queued recordings start straight away, and all
+                # of them stop at the planned end
+                'scheduled_start': max(recording.start_time, datetime.now()),
+                'planned_end': recording.start_time + timedelta(minutes=recording.duration),
+                'is_recurring': len(recording.recurring) > 0
             }
             
-            # Get FFmpeg path from environment variable or app settings
-            ffmpeg_path = os.environ.get('FFMPEG_PATH')
+            ffmpeg_path = get_ffmpeg_path(session)
+            logger.info(f"Using FFmpeg path: {ffmpeg_path}")
             
-            # If not in environment, try to get from app settings
-            if not ffmpeg_path:
-                from models import AppSettings
-                app_settings = session.query(AppSettings).first()
-                if app_settings:
-                    # Try to get ffmpeg_path attribute, but handle the case where it doesn't exist
-                    ffmpeg_path = getattr(app_settings, 'ffmpeg_path', None)
+            # Find out what the station broadcasts, to avoid re-encoding when
+            # possible and to match the encoder to the broadcast otherwise
+            probe = get_station_probe(session, recording.station_id, recording_data['stream_url'], ffmpeg_path)
+            source_bit_rate = probe.bit_rate if probe else None
+            codec_name = probe.codec_name if probe and Config.CAPTURE_MODE == 'auto' else None
+            kbps = source_bit_rate // 1000 if source_bit_rate else None
             
-            # Default to 'ffmpeg' if not found anywhere
-            if not ffmpeg_path:
-                ffmpeg_path = 'ffmpeg'
-                
-            logger.info(f"Using FFmpeg path: {ffmpeg_path}")
+            # Warn early if the recording is unlikely to fit on disk
+            check_disk_space(
+                recording_data['output_file'],
+                estimate_recording_size(
+                    recording_data['audio_format'],
+                    recording_data['duration'] * 60,
+                    probe,
+                    can_stream_copy(codec_name, recording_data['audio_format'])
+                )
+            )
+            
+            # Wait for capacity if this capture would exceed the capture budgets;
+            # an admitted capture's cost is reserved until it is launched
+            reason = admission_controller.admit(
+                recording_id,
+                recording_data['stream_url'],
+                can_stream_copy(codec_name, recording_data['audio_format']),
+                kbps
+            )
+            if reason:
+                queue_recording(session, recording, reason)
+                session.close()
+                return None
+            admission_controller.release(recording_id)
+            
+            # Admission added the recording to the registry as starting, so
+            # check_active_recordings doesn't start it again during the pre-roll
+            
+            # Update recording status
+            recording.status = 'recording'
+            session.commit()
             
             # Close the session before starting the FFmpeg process
             session.close()
             
-            # Calculate duration in seconds
-            duration_seconds = recording_data['duration'] * 60
+            # Calculate duration in seconds, less any time spent waiting for
+            # capacity or lost to an interruption
+            remaining = (recording_data['planned_end'] - recording_data['scheduled_start']).total_seconds()
+            duration_seconds = max(60, int(remaining))
             
-            # Set encoding parameters based on format
-            encoding_params = []
             audio_format = recording_data['audio_format']
-            if audio_format == 'mp3':
-                encoding_params = ['-c:a', 'libmp3lame', '-q:a', '2']
-            elif audio_format == 'ogg':
-                encoding_params = ['-c:a', 'libvorbis', '-q:a', '4']
-            elif audio_format == 'aac':
-                encoding_params = ['-c:a', 'aac', '-b:a', '192k']
-            elif audio_format == 'flac':
-                encoding_params = ['-c:a', 'flac']
-            elif audio_format == 'wav':
-                encoding_params = ['-c:a', 'pcm_s16le']
+            stream_copy = can_stream_copy(codec_name, audio_format)
+            
+            feed = None
+            if Config.SHARED_INGEST:
+                # Read the station's shared ingest; audio decoded to PCM can no longer be copied
+                feed = get_feed(codec_name)
+                stream_copy = stream_copy and feed is not PCM_FEED
+                input_args = feed.input_args + ['-i', 'pipe:0']
+            else:
+                input_args = [
+                    '-reconnect', '1',
+                    '-reconnect_streamed', '1',
+                    '-reconnect_delay_max', '30',
+                    '-reconnect_attempts', '10',
+                    '-i', recording_data['stream_url']
+                ]
+            
+            # Set encoding parameters based on format, or copy the broadcast as-is
+            if stream_copy:
+                logger.info(f"Station broadcasts {codec_name}, saving recording {recording_id} without re-encoding")
+                encoding_params = ['-c:a', 'copy']
             else:
-                # Default to mp3
-                encoding_params = ['-c:a', 'libmp3lame', '-q:a', '2']
+                encoding_params = get_encoding_params(audio_format, source_bit_rate)
+            
+            # Write segments that are joined on completion, or a single file
+            segment_dir = None
+            output_args = [recording_data['output_file']]
+            if Config.SEGMENTED_RECORDING:
+                segment_dir = get_segment_dir(recording_id, recording_data['output_file'])
+                os.makedirs(segment_dir, exist_ok=True)
+                output_args = get_segment_output_args(segment_dir, audio_format)
             
             # Start FFmpeg process
             cmd = [
                 ffmpeg_path,
                 '-y',  # Overwrite output file if exists
-                '-reconnect', '1',
-                '-reconnect_streamed', '1',
-                '-reconnect_delay_max', '30',
-                '-reconnect_attempts', '10',
-                '-i', recording_data['stream_url'],
+                '-progress', 'pipe:1',  # Machine-readable progress on stdout
+                '-nostats'
+            ] + input_args + [
                 '-t', str(duration_seconds)
-            ] + encoding_params + [recording_data['output_file']]
+            ] + encoding_params + output_args
             
             # Always print the FFmpeg command regardless of log level
             print(f"FFMPEG COMMAND: {' '.join(cmd)}")
             logger.warning(f"Executing FFmpeg command: {' '.join(cmd)}")
             
-            # Start the process - use binary mode to avoid encoding issues
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                # Don't use text mode/universal_newlines to avoid UTF-8 decoding issues
+            recording_data.update(
+                stream_copy=stream_copy,
+                kbps=kbps,
+                segment_dir=segment_dir,
+                ffmpeg_path=ffmpeg_path,
+                duration_seconds=duration_seconds
             )
             
-            # Update recording with process ID - need a new session
-            session = get_db_session()
-            try:
-                recording = session.query(Recording).get(recording_id)
-                recording.process_id = process.pid
-                recording.status = 'recording'  # Explicitly set to 'recording' status
-                session.commit()
-            except Exception as e:
-                logger.error(f"Error updating process ID: {str(e)}")
-            finally:
-                session.close()
-            
-            # Start a thread to monitor the recording
-            monitor_thread = threading.Thread(
-                target=monitor_recording,
-                args=(recording_id, process, recording_data['output_file'], is_recurring)
-            )
-            monitor_thread.daemon = True
-            monitor_thread.start()
-            
-            # Add to active recordings dictionary
-            end_time = datetime.now() + timedelta(minutes=recording_data['duration'])
-            active_recordings[recording_id] = {
-                'process': process,
-                'start_time': datetime.now(),
-                'end_time': end_time,
-                'output_file': recording_data['output_file'],
-                'is_recurring': is_recurring
-            }
+            # Pre-roll: connect and buffer ahead of the start time, and hand
+            # the capture its first audio at the start time itself
+            lead = (recording_data['scheduled_start'] - datetime.now()).total_seconds()
+            if lead > 0:
+                logger.info(f"Recording {recording_id} starts in {lead:.1f} seconds, warming up")
+                if Config.SHARED_INGEST:
+                    ingest_hub.warm(recording_data['stream_url'], feed, ffmpeg_path, lead + PREROLL_GRACE)
+                timer = threading.Timer(lead, launch_after_preroll, args=(recording_data, cmd, feed))
+                timer.daemon = True
+                # Kept with the starting entry so deleting the recording cancels it
+                active_recordings.update(recording_id, preroll=timer)
+                timer.start()
+            else:
+                launch_capture(recording_data, cmd, feed)
             
             return recording_id
             
         except Exception as e:
             logger.error(f"Error starting recording: {str(e)}")
+            active_recordings.remove(recording_id)
             try:
                 # Try to update the recording status to failed
                 if 'recording' in locals() and recording:
@@ -221,6 +637,175 @@ def start_recording(recording_id, is_recurring=False):
                 session.close()
             return None
 
+def launch_after_preroll(recording_data, cmd, feed=None):
+    """
+    Launch a capture at the end of its pre-roll, unless the recording was
+    deleted or stopped meanwhile, possibly by another worker.
+    """
+    recording_id = recording_data['id']
+    session = get_db_session()
+    try:
+        recording = session.get(Recording, recording_id)
+        status = recording.status if recording else None
+    finally:
+        session.close()
+    
+    if status != 'recording':
+        logger.info(f"Recording {recording_id} was {status or 'deleted'} during its pre-roll, not starting it")
+        active_recordings.remove(recording_id)
+        return
+    launch_capture(recording_data, cmd, feed)
+
+def cancel_preroll(recording_id):
+    """
+    Stop a capture that is still warming up from launching.
+    
+    Returns:
+        bool: True if the recording was in its pre-roll
+    """
+    entry = active_recordings.get(recording_id)
+    if not entry or 'preroll' not in entry:
+        return False
+    entry['preroll'].cancel()
+    active_recordings.remove(recording_id)
+    logger.info(f"Cancelled the pre-roll of recording {recording_id}")
+    return True
+
+def hand_over_recordings():
+    """
+    Stop this process's captures after another worker took over the scheduler.
+    
+    Pre-rolls are cancelled and running captures stopped, leaving their
+    recordings marked as recording without a process, so the new leader
+    resumes each one once, appending to the audio captured so far.
+    Captures adopted from elsewhere are left running for the new leader to adopt.
+    """
+    stopping = []
+    for recording_id, entry in active_recordings.snapshot().items():
+        if 'preroll' in entry:
+            cancel_preroll(recording_id)
+        elif entry.get('adopted'):
+            active_recordings.remove(recording_id)
+        elif entry.get('process') is not None:
+            logger.warning(f"Handing recording {recording_id} over to the new scheduler leader")
+            active_recordings.update(recording_id, handed_over=True)
+            entry['process'].terminate()
+            stopping.append((recording_id, entry['process']))
+    
+    # Wait for the exit handlers, so the new leader finds the parts saved
+    deadline = time.monotonic() + HAND_OVER_TIMEOUT
+    for recording_id, process in stopping:
+        while recording_id in active_recordings and time.monotonic() < deadline:
+            time.sleep(0.1)
+        if recording_id in active_recordings:
+            logger.warning(f"FFmpeg for recording {recording_id} ignored SIGTERM, killing it")
+            process.kill()
+
+def launch_capture(recording_data, cmd, feed=None):
+    """
+    Start a capture's FFmpeg process and hand it to the supervisor.
+    
+    Args:
+        recording_data (dict): Details of the recording gathered by start_recording
+        cmd (list): The FFmpeg command
+        feed (IngestFeed, optional): The shared ingest feed the capture reads
+    """
+    recording_id = recording_data['id']
+    
+    try:
+        # Start the process - use binary mode to avoid encoding issues
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if feed else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            # Don't use text mode/universal_newlines to avoid UTF-8 decoding issues
+        )
+    except Exception as e:
+        logger.error(f"Error starting FFmpeg for recording {recording_id}: {str(e)}")
+        active_recordings.remove(recording_id)
+        session = get_db_session()
+        try:
+            recording = session.query(Recording).get(recording_id)
+            recording.status = 'failed'
+            session.commit()
+        finally:
+            session.close()
+        return
+    
+    # Record the process ID through the batched status writer
+    status_writer.update(Recording, recording_id, process_id=process.pid, status='recording')
+    
+    # Track the recording before handing the process to the supervisor,
+    # so the exit handler always finds its entry
+    end_time = datetime.now() + timedelta(seconds=recording_data['duration_seconds'])
+    active_recordings.add(
+        recording_id,
+        process=process,
+        stream_url=recording_data['stream_url'],
+        kbps=recording_data['kbps'],
+        start_time=datetime.now(),
+        scheduled_start=recording_data['scheduled_start'],
+        end_time=end_time,
+        output_file=recording_data['output_file'],
+        is_recurring=recording_data['is_recurring'],
+        segment_dir=recording_data['segment_dir'],
+        stream_copy=recording_data['stream_copy'],
+        last_growth=time.monotonic()
+    )
+    
+    supervisor.watch(
+        recording_id,
+        process,
+        on_exit=partial(
+            handle_recording_exit,
+            output_file=recording_data['output_file'],
+            is_recurring=recording_data['is_recurring'],
+            segment_dir=recording_data['segment_dir'],
+            ffmpeg_path=recording_data['ffmpeg_path']
+        ),
+        on_stdout=ProgressTracker(recording_id, recording_data['scheduled_start']).feed
+    )
+    
+    if feed:
+        ingest_hub.attach(
+            recording_data['stream_url'],
+            feed,
+            recording_data['ffmpeg_path'],
+            recording_id,
+            process,
+            on_interrupt=partial(_interrupt_recording, recording_id)
+        )
+
+def queue_recording(session, recording, reason):
+    """
+    Hold back a capture that does not fit the capture budgets, trying again
+    shortly until it has waited for the queue timeout.
+    """
+    waited = (datetime.now() - admission_controller.queued_since(recording.id)).total_seconds()
+    
+    if waited >= Config.ADMISSION_QUEUE_TIMEOUT:
+        logger.error(f"Rejecting recording {recording.id} ({recording.name}) after {waited:.0f} seconds: {reason}")
+        recording.status = 'rejected'
+        session.commit()
+        admission_controller.release(recording.id)
+        send_notification(f"Recording {recording.name} was not started: {reason}.", recording.id)
+        return
+    
+    logger.warning(f"Queueing recording {recording.id} ({recording.name}): {reason}")
+    recording.status = 'queued'
+    session.commit()
+    
+    from app import scheduler
+    scheduler.add_job(
+        start_recording,
+        'date',
+        run_date=datetime.now() + timedelta(seconds=ADMISSION_RETRY_INTERVAL),
+        args=[recording.id],
+        id=f'admission_{recording.id}',
+        replace_existing=True
+    )
+
 def format_recording_name(name, audio_format='mp3'):
     """Format the recording name with date and extension."""
     now = datetime.now()
@@ -233,129 +818,82 @@ def format_recording_name(name, audio_format='mp3'):
     
     return f"{safe_name}{date_str}-{day_str}.{audio_format}"
 
-def monitor_recording(recording_id, process, output_file, is_recurring):
-    """Monitor a recording process and handle completion."""
+def handle_recording_exit(recording_id, returncode, stderr_output, output_file, is_recurring, segment_dir=None, ffmpeg_path='ffmpeg'):
+    """
+    Handle the exit of a supervised FFmpeg process.
+    
+    Args:
+        recording_id (int): The ID of the recording
+        returncode (int): The FFmpeg exit code
+        stderr_output (str): The most recent FFmpeg log lines
+        output_file (str): Path of the final recording file
+        is_recurring (bool): Whether the recording belongs to a recurring recording
+        segment_dir (str, optional): Directory of segments to join into output_file
+        ffmpeg_path (str): FFmpeg executable used for joining segments
+    """
     # Import app at function level to avoid circular imports
     from app import app
     
+    # Write queued status updates first so they can't overwrite the outcome
+    status_writer.flush()
+    
     with app.app_context():
         session = get_db_session()
         
         try:
-            # Wait for process to complete - use binary mode to avoid encoding issues
-            try:
-                stdout_data, stderr_data = process.communicate()
-                # Don't try to decode the output as it may contain non-UTF-8 characters
-            except Exception as e:
-                logger.error(f"Error communicating with FFmpeg process: {str(e)}")
-                stdout_data = b""
-                stderr_data = b""
+            recording = session.get(Recording, recording_id)
             
-            recording = session.query(Recording).get(recording_id)
+            # A capture stopped by the stall watchdog or a failed ingest is an
+            # interruption, whatever its exit code
+            entry = active_recordings.get(recording_id) or {}
+            interrupted = entry.get('interrupted', False)
+            
+            # Keep the latency of the first attempt, not of retries
+            if recording.start_latency is None and entry.get('start_latency') is not None:
+                recording.start_latency = entry['start_latency']
             
-            if process.returncode == 0:
+            if entry.get('handed_over'):
+                # The new scheduler leader resumes the capture
+                if not segment_dir and os.path.exists(output_file):
+                    save_partial_file(recording, output_file)
+                recording.process_id = None
+                session.commit()
+                logger.info(f"Recording {recording_id} ({recording.name}) handed over with FFmpeg exit code {returncode}")
+                return
+            
+            if returncode == 0 and not interrupted:
                 # FFmpeg completed successfully - mark as completed regardless of timing
                 logger.info(f"Recording {recording_id} ({recording.name}) completed successfully with FFmpeg exit code 0")
-                recording.status = 'completed'
+                recording.status = 'processing'
                 recording.process_id = None  # Clear the process ID
                 
-                # Get file size
-                if os.path.exists(output_file):
-                    recording.file_size = os.path.getsize(output_file)
-                    
-                    # Save to additional locations if configured
-                    save_to_additional_locations(recording)
-                    
-                    # Create podcast episode if this is a recurring recording with podcast enabled
-                    if is_recurring:
-                        recurring = recording.recurring[0]  # Get the associated recurring recording
-                        if recurring.create_podcast and recurring.podcast:
-                            podcast = recurring.podcast
-                            
-                            # Get the filename without extension as the episode title
-                            episode_filename = os.path.basename(output_file)
-                            episode_name = os.path.splitext(episode_filename)[0]
-                            
-                            # Create a new podcast episode
-                            episode = PodcastEpisode(
-                                podcast_id=podcast.id,
-                                title=episode_name,  # Use filename without extension as title
-                                description=f"Episode recorded on {datetime.now().strftime('%Y-%m-%d')}",
-                                file_path=output_file,
-                                file_size=recording.file_size,
-                                duration=recording.duration * 60,  # Convert minutes to seconds
-                                recording_id=recording.id,
-                                publication_date=recording.start_time  # Use recording start time instead of default
-                            )
-                            
-                            session.add(episode)
-                            
-                        # Check if we need to delete old recordings
-                        if recurring.keep_recordings > 0:
-                            # Get all recordings for this recurring recording, ordered by date
-                            all_recordings = sorted(
-                                recurring.recordings, 
-                                key=lambda r: r.start_time,
-                                reverse=True
-                            )
-                            
-                            # If we have more recordings than we should keep
-                            if len(all_recordings) > recurring.keep_recordings:
-                                # Delete the oldest recordings
-                                for old_recording in all_recordings[recurring.keep_recordings:]:
-                                    # Delete the file if it exists
-                                    if old_recording.local_path and os.path.exists(old_recording.local_path):
-                                        try:
-                                            os.remove(old_recording.local_path)
-                                        except Exception as e:
-                                            logger.error(f"Error deleting old recording file: {str(e)}")
-                                    
-                                    # Remove from recurring recordings but don't delete the recording itself
-                                    recurring.recordings.remove(old_recording)
-                    
-                    # Send notification
-                    hours = recording.duration // 60
-                    minutes = recording.duration % 60
-                    file_size_mb = recording.file_size / (1024 * 1024)
-                    
-                    notification_message = (
-                        f"Recorded {hours} hour{'s' if hours != 1 else ''} and {minutes} minute{'s' if minutes != 1 else ''} "
-                        f"of {recording.name}. The file size is {file_size_mb:.2f} MB."
-                    )
-                    send_notification(notification_message, recording_id)
-                else:
-                    recording.status = 'failed'
-                    recording.process_id = None  # Clear the process ID
-                    logger.error(f"Output file not found: {output_file}")
+                # Joining, copying, podcast, retention and notification run on
+                # the post-processing pool
+                post_processor.enqueue(session, recording)
             else:
                 # FFmpeg process failed or was interrupted
-                logger.warning(f"FFmpeg process exited with code {process.returncode} for recording {recording_id} ({recording.name})")
+                logger.warning(f"FFmpeg process exited with code {returncode} for recording {recording_id} ({recording.name})")
                 
                 # Log FFmpeg error output to help diagnose issues
-                try:
-                    stderr_str = stderr_data.decode('utf-8', errors='replace')
-                    logger.error(f"FFmpeg error output for recording {recording_id}: {stderr_str}")
-                except Exception as e:
-                    logger.error(f"Could not decode FFmpeg error output: {str(e)}")
+                logger.error(f"FFmpeg error output for recording {recording_id}: {stderr_output}")
                 
                 # Check if this was a user-initiated stop (code 255 often indicates SIGTERM)
-                if process.returncode == 255:
+                if returncode == 255 and not interrupted:
                     recording.status = 'stopped'
                     recording.process_id = None
                     logger.info(f"Recording {recording_id} was stopped manually")
                 else:
-                    # This is a genuine error or interruption - handle as partial recording
+                    # This is a genuine error or interruption - handle as partial
+                    # recording, and pick the station's stream afresh on retry
+                    stream_resolver.invalidate(recording.station_id)
                     now = datetime.now()
                     planned_end_time = recording.start_time + timedelta(minutes=recording.duration)
                     
-                    # Create a partial file
-                    base_name, ext = os.path.splitext(output_file)
-                    partial_file = f"{base_name}-part1{ext}"
-                    
-                    if os.path.exists(output_file):
+                    # Create a partial file; segments already on disk are kept
+                    # and a retry appends to them
+                    if not segment_dir and os.path.exists(output_file):
                         try:
-                            os.rename(output_file, partial_file)
-                            logger.info(f"Created partial file: {partial_file}")
+                            save_partial_file(recording, output_file)
                         except Exception as e:
                             logger.error(f"Error renaming partial file: {str(e)}")
                     
@@ -365,12 +903,13 @@ def monitor_recording(recording_id, process, output_file, is_recurring):
                         recording.status = 'interrupted'  # Use a specific status for interruptions
                         logger.info(f"Recording {recording_id} ({recording.name}) marked for retry")
                         
-                        # Schedule a retry after a short delay
+                        # Schedule a retry after a short delay; a stalled stream is retried right away
+                        retry_delay = 5 if interrupted else 60
                         from app import scheduler
                         scheduler.add_job(
                             retry_recording,
                             'date',
-                            run_date=datetime.now() + timedelta(seconds=60),
+                            run_date=datetime.now() + timedelta(seconds=retry_delay),
                             args=[recording_id, 1],
                             id=f'retry_{recording_id}_1',
                             replace_existing=True
@@ -379,15 +918,19 @@ def monitor_recording(recording_id, process, output_file, is_recurring):
                         # Not enough time left, mark as partial
                         recording.status = 'partial'
                         recording.process_id = None
+                        post_processor.enqueue(session, recording, ['finalize'])
                         logger.warning(f"No time remaining for recording {recording_id} ({recording.name}), marking as partial")
             
             session.commit()
             
+            if recording.post_process_steps:
+                post_processor.submit(recording_id)
+            
         except Exception as e:
-            logger.error(f"Error in monitor_recording: {str(e)}")
+            logger.error(f"Error in handle_recording_exit: {str(e)}")
             try:
                 # Try to update the recording status to failed
-                recording = session.query(Recording).get(recording_id)
+                recording = session.get(Recording, recording_id)
                 if recording:
                     recording.status = 'failed'
                     recording.process_id = None
@@ -396,9 +939,9 @@ def monitor_recording(recording_id, process, output_file, is_recurring):
                 logger.error(f"Error updating recording status: {str(inner_e)}")
             
         finally:
-            # Remove from active recordings
-            if recording_id in active_recordings:
-                del active_recordings[recording_id]
+            # Remove from active recordings and its shared ingest
+            active_recordings.remove(recording_id)
+            ingest_hub.detach(recording_id)
             
             # Always close the session
             session.close()
@@ -422,37 +965,7 @@ def resume_recording(recording_id):
             # Check if the process is still running by PID
             if recording.process_id and is_process_running(recording.process_id):
                 logger.info(f"Recording {recording_id} process {recording.process_id} is still running, no need to resume")
-                # Update our tracking dictionary
-                end_time = recording.start_time + timedelta(minutes=recording.duration)
-                
-                # Create a dummy process object
-                class DummyProcess:
-                    def __init__(self, pid):
-                        self.pid = pid
-                    
-                    def poll(self):
-                        return None if is_process_running(self.pid) else 1
-                    
-                    def terminate(self):
-                        try:
-                            os.kill(self.pid, signal.SIGTERM)
-                        except ProcessLookupError:
-                            pass
-                    
-                    def kill(self):
-                        try:
-                            os.kill(self.pid, signal.SIGKILL)
-                        except ProcessLookupError:
-                            pass
-                
-                # Add to active_recordings dictionary
-                active_recordings[recording_id] = {
-                    'process': DummyProcess(recording.process_id),
-                    'start_time': recording.start_time,
-                    'end_time': end_time,
-                    'output_file': recording.local_path,
-                    'is_recurring': len(recording.recurring) > 0
-                }
+                adopt_recording(recording)
                 
                 return
             
@@ -467,16 +980,12 @@ def resume_recording(recording_id):
                 session.commit()
                 return
             
-            # Update recording with new duration
-            recording.duration = int(remaining_minutes)
-            session.commit()
-            
             # Close the session before starting the recording
             session.close()
             
-            # Start the recording with the remaining duration
-            is_recurring = len(recording.recurring) > 0
-            start_recording(recording_id, is_recurring)
+            # Start the recording again; it captures until its planned end and
+            # its parts are merged on completion
+            start_recording(recording_id)
             
         except Exception as e:
             logger.error(f"Error in resume_recording: {str(e)}")
@@ -499,41 +1008,18 @@ def check_active_recordings():
             active_db_recordings = session.query(Recording).filter_by(status='recording').all()
             
             for recording in active_db_recordings:
-                # Check if the recording is in our active_recordings dictionary
+                # An adopted capture that ended, e.g. stopped by a deposed
+                # leader, is resumed like one found not running
+                entry = active_recordings.get(recording.id)
+                if entry and entry.get('adopted') and entry['process'].poll() is not None:
+                    active_recordings.remove(recording.id)
+                
+                # Check if the recording is in our active recordings registry
                 if recording.id not in active_recordings:
                     # Check if there's a process ID and if that process is still running
                     if recording.process_id and is_process_running(recording.process_id):
                         # Process is still running, update our tracking
-                        end_time = recording.start_time + timedelta(minutes=recording.duration)
-                        
-                        # Create a dummy process object
-                        class DummyProcess:
-                            def __init__(self, pid):
-                                self.pid = pid
-                            
-                            def poll(self):
-                                return None if is_process_running(self.pid) else 1
-                            
-                            def terminate(self):
-                                try:
-                                    os.kill(self.pid, signal.SIGTERM)
-                                except ProcessLookupError:
-                                    pass
-                            
-                            def kill(self):
-                                try:
-                                    os.kill(self.pid, signal.SIGKILL)
-                                except ProcessLookupError:
-                                    pass
-                        
-                        # Add to active_recordings dictionary
-                        active_recordings[recording.id] = {
-                            'process': DummyProcess(recording.process_id),
-                            'start_time': recording.start_time,
-                            'end_time': end_time,
-                            'output_file': recording.local_path,
-                            'is_recurring': len(recording.recurring) > 0
-                        }
+                        adopt_recording(recording)
                     else:
                         # Process is not running, resume the recording
                         logger.info(f"Found interrupted recording {recording.id}, resuming")
@@ -580,44 +1066,21 @@ def retry_recording(recording_id, retry_count):
             if remaining_seconds <= -time_threshold_seconds or completion_percentage >= percentage_threshold:
                 # No meaningful time remaining or recording is mostly complete
                 logger.warning(f"Recording {recording_id} ({recording.name}) is already {completion_percentage:.1%} complete, marking as complete instead of partial")
-                recording.status = 'completed'
-                
-                # Rename the partial file to the final name without the partial suffix
-                base_name, ext = os.path.splitext(recording.local_path)
-                partial_file = f"{base_name}-part1{ext}"
-                if os.path.exists(partial_file):
-                    try:
-                        os.rename(partial_file, recording.local_path)
-                        logger.info(f"Renamed single partial file to {os.path.basename(recording.local_path)}")
-                    except Exception as e:
-                        logger.error(f"Error renaming partial file: {str(e)}")
+                recording.status = 'processing'
                 
+                # Join the segments or partial files into the final file
+                post_processor.enqueue(session, recording, ['finalize'])
                 session.commit()
+                post_processor.submit(recording_id)
                 return
             
-            # Calculate remaining duration
-            remaining_minutes = max(1, int(remaining_seconds / 60))
-            
-            # Update recording with new duration
-            recording.duration = remaining_minutes
             recording.status = 'scheduled'  # Reset status to scheduled for the retry
-            
-            # Check if this is a recurring recording - do this BEFORE closing the session
-            is_recurring_recording = False
-            # Use a direct SQL query instead of trying to query the table object
-            recurring_query = session.execute(
-                "SELECT recurring_id FROM recurring_recording_instance WHERE recording_id = :rec_id",
-                {"rec_id": recording.id}
-            ).first()
-            if recurring_query:
-                is_recurring_recording = True
-                logger.info(f"Recording {recording_id} is part of a recurring recording")
-            
             session.commit()
             session.close()
             
-            # Start the recording with the remaining duration
-            start_recording(recording_id, is_recurring_recording)
+            # Start the same recording again, recurring or not, so the new
+            # capture becomes its next part; it runs until the planned end
+            start_recording(recording_id)
             
         except Exception as e:
             logger.error(f"Error in retry_recording: {str(e)}")
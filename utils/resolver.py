@@ -0,0 +1,184 @@
+import re
+import time
+import logging
+import threading
+from urllib.parse import urljoin, urlparse
+
+import requests
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Content types servers use for playlists
+PLAYLIST_CONTENT_TYPES = {
+    'audio/x-scpls': 'pls',
+    'application/pls+xml': 'pls',
+    'audio/x-mpegurl': 'm3u',
+    'audio/mpegurl': 'm3u',
+    'application/x-mpegurl': 'm3u',
+    'application/vnd.apple.mpegurl': 'm3u'
+}
+
+# Playlists are small; anything larger is audio
+MAX_PLAYLIST_BYTES = 64 * 1024
+
+# Seconds to wait when fetching a playlist or timing a connection
+RESOLVE_TIMEOUT = 5
+
+_PLS_ENTRY = re.compile(r'^File\d+\s*=\s*(.+)$', re.IGNORECASE)
+_HLS_BANDWIDTH = re.compile(r'BANDWIDTH=(\d+)')
+
+
+def parse_playlist(text, base_url, kind=None):
+    """
+    Extract the stream URLs from a .pls, .m3u or HLS playlist.
+
+    An HLS master playlist yields its variant playlists, highest bandwidth
+    first. An HLS media playlist is itself the stream, so it yields nothing
+    and the playlist URL should be used as-is.
+
+    Args:
+        text (str): The playlist contents
+        base_url (str): URL of the playlist, for relative entries
+        kind (str, optional): 'pls' or 'm3u'; detected from the contents if not given
+
+    Returns:
+        list: Absolute stream URLs in playlist order
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+
+    if kind == 'pls' or (lines and lines[0].lower() == '[playlist]'):
+        urls = []
+        for line in lines:
+            match = _PLS_ENTRY.match(line)
+            if match:
+                urls.append(urljoin(base_url, match.group(1).strip()))
+        return urls
+
+    if any(line.startswith('#EXT-X-STREAM-INF') for line in lines):
+        variants = []
+        for index, line in enumerate(lines[:-1]):
+            if line.startswith('#EXT-X-STREAM-INF'):
+                match = _HLS_BANDWIDTH.search(line)
+                bandwidth = int(match.group(1)) if match else 0
+                variants.append((bandwidth, urljoin(base_url, lines[index + 1])))
+        return [url for _, url in sorted(variants, key=lambda variant: -variant[0])]
+
+    if any(line.startswith('#EXT-X-TARGETDURATION') for line in lines):
+        return []
+
+    return [urljoin(base_url, line) for line in lines if not line.startswith('#')]
+
+def measure_connect_latency(url, timeout=RESOLVE_TIMEOUT):
+    """
+    Time how long a stream takes to answer.
+
+    Returns:
+        float: Seconds until the response headers arrived, or None if the
+        stream could not be reached
+    """
+    started = time.monotonic()
+    try:
+        with requests.get(url, stream=True, timeout=timeout, headers={'Icy-MetaData': '0'}) as response:
+            if response.status_code >= 400:
+                return None
+            return time.monotonic() - started
+    except requests.RequestException as e:
+        logger.debug(f"Could not connect to {url}: {str(e)}")
+        return None
+
+
+class StreamResolver:
+    """
+    Resolve station URLs that point at playlists into concrete streams.
+
+    Results are cached per station for RESOLVER_CACHE_TTL seconds. The
+    entries of a playlist are ranked by connect latency, and unreachable
+    ones are dropped, so captures start on the fastest live endpoint.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def resolve(self, station_id, url):
+        """
+        Get the stream URL a station's captures should use.
+
+        Args:
+            station_id (int): The station ID
+            url (str): The station's configured URL
+
+        Returns:
+            str: The best stream URL, or the configured URL if it could not be resolved
+        """
+        with self._lock:
+            cached = self._cache.get(station_id)
+        if cached and cached['url'] == url and cached['expires'] > time.monotonic():
+            return cached['streams'][0]
+
+        streams = self._resolve(url)
+        with self._lock:
+            self._cache[station_id] = {
+                'url': url,
+                'streams': streams,
+                'expires': time.monotonic() + Config.RESOLVER_CACHE_TTL
+            }
+        return streams[0]
+
+    def invalidate(self, station_id):
+        """Forget a station's resolution, for example after its stream failed."""
+        with self._lock:
+            self._cache.pop(station_id, None)
+
+    def _resolve(self, url):
+        candidates = self._expand(url)
+        if candidates == [url]:
+            return candidates
+
+        latencies = {candidate: measure_connect_latency(candidate) for candidate in candidates}
+        live = sorted((c for c in candidates if latencies[c] is not None), key=lambda c: latencies[c])
+        if not live:
+            logger.warning(f"No entry of playlist {url} could be reached, using the first one")
+            return candidates
+
+        logger.info(f"Resolved {url} to {live[0]} ({latencies[live[0]] * 1000:.0f} ms, {len(live)} of {len(candidates)} entries live)")
+        return live
+
+    def _expand(self, url, depth=0):
+        """List the streams behind a URL, following nested playlists."""
+        scheme = urlparse(url).scheme
+        if scheme not in ('http', 'https') or depth > 2:
+            return [url]
+
+        path = urlparse(url).path.lower()
+        kind = 'pls' if path.endswith('.pls') else 'm3u' if path.endswith(('.m3u', '.m3u8')) else None
+
+        try:
+            with requests.get(url, stream=True, timeout=RESOLVE_TIMEOUT) as response:
+                content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+                kind = kind or PLAYLIST_CONTENT_TYPES.get(content_type)
+                if kind is None or response.status_code >= 400:
+                    return [url]
+                body = response.raw.read(MAX_PLAYLIST_BYTES, decode_content=True)
+        except requests.RequestException as e:
+            logger.warning(f"Could not fetch {url} to resolve it: {str(e)}")
+            return [url]
+
+        entries = parse_playlist(body.decode('utf-8', errors='replace'), url, kind)
+        if not entries:
+            return [url]
+
+        streams = []
+        for entry in entries:
+            path = urlparse(entry).path.lower()
+            if path.endswith(('.pls', '.m3u')):
+                streams.extend(self._expand(entry, depth + 1))
+            else:
+                streams.append(entry)
+        return list(dict.fromkeys(streams))
+
+
+# Process-wide resolver shared by all captures
+stream_resolver = StreamResolver()
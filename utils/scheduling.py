@@ -0,0 +1,84 @@
+import logging
+from datetime import datetime, timedelta
+
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class PrerollTrigger(BaseTrigger):
+    """Fire a fixed number of seconds before each fire time of another trigger."""
+
+    def __init__(self, trigger, seconds):
+        self.trigger = trigger
+        self.seconds = seconds
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        offset = timedelta(seconds=self.seconds)
+        previous = previous_fire_time + offset if previous_fire_time else None
+        fire_time = self.trigger.get_next_fire_time(previous, now + offset)
+        return fire_time - offset if fire_time else None
+
+    def __str__(self):
+        return f'{self.trigger} - {self.seconds}s'
+
+    def __repr__(self):
+        return f'<PrerollTrigger ({self.trigger!r}, seconds={self.seconds})>'
+
+
+def with_preroll(trigger):
+    """Start a recording's job early enough to warm up before its start time."""
+    if Config.PREROLL_SECONDS > 0:
+        return PrerollTrigger(trigger, Config.PREROLL_SECONDS)
+    return trigger
+
+def build_recording_trigger(start_time):
+    """Build the scheduler trigger for a one-off recording."""
+    return with_preroll(DateTrigger(run_date=start_time))
+
+def build_recurring_trigger(recurring):
+    """
+    Build the scheduler trigger for a recurring recording.
+
+    Raises:
+        ValueError: If the schedule type is unknown
+    """
+    hour = recurring.start_time.hour
+    minute = recurring.start_time.minute
+
+    if recurring.schedule_type == 'daily':
+        trigger = CronTrigger(hour=hour, minute=minute)
+    elif recurring.schedule_type == 'weekly':
+        trigger = CronTrigger(day_of_week=recurring.days_of_week, hour=hour, minute=minute)
+    elif recurring.schedule_type == 'weekends':
+        trigger = CronTrigger(day_of_week='sat,sun', hour=hour, minute=minute)
+    elif recurring.schedule_type == 'weekdays':
+        trigger = CronTrigger(day_of_week='mon,tue,wed,thu,fri', hour=hour, minute=minute)
+    elif recurring.schedule_type == 'monthly':
+        # Monthly recordings keep their day of the month in days_of_week
+        trigger = CronTrigger(day=recurring.days_of_week or '1', hour=hour, minute=minute)
+    else:
+        raise ValueError(f"Unknown schedule type '{recurring.schedule_type}' for recurring recording ID {recurring.id}")
+
+    return with_preroll(trigger)
+
+def get_next_start(job):
+    """Return the start time of a recording job's next run, or None if it won't run again."""
+    if job.next_run_time is None:
+        return None
+    if isinstance(job.trigger, PrerollTrigger):
+        return job.next_run_time + timedelta(seconds=job.trigger.seconds)
+    return job.next_run_time
+
+def get_scheduled_start(recurring, now=None):
+    """Find the start time of the recurring recording occurrence due around now."""
+    target = (now or datetime.now()) + timedelta(seconds=Config.PREROLL_SECONDS)
+    candidates = [
+        datetime.combine(target.date() + timedelta(days=days), recurring.start_time)
+        for days in (-1, 0, 1)
+    ]
+    return min(candidates, key=lambda start: abs((start - target).total_seconds()))
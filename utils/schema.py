@@ -0,0 +1,144 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import inspect, text, tuple_
+from sqlalchemy.dialects import sqlite
+
+from models import (RadioStation, Recording, RecurringRecording, PodcastEpisode, StationProbe, PostProcessStep,
+                    recurring_recording_instance)
+
+logger = logging.getLogger(__name__)
+
+
+def _add_column(connection, table, column, ddl):
+    """Add a column to an existing table unless it is already there."""
+    columns = {c['name'] for c in inspect(connection).get_columns(table)}
+    if column not in columns:
+        connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+        logger.info(f"Added column {table}.{column}")
+
+def _add_columns_since_first_release(connection):
+    # db.create_all() creates new tables but never alters existing ones
+    _add_column(connection, 'radio_station', 'continuous_capture', 'BOOLEAN DEFAULT 0')
+    _add_column(connection, 'radio_station', 'timeshift_hours', 'INTEGER DEFAULT 2')
+    _add_column(connection, 'recording', 'recorded_duration', 'INTEGER')
+    _add_column(connection, 'recording', 'start_latency', 'FLOAT')
+    _add_column(connection, 'station_probe', 'reachable', 'BOOLEAN DEFAULT 1')
+    _add_column(connection, 'station_probe', 'latency_ms', 'INTEGER')
+    _add_column(connection, 'station_probe', 'error', 'TEXT')
+
+def _create_hot_path_indexes(connection):
+    # The same indexes are declared on the models, so new databases get them
+    # from db.create_all(); existing tables need them created here
+    for table in (Recording.__table__, PodcastEpisode.__table__, StationProbe.__table__,
+                  PostProcessStep.__table__, recurring_recording_instance):
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+def _create_recordings_list_indexes(connection):
+    # Indexes on the recordings list's sort keys, declared on the models too
+    for table in (Recording.__table__, RadioStation.__table__):
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+def _create_feed_page_index(connection):
+    # Feed pages are cut by episode ID within a podcast
+    for index in PodcastEpisode.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+def _add_file_check_columns(connection):
+    for table in ('recording', 'podcast_episode'):
+        _add_column(connection, table, 'file_mtime', 'FLOAT')
+        _add_column(connection, table, 'file_missing', 'BOOLEAN DEFAULT 0')
+
+def _drop_recording_status_index(connection):
+    # ix_recording_status_start_time already serves lookups by status alone
+    connection.execute(text('DROP INDEX IF EXISTS ix_recording_status'))
+
+def _add_clip_claim_column(connection):
+    _add_column(connection, 'clip', 'claimed_at', 'DATETIME')
+
+# Schema changes in the order they were made. Each runs once per database
+# and must cope with a database where db.create_all() already made the change
+MIGRATIONS = [
+    (1, 'Add columns added since the first release', _add_columns_since_first_release),
+    (2, 'Index the hot query paths', _create_hot_path_indexes),
+    (3, 'Index the recordings list sort keys', _create_recordings_list_indexes),
+    (4, 'Index podcast episodes for feed pages', _create_feed_page_index),
+    (5, 'Record the size and mtime of recorded files', _add_file_check_columns),
+    (6, 'Drop the redundant recording status index', _drop_recording_status_index),
+    (7, 'Record when a clip was claimed by a worker', _add_clip_claim_column),
+]
+
+
+def get_schema_version(connection):
+    """Return the number of the last migration applied to the database."""
+    connection.execute(text('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)'))
+    version = connection.execute(text('SELECT MAX(version) FROM schema_version')).scalar()
+    return version or 0
+
+def run_migrations(engine):
+    """
+    Bring the database schema up to date; run at startup after db.create_all().
+
+    Args:
+        engine: The application's database engine
+
+    Returns:
+        int: The schema version after migrating
+    """
+    with engine.begin() as connection:
+        version = get_schema_version(connection)
+
+    for number, description, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        logger.info(f"Applying schema migration {number}: {description}")
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.execute(text('INSERT INTO schema_version (version) VALUES (:version)'), {'version': number})
+        version = number
+
+    return version
+
+
+def _hot_queries(session):
+    """The queries run on every request or scheduler tick, as the app builds them."""
+    return {
+        'active recordings': session.query(Recording).filter_by(status='recording'),
+        'podcast feed episodes': session.query(PodcastEpisode).filter_by(podcast_id=1)
+            .order_by(PodcastEpisode.publication_date.desc()),
+        'recurring recording of a recording': session.query(RecurringRecording)
+            .join(recurring_recording_instance)
+            .filter(recurring_recording_instance.c.recording_id == 1),
+        'latest station check': session.query(StationProbe).filter_by(station_id=1)
+            .order_by(StationProbe.probed_at.desc()),
+        'post-processing steps of a recording': session.query(PostProcessStep).filter_by(recording_id=1),
+        'podcast feed page': session.query(PodcastEpisode).filter_by(podcast_id=1)
+            .order_by(PodcastEpisode.id).offset(100).limit(100),
+        'recordings list page': session.query(Recording.id, Recording.name, Recording.start_time)
+            .filter(tuple_(Recording.start_time, Recording.id) < tuple_(datetime(2000, 1, 1), 1))
+            .order_by(Recording.start_time.desc(), Recording.id.desc()).limit(51),
+    }
+
+def check_query_plans(session):
+    """
+    Ask SQLite how it runs each hot query and flag full table scans and
+    sorts that an index should have avoided.
+
+    Returns:
+        list: (name, plan lines, problems) for each query
+    """
+    results = []
+    for name, query in _hot_queries(session).items():
+        sql = str(query.statement.compile(dialect=sqlite.dialect(), compile_kwargs={'literal_binds': True}))
+        plan = [row[-1] for row in session.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+
+        problems = []
+        for line in plan:
+            if line.startswith('SCAN') and 'INDEX' not in line:
+                problems.append(f'full scan: {line}')
+            elif 'TEMP B-TREE' in line:
+                problems.append(f'sort without index: {line}')
+        results.append((name, plan, problems))
+    return results
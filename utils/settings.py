@@ -0,0 +1,80 @@
+import time
+import logging
+import threading
+
+from models import AppSettings, SettingsVersion
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SettingsCache:
+    """
+    All AppSettings rows, loaded once and kept in a dict.
+
+    Writes in this process update the dict straight away. Writes in other
+    processes bump the settings version row; the cache compares its version
+    with that row at most every SETTINGS_CHECK_INTERVAL seconds and reloads
+    when they differ.
+    """
+
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._values = None
+        self._version = None
+        self._next_check = 0
+
+    def get(self, key, default=None):
+        """
+        Look up a setting.
+
+        Args:
+            key (str): The setting's key
+            default: Returned if the setting is missing
+
+        Returns:
+            The setting's value, or the default
+        """
+        value = self._refresh_if_stale().get(key)
+        return default if value is None else value
+
+    def written(self, key, value):
+        """Apply a committed write from this process."""
+        with self._lock:
+            if self._values is not None:
+                self._values[key] = value
+
+    def _refresh_if_stale(self):
+        """Return the current values, reloading them if another process changed them."""
+        values = self._values
+        if values is not None and time.monotonic() < self._next_check:
+            return values
+
+        # Import at function level; utils.db needs the app
+        from utils.db import get_db_session
+
+        with self._lock:
+            if self._values is not None and time.monotonic() < self._next_check:
+                return self._values
+
+            session = get_db_session()
+            try:
+                row = session.query(SettingsVersion).get(1)
+                version = row.version if row else 0
+                if self._values is None or version != self._version:
+                    self._values = {setting.key: setting.value for setting in session.query(AppSettings).all()}
+                    self._version = version
+                    logger.debug(f"Loaded {len(self._values)} setting(s) at version {version}")
+            except Exception as e:
+                logger.error(f"Error loading settings: {str(e)}")
+                if self._values is None:
+                    self._values = {}
+            finally:
+                session.close()
+            self._next_check = time.monotonic() + self.check_interval
+            return self._values
+
+
+# Process-wide settings cache
+settings_cache = SettingsCache(Config.SETTINGS_CHECK_INTERVAL)
@@ -72,16 +72,11 @@ def save_to_nextcloud(recording):
     with app.app_context():
         try:
             # Check if NextCloud is configured
-            nextcloud_url = current_app.config.get('NEXTCLOUD_URL')
-            nextcloud_username = current_app.config.get('NEXTCLOUD_USERNAME')
-            nextcloud_password = current_app.config.get('NEXTCLOUD_PASSWORD')
-            
-            # Try to get from AppSettings if not in config
-            if not all([nextcloud_url, nextcloud_username, nextcloud_password]):
-                from models import AppSettings
-                nextcloud_url = nextcloud_url or AppSettings.get('NEXTCLOUD_URL')
-                nextcloud_username = nextcloud_username or AppSettings.get('NEXTCLOUD_USERNAME')
-                nextcloud_password = nextcloud_password or AppSettings.get('NEXTCLOUD_PASSWORD')
+            # Settings saved in the app take precedence over the environment
+            from models import AppSettings
+            nextcloud_url = AppSettings.get('NEXTCLOUD_URL') or current_app.config.get('NEXTCLOUD_URL')
+            nextcloud_username = AppSettings.get('NEXTCLOUD_USERNAME') or current_app.config.get('NEXTCLOUD_USERNAME')
+            nextcloud_password = AppSettings.get('NEXTCLOUD_PASSWORD') or current_app.config.get('NEXTCLOUD_PASSWORD')
             
             if not all([nextcloud_url, nextcloud_username, nextcloud_password]):
                 logger.warning("NextCloud not fully configured, skipping upload")
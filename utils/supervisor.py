@@ -0,0 +1,285 @@
+import os
+import re
+import time
+import logging
+import selectors
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# FFmpeg separates its periodic stats lines with carriage returns
+_LINE_SPLIT = re.compile(rb'[\r\n]')
+
+# Longest line kept before it is force-split, so a child that never emits a
+# newline still cannot grow the buffer without bound
+_MAX_LINE_BYTES = 4096
+
+
+class RingBuffer:
+    """Keep only the most recent lines written by a child process."""
+
+    def __init__(self, max_lines=200):
+        self._lines = deque(maxlen=max_lines)
+        self._partial = b''
+
+    def feed(self, data):
+        """
+        Append raw bytes to the buffer.
+
+        Returns:
+            list: The complete lines found in the data
+        """
+        chunks = _LINE_SPLIT.split(self._partial + data)
+        self._partial = chunks.pop()
+        if len(self._partial) > _MAX_LINE_BYTES:
+            chunks.append(self._partial)
+            self._partial = b''
+
+        lines = [chunk for chunk in chunks if chunk]
+        self._lines.extend(lines)
+        return lines
+
+    def text(self):
+        """Return the buffered output decoded as text."""
+        lines = list(self._lines)
+        if self._partial:
+            lines.append(self._partial)
+        return b'\n'.join(lines).decode('utf-8', errors='replace')
+
+
+class _Child:
+    """Bookkeeping for one supervised process."""
+
+    def __init__(self, key, process, on_exit, on_stdout, on_stdout_data, max_lines):
+        self.key = key
+        self.process = process
+        self.on_exit = on_exit
+        self.on_stdout = on_stdout
+        self.on_stdout_data = on_stdout_data
+        self.stderr = RingBuffer(max_lines)
+        self.stdout = RingBuffer(max_lines)
+        self.pidfd = None
+        self.exited = False
+
+
+class ProcessSupervisor:
+    """
+    Own a set of child processes from a single event loop thread.
+
+    The loop drains every child's stdout and stderr through one selector,
+    keeps the tail of stderr in a bounded ring buffer, and notices exits
+    through a pidfd where the platform supports it (falling back to polling
+    on each tick). Exit callbacks run on a small worker pool so slow
+    completion work never blocks the loop.
+    """
+
+    def __init__(self, max_output_lines=200, exit_workers=4, tick=1.0):
+        self._max_output_lines = max_output_lines
+        self._tick = tick
+        self._lock = threading.Lock()
+        self._children = {}
+        self._pending = []
+        self._periodic = []
+        self._selector = None
+        self._thread = None
+        self._wake_r = self._wake_w = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=exit_workers,
+            thread_name_prefix='supervisor-exit'
+        )
+
+    def watch(self, key, process, on_exit, on_stdout=None, on_stdout_data=None):
+        """
+        Start supervising a process.
+
+        Args:
+            key: Unique identifier for the process (e.g. a recording ID)
+            process: The subprocess.Popen object; stdout/stderr may be pipes
+            on_exit (callable): Called as on_exit(key, returncode, stderr_text)
+            on_stdout (callable, optional): Called with each complete stdout line
+            on_stdout_data (callable, optional): Called with raw stdout chunks, for
+                binary output; the chunks are not line-buffered
+        """
+        child = _Child(key, process, on_exit, on_stdout, on_stdout_data, self._max_output_lines)
+        with self._lock:
+            self._children[key] = child
+            self._pending.append(child)
+        self._ensure_started()
+        self._wake()
+
+    def is_watching(self, key):
+        """Check if a process is currently supervised under the given key."""
+        with self._lock:
+            return key in self._children
+
+    def stderr_tail(self, key):
+        """Return the buffered stderr output for a supervised process."""
+        with self._lock:
+            child = self._children.get(key)
+        return child.stderr.text() if child else ''
+
+    def add_periodic(self, interval, callback):
+        """Run a callback on the loop thread every `interval` seconds while it is running."""
+        with self._lock:
+            self._periodic.append([interval, callback, time.monotonic()])
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._selector = selectors.DefaultSelector()
+            self._wake_r, self._wake_w = os.pipe()
+            os.set_blocking(self._wake_r, False)
+            os.set_blocking(self._wake_w, False)
+            self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+            self._thread = threading.Thread(target=self._run, name='process-supervisor')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b'\0')
+        except (BlockingIOError, TypeError):
+            pass
+
+    def _run(self):
+        while True:
+            try:
+                self._register_pending()
+                for key, _ in self._selector.select(timeout=self._tick):
+                    if key.data is None:
+                        self._drain_wakeups()
+                    else:
+                        key.data()
+                self._poll_exits()
+                self._run_periodic()
+            except Exception as e:
+                logger.error(f"Error in process supervisor loop: {str(e)}")
+                time.sleep(self._tick)
+
+    def _drain_wakeups(self):
+        try:
+            while os.read(self._wake_r, 512):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _register_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        for child in pending:
+            process = child.process
+            for stream, buffer in ((process.stderr, child.stderr), (process.stdout, child.stdout)):
+                if stream is None:
+                    continue
+                os.set_blocking(stream.fileno(), False)
+                self._selector.register(
+                    stream, selectors.EVENT_READ,
+                    lambda c=child, s=stream, b=buffer: self._read_stream(c, s, b)
+                )
+
+            if hasattr(os, 'pidfd_open'):
+                try:
+                    child.pidfd = os.pidfd_open(process.pid)
+                    self._selector.register(
+                        child.pidfd, selectors.EVENT_READ,
+                        lambda c=child: self._reap(c)
+                    )
+                except OSError:
+                    # Already exited or pidfds unavailable; polling will catch it
+                    child.pidfd = None
+
+    def _read_stream(self, child, stream, buffer):
+        try:
+            data = os.read(stream.fileno(), 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+
+        if not data:
+            self._selector.unregister(stream)
+            return
+
+        self._handle_data(child, buffer, data)
+
+    def _handle_data(self, child, buffer, data):
+        try:
+            if buffer is child.stdout and child.on_stdout_data:
+                child.on_stdout_data(data)
+                return
+
+            lines = buffer.feed(data)
+            if buffer is child.stdout and child.on_stdout:
+                for line in lines:
+                    child.on_stdout(line)
+        except Exception as e:
+            logger.error(f"Error handling output of process {child.key}: {str(e)}")
+
+    def _poll_exits(self):
+        with self._lock:
+            polled = [c for c in self._children.values() if c.pidfd is None and not c.exited]
+        for child in polled:
+            if child.process.poll() is not None:
+                self._reap(child)
+
+    def _reap(self, child):
+        if child.exited:
+            return
+        child.exited = True
+        returncode = child.process.wait()
+
+        if child.pidfd is not None:
+            self._selector.unregister(child.pidfd)
+            os.close(child.pidfd)
+
+        # Collect whatever the child wrote right before exiting
+        for stream, buffer in ((child.process.stderr, child.stderr), (child.process.stdout, child.stdout)):
+            if stream is None:
+                continue
+            try:
+                while True:
+                    data = os.read(stream.fileno(), 65536)
+                    if not data:
+                        break
+                    self._handle_data(child, buffer, data)
+            except (BlockingIOError, OSError):
+                pass
+            try:
+                self._selector.unregister(stream)
+            except (KeyError, ValueError):
+                pass
+            stream.close()
+
+        with self._lock:
+            if self._children.get(child.key) is child:
+                del self._children[child.key]
+
+        self._executor.submit(self._dispatch_exit, child, returncode)
+
+    def _dispatch_exit(self, child, returncode):
+        try:
+            child.on_exit(child.key, returncode, child.stderr.text())
+        except Exception as e:
+            logger.error(f"Error handling exit of process {child.key}: {str(e)}")
+
+    def _run_periodic(self):
+        now = time.monotonic()
+        with self._lock:
+            due = [entry for entry in self._periodic if now - entry[2] >= entry[0]]
+            for entry in due:
+                entry[2] = now
+        for _, callback, _ in due:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error in supervisor periodic task: {str(e)}")
+
+
+# Process-wide supervisor shared by the recorder
+supervisor = ProcessSupervisor(max_output_lines=Config.FFMPEG_LOG_LINES)
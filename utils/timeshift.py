@@ -0,0 +1,367 @@
+import os
+import glob
+import math
+import shutil
+import logging
+import threading
+import subprocess
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+
+from models import RadioStation
+from utils.supervisor import supervisor
+from utils.ingest import ingest_hub, get_feed, PCM_FEED
+from utils.media import concat_files
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Timestamp in segment file names; the segment muxer expands it when a segment opens
+SEGMENT_TIME_FORMAT = '%Y%m%d-%H%M%S'
+
+# How a ring stores the broadcast: file extension, segment muxer format and
+# encoder options
+RingFormat = namedtuple('RingFormat', ['extension', 'muxer', 'encoding_args'])
+
+# Codecs kept as broadcast; anything else is encoded to MP3
+COPY_FORMATS = {
+    'mp3': RingFormat('mp3', 'mp3', ['-c:a', 'copy']),
+    'aac': RingFormat('aac', 'adts', ['-c:a', 'copy']),
+    'vorbis': RingFormat('ogg', 'ogg', ['-c:a', 'copy']),
+    'opus': RingFormat('ogg', 'ogg', ['-c:a', 'copy']),
+    'flac': RingFormat('flac', 'flac', ['-c:a', 'copy'])
+}
+ENCODED_FORMAT = RingFormat('mp3', 'mp3', ['-c:a', 'libmp3lame', '-q:a', '2'])
+
+# Seconds before a ring whose FFmpeg exited is restarted
+RESTART_DELAY = 10
+
+Segment = namedtuple('Segment', ['start', 'path'])
+
+
+def get_ring_dir(station_id):
+    """Directory holding a station's timeshift segments."""
+    return os.path.join(Config.RECORDINGS_DIR, '.timeshift', f'station-{station_id}')
+
+def read_ring_contents(station_id):
+    """
+    Read what a station's ring holds from its segment files.
+
+    Rings run in the scheduler leader, so pages served by other workers
+    can't ask timeshift_manager; the files are the same for every process.
+
+    Returns:
+        tuple: The earliest and latest time that can be extracted, and the
+            segments' extension, or None if the ring is empty
+    """
+    segments = []
+    for path in glob.glob(os.path.join(get_ring_dir(station_id), '*.*')):
+        start = TimeshiftRing._parse_start(path)
+        if start is not None:
+            segments.append((start, path))
+    if not segments:
+        return None
+    # The newest segment has the format the ring writes now
+    extension = os.path.splitext(max(segments)[1])[1].lstrip('.')
+    return min(segments)[0], datetime.now(), extension
+
+
+class TimeshiftRing:
+    """
+    Continuous capture of one station into a bounded ring of segments.
+
+    Segments are TIMESHIFT_SEGMENT_SECONDS long and named after the time they
+    start. Once the ring holds enough segments to cover its length, the
+    oldest is deleted for every new one, so disk use stays constant. Start
+    times of finished segments are indexed in memory, in a deque bounded the
+    same way. Each start rebuilds the index from the files on disk and
+    deletes anything the ring no longer covers.
+    """
+
+    def __init__(self, station_id, configured_url, url, hours, codec_name, ffmpeg_path):
+        self.station_id = station_id
+        self.configured_url = configured_url
+        self.url = url
+        self.hours = hours
+        self.ffmpeg_path = ffmpeg_path
+        self.directory = get_ring_dir(station_id)
+        self.key = ('timeshift', station_id)
+        self.max_segments = math.ceil(hours * 3600 / Config.TIMESHIFT_SEGMENT_SECONDS)
+
+        # With the shared ingest, framed codecs arrive as broadcast and others as PCM
+        self.feed = get_feed(codec_name) if Config.SHARED_INGEST else None
+        if self.feed is PCM_FEED:
+            self.format = ENCODED_FORMAT
+        else:
+            self.format = COPY_FORMATS.get(codec_name, ENCODED_FORMAT)
+
+        self.process = None
+        self.stopped = False
+        self._lock = threading.Lock()
+        self._index = deque(maxlen=self.max_segments)
+
+    def start(self):
+        """Start the capture FFmpeg."""
+        self._scan()
+
+        if Config.SHARED_INGEST:
+            input_args = self.feed.input_args + ['-i', 'pipe:0']
+        else:
+            input_args = [
+                '-reconnect', '1',
+                '-reconnect_streamed', '1',
+                '-reconnect_delay_max', '30',
+                '-i', self.url
+            ]
+
+        cmd = [
+            self.ffmpeg_path,
+            '-y',
+            '-nostats',
+            '-v', 'error'
+        ] + input_args + ['-vn'] + self.format.encoding_args + [
+            '-f', 'segment',
+            '-segment_format', self.format.muxer,
+            '-segment_time', str(Config.TIMESHIFT_SEGMENT_SECONDS),
+            '-segment_list', 'pipe:1',
+            '-segment_list_type', 'flat',
+            '-strftime', '1',
+            os.path.join(self.directory, f'{SEGMENT_TIME_FORMAT}.{self.format.extension}')
+        ]
+
+        logger.info(f"Starting timeshift capture for station {self.station_id}")
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if Config.SHARED_INGEST else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        supervisor.watch(self.key, self.process, on_exit=self._exited, on_stdout=self._segment_finished)
+
+        if Config.SHARED_INGEST:
+            ingest_hub.attach(
+                self.url,
+                self.feed,
+                self.ffmpeg_path,
+                self.key,
+                self.process,
+                on_interrupt=lambda reason: logger.warning(f"Timeshift capture for station {self.station_id} interrupted: {reason}")
+            )
+
+    def stop(self):
+        """Stop capturing. The segments on disk are kept until the ring is removed."""
+        self.stopped = True
+        if Config.SHARED_INGEST:
+            ingest_hub.detach(self.key)
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+
+    def segments(self):
+        """
+        List the segments on disk, oldest first, including the one being written.
+
+        Returns:
+            list: Segment tuples of start time and path
+        """
+        with self._lock:
+            segments = list(self._index)
+
+        # The segment being written is not in the index until it is finished
+        newest = segments[-1].start if segments else None
+        for path in sorted(glob.glob(os.path.join(self.directory, f'*.{self.format.extension}'))):
+            start = self._parse_start(path)
+            if start is not None and (newest is None or start > newest):
+                segments.append(Segment(start, path))
+        return segments
+
+    def available_range(self):
+        """Return the earliest and latest time that can be extracted, or None."""
+        segments = self.segments()
+        if not segments:
+            return None
+        return segments[0].start, datetime.now()
+
+    def extract(self, start, end, output_file):
+        """
+        Copy a time window out of the ring into a new file without re-encoding.
+
+        Args:
+            start (datetime): Start of the window
+            end (datetime): End of the window
+            output_file (str): Path of the new file
+
+        Returns:
+            bool: True if the file was written
+        """
+        segments = self.segments()
+        selected = []
+        for index, segment in enumerate(segments):
+            segment_end = segments[index + 1].start if index + 1 < len(segments) else datetime.now()
+            if segment.start < end and segment_end > start:
+                selected.append(segment)
+
+        if not selected:
+            logger.error(f"Timeshift for station {self.station_id} holds nothing between {start} and {end}")
+            return False
+
+        inpoint = max(0, (start - selected[0].start).total_seconds())
+        outpoint = (end - selected[-1].start).total_seconds()
+        return concat_files([segment.path for segment in selected], output_file, self.ffmpeg_path, inpoint, outpoint)
+
+    def _scan(self):
+        """
+        Index the segments an earlier capture left on disk, and delete the
+        rest: files in another format or not named after a time, files whose
+        notification was missed, and segments older than the ring's length.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        oldest = datetime.now() - timedelta(hours=self.hours, seconds=Config.TIMESHIFT_SEGMENT_SECONDS)
+        extension = f'.{self.format.extension}'
+
+        segments = []
+        for path in glob.glob(os.path.join(self.directory, '*')):
+            start = self._parse_start(path)
+            if start is not None and start >= oldest and os.path.splitext(path)[1] == extension:
+                segments.append(Segment(start, path))
+            else:
+                self._delete(path)
+
+        segments.sort()
+        for segment in segments[:-self.max_segments]:
+            self._delete(segment.path)
+        with self._lock:
+            self._index = deque(segments[-self.max_segments:], maxlen=self.max_segments)
+
+    def _segment_finished(self, line):
+        path = line.decode('utf-8', errors='replace').strip()
+        if not path:
+            return
+        path = os.path.join(self.directory, os.path.basename(path))
+        start = self._parse_start(path)
+        if start is not None:
+            self._add_segment(Segment(start, path))
+
+    def _add_segment(self, segment):
+        with self._lock:
+            if len(self._index) == self._index.maxlen:
+                self._delete(self._index[0].path)
+            self._index.append(segment)
+
+    def _delete(self, path):
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError as e:
+            logger.error(f"Error deleting timeshift segment {path}: {str(e)}")
+
+    def _exited(self, key, returncode, stderr_output):
+        if self.stopped:
+            return
+        logger.warning(f"Timeshift capture for station {self.station_id} exited with code {returncode}, restarting in {RESTART_DELAY} seconds")
+        logger.error(f"FFmpeg error output for timeshift of station {self.station_id}: {stderr_output}")
+        if Config.SHARED_INGEST:
+            ingest_hub.detach(self.key)
+        timer = threading.Timer(RESTART_DELAY, self._restart)
+        timer.daemon = True
+        timer.start()
+
+    def _restart(self):
+        if not self.stopped:
+            try:
+                self.start()
+            except Exception as e:
+                logger.error(f"Error restarting timeshift capture for station {self.station_id}: {str(e)}")
+
+    @staticmethod
+    def _parse_start(path):
+        try:
+            return datetime.strptime(os.path.splitext(os.path.basename(path))[0], SEGMENT_TIME_FORMAT)
+        except ValueError:
+            return None
+
+
+class TimeshiftManager:
+    """Keep a ring running for every station with continuous capture enabled."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rings = {}
+
+    def sync(self, session):
+        """Start and stop rings to match the stations' settings."""
+        from utils.recorder import get_ffmpeg_path, get_station_probe
+        from utils.resolver import stream_resolver
+
+        stations = session.query(RadioStation).all()
+        wanted = {station.id: station for station in stations if station.continuous_capture}
+
+        with self._lock:
+            for station_id in list(self._rings):
+                ring = self._rings[station_id]
+                station = wanted.get(station_id)
+                if station is None:
+                    # Continuous capture was turned off, so its audio goes too
+                    ring.stop()
+                    shutil.rmtree(ring.directory, ignore_errors=True)
+                    del self._rings[station_id]
+                elif station.url != ring.configured_url or self._hours(station) != ring.hours:
+                    ring.stop()
+                    del self._rings[station_id]
+
+            for station_id, station in wanted.items():
+                if station_id in self._rings:
+                    continue
+                try:
+                    ffmpeg_path = get_ffmpeg_path(session)
+                    url = stream_resolver.resolve(station.id, station.url)
+                    probe = get_station_probe(session, station.id, url, ffmpeg_path)
+                    ring = TimeshiftRing(
+                        station.id,
+                        station.url,
+                        url,
+                        self._hours(station),
+                        probe.codec_name if probe else None,
+                        ffmpeg_path
+                    )
+                    ring.start()
+                    self._rings[station_id] = ring
+                except Exception as e:
+                    logger.error(f"Error starting timeshift for station {station_id}: {str(e)}")
+
+    def get(self, station_id):
+        """Return a station's running ring, or None."""
+        with self._lock:
+            return self._rings.get(station_id)
+
+    def stop_all(self):
+        """Stop every ring, keeping its segments for the process that starts it next."""
+        with self._lock:
+            for ring in self._rings.values():
+                ring.stop()
+            self._rings.clear()
+
+    @staticmethod
+    def _hours(station):
+        return station.timeshift_hours or Config.TIMESHIFT_DEFAULT_HOURS
+
+
+# Process-wide timeshift rings
+timeshift_manager = TimeshiftManager()
+
+
+def sync_timeshift():
+    """Start and stop rings to match the stations' settings; run by the scheduler leader."""
+    # Import app at function level to avoid circular imports
+    from app import app
+    from utils.db import get_db_session
+
+    with app.app_context():
+        session = get_db_session()
+        try:
+            timeshift_manager.sync(session)
+        except Exception as e:
+            logger.error(f"Error syncing timeshift rings: {str(e)}")
+        finally:
+            session.close()